@@ -0,0 +1,72 @@
+"""Helpers shared by the benchmarks.
+
+The benchmarks are run from the root of the repository (they need a config.ini like the API), e.g.
+    $ python -m benchmarks.keyword_search
+"""
+import time
+import random
+import statistics
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List
+
+from tortoise import Tortoise
+
+from mnemeapi import crud
+from mnemeapi.models import User, Journal, Entry, Keyword
+
+
+async def init_db(db_url: str = "sqlite://:memory:") -> None:
+    await Tortoise.init(
+        db_url=db_url,
+        modules={"models": ["mnemeapi.models.models"]}
+    )
+    await Tortoise.generate_schemas()
+    await crud.create_short_index()
+
+
+async def seed_user(username: str, journals: int, entries_per_journal: int, keywords_per_entry: int,
+                    vocabulary: int = 500, long_length: int = 300, seed: int = 0) -> User:
+    """Create a user with a synthetic set of journals, entries and keywords"""
+    rnd = random.Random(seed)
+    words = [f"word{i}" for i in range(vocabulary)]
+    text = " ".join(rnd.choice(words) for _ in range(long_length // 6))
+    start = datetime(2015, 1, 1)
+
+    user = await User.create(username=username, hashed_password="-")
+    for j in range(journals):
+        name = f"journal {j}"
+        jrnl = await Journal.create(user_id=user.id, name=name, name_lower=name)
+
+        await Entry.bulk_create([
+            Entry(journal_id=jrnl.id, short=f"entry {j}-{i}", long=text, date=start + timedelta(hours=i))
+            for i in range(entries_per_journal)
+        ])
+        entry_ids = await Entry.filter(journal_id=jrnl.id).values_list("id", flat=True)
+        await Keyword.bulk_create([
+            Keyword(entry_id=entry_id, word=word)
+            for entry_id in entry_ids
+            for word in rnd.sample(words, keywords_per_entry)
+        ])
+
+    return user
+
+
+async def measure(func: Callable[[], Awaitable], repeat: int = 20) -> Dict[str, float]:
+    """Await `func` `repeat` times and return the timings in milliseconds"""
+    timings: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await func()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    return {
+        "min": timings[0],
+        "median": statistics.median(timings),
+        "p95": timings[min(int(len(timings) * 0.95), len(timings) - 1)],
+    }
+
+
+def report(name: str, timings: Dict[str, float], extra: str = "") -> None:
+    print(f"{name:<40} min {timings['min']:9.2f}ms  median {timings['median']:9.2f}ms  "
+          f"p95 {timings['p95']:9.2f}ms  {extra}")
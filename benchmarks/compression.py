@@ -0,0 +1,125 @@
+"""How much the compression middleware saves on GET /journals for mobile clients.
+
+For journal listings of a few sizes (made like the API does with the fast serializer) it measures, for every encoding
+that's installed and a few levels: how big the response gets, how long the middleware takes to compress it and the
+client to decompress it. From those it estimates how long the response takes to arrive on a few mobile networks,
+as one round trip plus the time to send the bytes (without TCP slow start, so it's optimistic for big responses).
+
+    $ python -m benchmarks.compression --entries 100 1000 10000
+"""
+import gzip
+import time
+import random
+import asyncio
+import argparse
+from typing import Callable, Dict, List, Optional, Tuple
+
+from tortoise import Tortoise
+from starlette.responses import Response
+
+from mnemeapi import crud
+from mnemeapi.compression import CompressionMiddleware, COMPRESSORS, brotli, zstandard
+from mnemeapi.serialization import dumps
+
+from .common import init_db, seed_user, measure
+
+# name, bits per second down, round trip in seconds
+NETWORKS = [
+    ("slow 3g", 400_000, 0.4),
+    ("fast 3g", 1_600_000, 0.15),
+    ("4g", 12_000_000, 0.07),
+]
+
+
+def decompressor(encoding: Optional[str]) -> Callable[[bytes], bytes]:
+    if encoding == "gzip":
+        return gzip.decompress
+    if encoding == "br":
+        return brotli.decompress
+    if encoding == "zstd":
+        return zstandard.ZstdDecompressor().decompressobj().decompress
+    return lambda body: body
+
+
+async def compress(body: bytes, encoding: Optional[str], level: int) -> bytes:
+    """The body the middleware sends for a response with `body` to a client that accepts `encoding`"""
+    async def app(scope, receive, send):
+        await Response(body, media_type="application/json")(scope, receive, send)
+
+    sent = []
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            sent.append(message["body"])
+
+    async def receive():
+        return {"type": "http.request"}
+
+    scope = {"type": "http", "method": "GET", "path": "/journals",
+             "headers": [(b"accept-encoding", (encoding or "identity").encode())]}
+    middleware = CompressionMiddleware(app, encodings=[encoding or "identity"], minimum_size=0, level=level)
+    await middleware(scope, receive, send)
+    return b"".join(sent)
+
+
+async def run(body: bytes, cases: List[Tuple[Optional[str], int]], repeat: int) -> None:
+    print(f"\n{len(body) / 1024:.1f}KiB of JSON")
+    print(f"{'encoding':<10} {'size':>10} {'ratio':>6} {'compress':>10} {'decompress':>11}  "
+          + "  ".join(f"{name:>9}" for name, _, _ in NETWORKS))
+
+    for encoding, level in cases:
+        compressed = await compress(body, encoding, level)
+        assert decompressor(encoding)(compressed) == body
+
+        timings = await measure(lambda: compress(body, encoding, level), repeat)  # pylint: disable=cell-var-from-loop
+        start = time.perf_counter()
+        for _ in range(repeat):
+            decompressor(encoding)(compressed)
+        decompress_ms = (time.perf_counter() - start) * 1000 / repeat
+
+        latencies = [
+            rtt * 1000 + timings["median"] + len(compressed) * 8 / bandwidth * 1000 + decompress_ms
+            for _, bandwidth, rtt in NETWORKS
+        ]
+        name = "none" if encoding is None else f"{encoding} {level}"
+        print(f"{name:<10} {len(compressed) / 1024:>8.1f}Ki {len(body) / len(compressed):>6.1f} "
+              f"{timings['median']:>8.2f}ms {decompress_ms:>9.2f}ms  "
+              + "  ".join(f"{latency:>7.0f}ms" for latency in latencies))
+
+
+async def main(args):
+    await init_db(args.db_url)
+    cases: List[Tuple[Optional[str], int]] = [(None, 0)] + [("gzip", level) for level in (1, 6, 9)]
+    if "br" in COMPRESSORS:
+        cases += [("br", level) for level in (4, 6, 11)]
+    if "zstd" in COMPRESSORS:
+        cases += [("zstd", level) for level in (1, 6, 19)]
+
+    rnd = random.Random(0)
+    words = [f"word{i}" for i in range(args.vocabulary)]
+    bodies: Dict[int, bytes] = {}
+    for number, entries in enumerate(args.entries):
+        user = await seed_user(f"bench {number}", 1, entries, args.keywords, vocabulary=args.vocabulary,
+                               seed=number)
+        jrnls = await crud.get_journal_dicts(user.id)
+        # seed_user gives every entry the same text, that would compress far better than real entries
+        for entry in jrnls[0]["entries"]:
+            entry["long"] = " ".join(rnd.choice(words) for _ in range(args.long // 6))
+        bodies[entries] = dumps(jrnls)
+
+    for entries, body in bodies.items():
+        print(f"\n{entries} entries", end="")
+        await run(body, cases, args.repeat)
+
+    await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-url", default="sqlite://:memory:")
+    parser.add_argument("--entries", type=int, nargs="+", default=[100, 1000, 10000], help="Entries in the journal")
+    parser.add_argument("--keywords", type=int, default=3, help="Keywords of every entry")
+    parser.add_argument("--long", type=int, default=300, help="Characters in the long text of every entry")
+    parser.add_argument("--vocabulary", type=int, default=2000, help="Different words in the texts")
+    parser.add_argument("--repeat", type=int, default=10)
+    asyncio.get_event_loop().run_until_complete(main(parser.parse_args()))
@@ -0,0 +1,107 @@
+"""Read and write throughput with readers and writers running at the same time, on a database file with:
+
+- rollback: the old rollback journal and synchronous=FULL, one connection for everything
+- tuned: the pragmas from the config (WAL, synchronous=NORMAL, mmap, cache size, busy timeout), one connection
+- tuned + read pool: the same with the reads going to the read only connections like GET requests do
+
+The readers run full text searches (like GET /search) that match every entry, so most of their time is
+spent in sqlite rather than in python. Then the same again while a backup of the database is running.
+
+    $ python -m benchmarks.concurrency --readers 16 --writers 2 --seconds 5
+"""
+import time
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+from datetime import datetime
+from urllib.parse import urlencode
+
+import aiosqlite
+from tortoise import Tortoise
+
+from mnemeapi import crud, schemas, config
+from mnemeapi.models import User, Entry
+from mnemeapi.read_pool import ReadPool
+
+from .common import init_db, seed_user
+
+ROLLBACK = {"journal_mode": "DELETE", "synchronous": "FULL"}
+
+
+async def run(label: str, db_file: Path, pragmas: dict, pool_size: int, args, backup: bool = False) -> None:
+    await init_db(f"sqlite://{db_file}?{urlencode(pragmas)}")
+    user = await User.get(username="bench")
+    jrnl = await crud.get_jrnl_by_name(user.id, "journal 0", entries=False)
+    # All the entries have the same text
+    word = (await Entry.first()).long.split()[0]
+    pool = ReadPool()
+    await pool.open(pool_size)
+
+    counts = {"reads": 0, "writes": 0}
+    latencies = []
+    deadline = time.perf_counter() + args.seconds
+
+    async def reader():
+        with pool.reading():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                await crud.search_entries(user.id, word, limit=20)
+                latencies.append(time.perf_counter() - start)
+                counts["reads"] += 1
+
+    async def writer(number: int):
+        i = 0
+        while time.perf_counter() < deadline:
+            entry = schemas.EntryCreate(short=f"new {label} {number}-{i}", long="text " * 50,
+                                        date=datetime(2020, 1, 1).isoformat(), keywords=[{"word": "word1"}])
+            await crud.create_entry(entry, jrnl.id)
+            counts["writes"] += 1
+            i += 1
+
+    async def backups():
+        # crud.backup holds the connection for as long as it takes
+        while time.perf_counter() < deadline:
+            async with aiosqlite.connect(str(db_file.with_suffix(".backup"))) as dest:
+                async with Tortoise.get_connection("default").acquire_connection() as conn:
+                    await conn.backup(target=dest, pages=5)
+
+    tasks = [reader() for _ in range(args.readers)] + [writer(n) for n in range(args.writers)]
+    if backup:
+        tasks.append(backups())
+    await asyncio.gather(*tasks)
+    await pool.close()
+    await Tortoise.close_connections()
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0
+    print(f"{label:<40} {counts['reads'] / args.seconds:8.1f} reads/s (p95 {p95:7.1f}ms)  "
+          f"{counts['writes'] / args.seconds:8.1f} writes/s")
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        db_file = Path(directory) / "bench.db"
+        await init_db(f"sqlite://{db_file}")
+        print(f"Seeding {args.journals * args.entries} entries...")
+        await seed_user("bench", args.journals, args.entries, 5, vocabulary=200)
+        await crud.create_search_index()
+        await Tortoise.close_connections()
+
+        for backup in (False, True):
+            during = " during backups" if backup else ""
+            await run(f"rollback{during}", db_file, ROLLBACK, 0, args, backup)
+            await run(f"tuned{during}", db_file, config.sqlite_pragmas, 0, args, backup)
+            await run(f"tuned + read pool of {args.pool}{during}", db_file, config.sqlite_pragmas, args.pool, args,
+                      backup)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--journals", type=int, default=5)
+    parser.add_argument("--entries", type=int, default=2000, help="Entries per journal")
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--pool", type=int, default=4, help="Read only connections")
+    parser.add_argument("--seconds", type=float, default=5)
+    asyncio.get_event_loop().run_until_complete(main(parser.parse_args()))
@@ -0,0 +1,100 @@
+"""Compare the keyword search of crud.get_entries against the old implementation that filtered in python.
+
+    $ python -m benchmarks.keyword_search --journals 20 --entries 2500
+"""
+import asyncio
+import argparse
+from typing import List
+
+from tortoise import Tortoise
+from tortoise.query_utils import Q
+
+from mnemeapi import crud, schemas
+from mnemeapi.models import Entry
+
+from .common import init_db, seed_user, measure, report
+
+
+async def legacy_get_entries(user_id, params: schemas.Params, keywords: List[str]) -> List[Entry]:
+    """get_entries before the keyword matching was done in SQL"""
+    query = Entry.filter(journal__user_id=user_id, deleted_on=None)
+
+    if params.method.lower() == "or":
+        query = query.prefetch_related("keywords")
+        query = query.filter(Q(keywords__word__in=keywords))
+        entries_to_return = await query.all().offset(params.skip).limit(params.limit)
+    else:
+        entries = await query.all().offset(params.skip).limit(params.limit)
+        await Entry.fetch_for_list(entries, "keywords")
+        entries_to_return = list()
+        for entry in entries:
+            words = [w.word.lower() for w in entry.keywords]
+            if all(kw.lower() in words for kw in keywords):
+                entries_to_return.append(entry)
+
+    return entries_to_return
+
+
+async def legacy_full_page(user_id, params: schemas.Params, keywords: List[str]) -> List[Entry]:
+    """What a client had to do with the old "and" search to fill a page: keep asking for the next page"""
+    found: List[Entry] = []
+    total = await Entry.filter(journal__user_id=user_id, deleted_on=None).count()
+    skip = 0
+    while len(found) < params.limit and skip < total:
+        page = schemas.Params(method=params.method, skip=skip, limit=params.limit)
+        found.extend(await legacy_get_entries(user_id, page, keywords))
+        skip += params.limit
+
+    return found[:params.limit]
+
+
+async def main(args):
+    await init_db(args.db_url)
+    print(f"Seeding {args.journals * args.entries} entries with {args.keywords} keywords each...")
+    user = await seed_user("bench", args.journals, args.entries, args.keywords, vocabulary=args.vocabulary)
+
+    cases = [
+        ("or", ["word1", "word2"]),
+        ("and", ["word1", "word2"]),
+        ("and", ["word1", "word2", "word3"]),
+    ]
+    for method, keywords in cases:
+        for skip in (0, args.limit * 5):
+            params = schemas.Params(method=method, skip=skip, limit=args.limit)
+
+            async def legacy():
+                return await legacy_get_entries(user.id, params, keywords)
+
+            async def sql():
+                return await crud.get_entries(user.id, params, keywords, None, None, None)
+
+            label = f"{method} {'+'.join(keywords)} skip={skip}"
+            legacy_rows = await legacy()
+            sql_rows = await sql()
+            report(f"legacy {label}", await measure(legacy, args.repeat),
+                   f"{len(legacy_rows)} rows, {len(legacy_rows) - len({e.id for e in legacy_rows})} duplicates")
+            report(f"sql    {label}", await measure(sql, args.repeat), f"{len(sql_rows)} rows")
+
+        if method == "and":
+            params = schemas.Params(method=method, limit=args.limit)
+
+            async def legacy_paged():
+                return await legacy_full_page(user.id, params, keywords)
+
+            rows = await legacy_paged()
+            report(f"legacy {method} {'+'.join(keywords)} full page", await measure(legacy_paged, 1),
+                   f"{len(rows)} rows")
+
+    await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-url", default="sqlite://:memory:")
+    parser.add_argument("--journals", type=int, default=20)
+    parser.add_argument("--entries", type=int, default=2500, help="Entries per journal")
+    parser.add_argument("--keywords", type=int, default=5, help="Keywords per entry")
+    parser.add_argument("--vocabulary", type=int, default=200, help="How many different keywords there are")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=10)
+    asyncio.get_event_loop().run_until_complete(main(parser.parse_args()))
@@ -0,0 +1,69 @@
+"""Compare crud.update_keywords against the old implementation that deleted every keyword of the entry and
+inserted them back one at a time, for entries with many keywords where only some of them change.
+
+Each round either adds `--changed` keywords to the entry or takes them away again, like a client editing it.
+By default it runs on a database file with the pragmas from the config, since every write goes to disk.
+
+    $ python -m benchmarks.keyword_update --keywords 10 50 200 --changed 2
+"""
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+from urllib.parse import urlencode
+from typing import List
+
+from tortoise import Tortoise
+
+from mnemeapi import crud, config, schemas
+from mnemeapi.models import Entry, Keyword
+from mnemeapi.profiling import count_queries
+
+from .common import init_db, seed_user, measure, report
+
+
+async def legacy_update_keywords(new_keywords: List[schemas.KeywordCreate], entry_id: int) -> None:
+    """update_keywords before it only changed what was different"""
+    await Keyword.filter(entry_id=entry_id).delete()
+    _ = [await Keyword(word=kw.word.lower(), entry_id=entry_id).save() for kw in new_keywords]
+
+
+async def run(entry_id: int, keywords: int, changed: int, repeat: int) -> None:
+    words = [schemas.KeywordCreate(word=f"word{i}") for i in range(keywords)]
+    edited = words + [schemas.KeywordCreate(word=f"new{i}") for i in range(changed)]
+
+    for name, update in (("legacy", legacy_update_keywords), ("diff", crud.update_keywords)):
+        await update(words, entry_id)
+        rounds = {"n": 0}
+
+        async def edit():
+            rounds["n"] += 1
+            await update(edited if rounds["n"] % 2 else words, entry_id)
+
+        with count_queries() as queries:
+            await edit()
+        await edit()
+        report(f"{name:<6} {keywords} keywords, {changed} changed", await measure(edit, repeat),
+               f"{len(queries)} queries")
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        db_url = args.db_url or f"sqlite://{Path(directory) / 'bench.db'}?{urlencode(config.sqlite_pragmas)}"
+        await init_db(db_url)
+        await seed_user("bench", 1, 1, 0)
+        entry_id = (await Entry.first()).id
+
+        for keywords in args.keywords:
+            await run(entry_id, keywords, args.changed, args.repeat)
+
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-url", help="Instead of a temporary database file")
+    parser.add_argument("--keywords", type=int, nargs="+", default=[10, 50, 200], help="Keywords of the entry")
+    parser.add_argument("--changed", type=int, default=2, help="Keywords added or removed in every edit")
+    parser.add_argument("--repeat", type=int, default=50)
+    asyncio.get_event_loop().run_until_complete(main(parser.parse_args()))
@@ -0,0 +1,94 @@
+"""Compare the two serializers (the `serializer` config key) on a big account: `pydantic`, where FastAPI validates the
+ORM objects against the response models, and `fast`, plain dicts from .values() turned into JSON directly.
+
+For GET /journals and GET /journals/entries it reports the time to make the JSON and the peak memory doing it.
+The JSON is the same both ways, it's checked before measuring. orjson is used by `fast` if it's installed.
+
+    $ python -m benchmarks.serialization --journals 10 --entries 5000
+"""
+import json
+import asyncio
+import argparse
+import tracemalloc
+from typing import Any, Awaitable, Callable, List
+
+from tortoise import Tortoise
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from starlette.responses import JSONResponse
+
+from mnemeapi import crud, schemas
+from mnemeapi.serialization import dumps, orjson
+
+from .common import init_db, seed_user, measure, report
+
+
+async def through_models(response_model: Any, content: Any) -> bytes:
+    """What FastAPI does with what an endpoint returns when it has a response_model"""
+    field = create_response_field(name="Response", type_=response_model)
+    return JSONResponse(await serialize_response(field=field, response_content=content)).body
+
+
+async def peak_memory(func: Callable[[], Awaitable]) -> float:
+    """In MiB, of everything `func` allocates including the rows it loads"""
+    tracemalloc.start()
+    try:
+        await func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+async def compare(name: str, count: int, paths: List[Callable[[], Awaitable[bytes]]], repeat: int) -> None:
+    pydantic, fast = paths
+    assert json.loads(await pydantic()) == json.loads(await fast()), "The serializers don't give the same JSON"
+
+    for path_name, path in (("pydantic", pydantic), ("fast", fast)):
+        timings = await measure(path, repeat)
+        throughput = count / (timings["median"] / 1000)
+        report(f"{name} {path_name}", timings,
+               f"{throughput:10.0f} entries/s  peak {await peak_memory(path):7.1f}MiB")
+
+
+async def main(args):
+    await init_db(args.db_url)
+    total = args.journals * args.entries
+    print(f"Seeding {total} entries with {args.keywords} keywords each...")
+    user = await seed_user("bench", args.journals, args.entries, args.keywords, vocabulary=args.vocabulary)
+    print(f"JSON with {'orjson' if orjson is not None else 'the json module'}")
+
+    async def journals_pydantic():
+        return await through_models(List[schemas.Journal], await crud.get_journals_for(user, limit=args.journals))
+
+    async def journals_fast():
+        return dumps(await crud.get_journal_dicts(user.id, limit=args.journals))
+
+    await compare("/journals", total, [journals_pydantic, journals_fast], args.repeat)
+
+    params = schemas.Params(method="or", skip=0, limit=args.limit)
+    words = ["word1", "word2", "word3"]
+
+    async def entries_pydantic():
+        entries = await crud.get_entries(user.id, params, words, None, None, None)
+        return await through_models(List[schemas.Entry], entries)
+
+    async def entries_fast():
+        return dumps(await crud.get_entry_dicts(await crud.find_entry_ids(user.id, params, words, None, None, None)))
+
+    found = len(await crud.find_entry_ids(user.id, params, words, None, None, None))
+    await compare("/journals/entries", found, [entries_pydantic, entries_fast], args.repeat)
+
+    await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-url", default="sqlite://:memory:")
+    parser.add_argument("--journals", type=int, default=10)
+    parser.add_argument("--entries", type=int, default=5000, help="Entries in every journal")
+    parser.add_argument("--keywords", type=int, default=3, help="Keywords of every entry")
+    parser.add_argument("--vocabulary", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=1000, help="Entries found by /journals/entries")
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.get_event_loop().run_until_complete(main(parser.parse_args()))
@@ -1,6 +1,3 @@
-from typing import Dict
-from asyncio import Queue
-
 from fastapi.security import HTTPBasic, OAuth2PasswordBearer
 from passlib.context import CryptContext
 
@@ -11,11 +8,49 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+from .cache import TTLCache  # pylint: disable=wrong-import-position
+from .hashing import PasswordHasher  # pylint: disable=wrong-import-position
+from .read_pool import ReadPool  # pylint: disable=wrong-import-position
+from .broker import Broker  # pylint: disable=wrong-import-position
+
+# JWT -> schemas.Principal, it's sized from the config once it's loaded
+principal_cache = TTLCache()
+# (url, ETag) -> the JSON of journals and entries, owned by the user so it can all be dropped when they change something
+response_cache = TTLCache()
+# Runs bcrypt off the event loop, the pool is also sized from the config
+password_hasher = PasswordHasher(pwd_context)
+# Read only sqlite connections for GET requests, opened on startup
+read_pool = ReadPool()
+# Sends the updates to every device of a user that is subscribed
+broker = Broker()
+
 from .classes import Configuration  # pylint: disable=wrong-import-position
 
 config = Configuration("config.ini")
 config.load()
 
-# user id -> Queue for pushing events to users
-queues: Dict[str, Queue] = {}
+principal_cache.maxsize = config.auth_cache_size
+principal_cache.ttl = config.auth_cache_ttl
+response_cache.maxsize = config.response_cache_size
+response_cache.ttl = config.response_cache_ttl
+response_cache.max_bytes = config.response_cache_memory * 1024 * 1024
+password_hasher.configure(config.password_workers, config.password_queue, config.password_processes)
+broker.configure(config.subscriber_queue, config.slow_subscribers)
+
+from .event_bus import create_event_bus  # pylint: disable=wrong-import-position
+
+# How the updates get to the broker of every worker and the changes to users to their auth cache, started on startup
+event_bus = create_event_bus(config.event_bus, broker, config.event_poll_interval, config.event_retention,
+                             config.replay_events, caches=(principal_cache,))
+
+from .subscribe_keys import create_key_store  # pylint: disable=wrong-import-position
+
+# The one time keys for /subscribe/, the expired ones are swept from startup
+sub_keys = create_key_store(config.subscribe_keys, config.subscribe_key_ttl, config.subscribe_key_limit)
+
+from .backup_storage import create_backup_storage  # pylint: disable=wrong-import-position
+
+# Where the compressed backups go
+backup_storage = create_backup_storage(config.backup_storage, config.backup_location)
+
 from .main import app  # pylint: disable=wrong-import-position
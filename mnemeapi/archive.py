@@ -0,0 +1,239 @@
+"""Backups the way they are kept in the backup storage: every file compressed on its own, and for every full backup
+and increment a manifest with the size and checksum of its files. The manifest is stored last, a backup without
+one never finished."""
+import json
+import time
+import zlib
+import asyncio
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+from contextlib import suppress
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Set, Tuple
+
+from .backup_storage import BackupStorage
+from .compression import zstandard
+from .crud.backups import BACKUPS_DIR, INCREMENTS_SUFFIX
+
+log = logging.getLogger("mnemeapi.backups")
+
+MANIFEST_SUFFIX = ".manifest.json"
+# The uncompressed sqlite backups that were kept in the backups directory as they were
+LEGACY_SUFFIX = ".db"
+# Compressed and hashed this much at a time, whatever the size of the backup
+CHUNK_SIZE = 1024 * 1024
+
+# Compression -> the extension of the files compressed with it, only the ones that are installed
+EXTENSIONS = {"gzip": ".gz", "none": ""}
+if zstandard is not None:
+    EXTENSIONS["zstd"] = ".zst"
+# What a corrupted file makes the decompressors raise
+DECOMPRESSION_ERRORS = (zlib.error,) if zstandard is None else (zlib.error, zstandard.ZstdError)
+
+
+def _compressor(compression: str, level: int) -> Any:
+    if compression == "gzip":
+        return zlib.compressobj(min(max(level, 1), 9), zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=min(max(level, 1), 22)).compressobj()
+    return None
+
+
+def _decompressor(compression: str) -> Any:
+    if compression == "gzip":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if compression == "zstd":
+        return zstandard.ZstdDecompressor().decompressobj()
+    return None
+
+
+class _Digest:
+    """The size and sha256 of what goes through it"""
+
+    def __init__(self):
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+
+    def update(self, data: bytes) -> bytes:
+        self.size += len(data)
+        self._sha256.update(data)
+        return data
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+
+def _pack(source: Path, target: Path, compression: str, level: int) -> Dict:
+    """Compress `source` into `target` a chunk at a time, returns the sizes and checksums of both"""
+    compressor = _compressor(compression, level)
+    original, stored = _Digest(), _Digest()
+    with source.open("rb") as reader, target.open("wb") as writer:
+        for chunk in iter(lambda: reader.read(CHUNK_SIZE), b""):
+            original.update(chunk)
+            writer.write(stored.update(compressor.compress(chunk) if compressor else chunk))
+        if compressor:
+            writer.write(stored.update(compressor.flush()))
+
+    return {"size": stored.size, "sha256": stored.sha256,
+            "original_size": original.size, "original_sha256": original.sha256}
+
+
+def _unpack(source: Path, target: Path, compression: str, file: Dict) -> None:
+    """Decompress `source` into `target`, checking both against the manifest"""
+    decompressor = _decompressor(compression)
+    original, stored = _Digest(), _Digest()
+    try:
+        with source.open("rb") as reader, target.open("wb") as writer:
+            for chunk in iter(lambda: reader.read(CHUNK_SIZE), b""):
+                stored.update(chunk)
+                writer.write(original.update(decompressor.decompress(chunk) if decompressor else chunk))
+            if decompressor:
+                writer.write(original.update(decompressor.flush()))
+    except DECOMPRESSION_ERRORS as e:
+        raise ValueError(f"{file['name']} is corrupted, it can't be decompressed") from e
+
+    if (stored.size, stored.sha256) != (file["size"], file["sha256"]):
+        raise ValueError(f"{file['name']} is corrupted, it isn't what was stored")
+    if (original.size, original.sha256) != (file["original_size"], file["original_sha256"]):
+        raise ValueError(f"{file['name']} doesn't decompress to what was backed up")
+
+
+async def _in_thread(func: Callable, *args) -> Any:
+    """Compressing and hashing a few GB takes a while, the requests carry on in the meantime"""
+    return await asyncio.get_event_loop().run_in_executor(None, func, *args)
+
+
+def _file_id(path: Path) -> Tuple[int, int]:
+    stat = path.stat()
+    return stat.st_dev, stat.st_ino
+
+
+async def store(storage: BackupStorage, path: Path, compression: str = "gzip", level: int = 6,
+                root: Path = BACKUPS_DIR) -> Dict:
+    """Compress the backup at `path` (a file, or a directory of them) from `root` into `storage` with its manifest.
+       The local copy is removed once all of it is stored. Returns the manifest."""
+    if compression not in EXTENSIONS:
+        log.warning("%s compression isn't available for backups, using gzip instead", compression)
+        compression = "gzip"
+
+    key = path.relative_to(root).with_suffix("").as_posix()
+    manifest: Dict[str, Any] = {"taken": int(time.time()), "compression": compression, "files": []}
+    if path.parent.suffix == INCREMENTS_SUFFIX:
+        manifest["snapshot"] = path.parent.stem
+
+    sources = sorted(source for source in path.rglob("*") if source.is_file()) if path.is_dir() else [path]
+    local = {source: _file_id(source) for source in sources}
+    for source in sources:
+        original = source.relative_to(root).as_posix()
+        packed = source.with_name(source.name + ".tmp")
+        name = original + EXTENSIONS[compression]
+        try:
+            file = await _in_thread(_pack, source, packed, compression, level)
+            await storage.put(name, packed)
+        finally:
+            # Gone already if it was stored
+            with suppress(FileNotFoundError):
+                packed.unlink()
+        manifest["files"].append({"name": name, "original": original, **file})
+
+    with tempfile.NamedTemporaryFile("w", dir=str(root), suffix=".tmp", delete=False) as file:
+        json.dump(manifest, file, indent=2)
+    try:
+        await storage.put(key + MANIFEST_SUFFIX, Path(file.name))
+    finally:
+        with suppress(FileNotFoundError):
+            Path(file.name).unlink()
+
+    # Until here the local copy is the only whole one. Uncompressed in a local storage in `root`, it's the stored one
+    for source in sources:
+        if _file_id(source) == local[source]:
+            source.unlink()
+    if path.is_dir() and not any(path.iterdir()):
+        path.rmdir()
+
+    return manifest
+
+
+async def _get_manifest(storage: BackupStorage, name: str, directory: Path) -> Dict:
+    local = directory / "manifest.tmp"
+    await storage.get(name, local)
+    try:
+        return json.loads(local.read_text(encoding="utf-8"))
+    finally:
+        local.unlink()
+
+
+async def _fetch_files(storage: BackupStorage, manifest: Dict, directory: Path) -> None:
+    for file in manifest["files"]:
+        target = directory / file["original"]
+        target.parent.mkdir(parents=True, exist_ok=True)
+        downloaded = target.with_name(target.name + ".tmp")
+        await storage.get(file["name"], downloaded)
+        try:
+            await _in_thread(_unpack, downloaded, target, manifest["compression"], file)
+        finally:
+            downloaded.unlink()
+
+
+async def fetch(storage: BackupStorage, key: str, directory: Path) -> Path:
+    """Download the full backup `key` (its unix time) and its increments into `directory`, checked and decompressed.
+       Returns where the backup is, with the increments next to it like crud.backup_increment leaves them."""
+    manifest = await _get_manifest(storage, key + MANIFEST_SUFFIX, directory)
+    await _fetch_files(storage, manifest, directory)
+
+    for name in await storage.list(f"{key}{INCREMENTS_SUFFIX}/"):
+        if name.endswith(MANIFEST_SUFFIX):
+            await _fetch_files(storage, await _get_manifest(storage, name, directory), directory)
+
+    files = manifest["files"]
+    return directory / (files[0]["original"] if len(files) == 1 else key)
+
+
+def retained(taken: Iterable[int], daily: int, weekly: int, monthly: int) -> Set[int]:
+    """Grandfather-father-son: the newest backup of each of the last `daily` days, `weekly` weeks and `monthly`
+       months that have one. The newest backup is always kept."""
+    newest_first = sorted(taken, reverse=True)
+    kept = set(newest_first[:1])
+    periods = [
+        (daily, lambda moment: moment.date()),
+        (weekly, lambda moment: moment.isocalendar()[:2]),
+        (monthly, lambda moment: (moment.year, moment.month)),
+    ]
+    for count, period in periods:
+        seen: List = []
+        for backup in newest_first:
+            current = period(datetime.fromtimestamp(backup))
+            if current in seen:
+                continue
+            if len(seen) == count:
+                break
+            seen.append(current)
+            kept.add(backup)
+
+    return kept
+
+
+async def apply_retention(storage: BackupStorage, daily: int, weekly: int, monthly: int) -> List[int]:
+    """Remove the full backups that aren't retained anymore, with their increments. Returns the ones removed.
+       The `{unix time}.db` backups from before there were manifests count as full backups too."""
+    names = await storage.list()
+    full = {
+        int(name[:-len(MANIFEST_SUFFIX)]) for name in names
+        if name.endswith(MANIFEST_SUFFIX) and name[:-len(MANIFEST_SUFFIX)].isdigit()
+    }
+    full.update(int(name[:-len(LEGACY_SUFFIX)]) for name in names
+                if name.endswith(LEGACY_SUFFIX) and name[:-len(LEGACY_SUFFIX)].isdigit())
+
+    removed = sorted(full - retained(full, daily, weekly, monthly))
+    for backup in removed:
+        # The manifest first, so a backup that's half removed doesn't look whole
+        manifest = f"{backup}{MANIFEST_SUFFIX}"
+        await storage.delete(manifest)
+        for name in names:
+            if name != manifest and name.split("/")[0].split(".")[0] == str(backup):
+                await storage.delete(name)
+
+    return removed
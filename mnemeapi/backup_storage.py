@@ -0,0 +1,114 @@
+import shutil
+import asyncio
+from abc import ABC, abstractmethod
+from pathlib import Path
+from functools import partial
+from contextlib import suppress
+from typing import Any, Callable, List
+
+try:
+    import boto3
+except ImportError:
+    boto3 = None  # pylint: disable=invalid-name
+
+
+async def _in_thread(func: Callable, *args, **kwargs) -> Any:
+    """Files and the network are slow, none of it should hold up the requests"""
+    return await asyncio.get_event_loop().run_in_executor(None, partial(func, *args, **kwargs))
+
+
+class BackupStorage(ABC):
+    """Where the backups are kept. Everything in it has a name that can have `/` in it, like a relative path."""
+
+    @abstractmethod
+    async def put(self, name: str, source: Path) -> None:
+        """Store the local file `source` as `name`, it's gone from where it was afterwards"""
+
+    @abstractmethod
+    async def get(self, name: str, target: Path) -> None:
+        """Download `name` to the local file `target`"""
+
+    @abstractmethod
+    async def list(self, prefix: str = "") -> List[str]:
+        """The names of everything that starts with `prefix`"""
+
+    @abstractmethod
+    async def delete(self, name: str) -> None:
+        """Remove `name`, it's not an error if it's already gone"""
+
+
+class LocalStorage(BackupStorage):
+    """A directory, it can be a disk or a network share mounted there"""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+
+    async def put(self, name: str, source: Path) -> None:
+        target = self.directory / name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Just a rename when it's on the same disk
+        await _in_thread(shutil.move, str(source), str(target))
+
+    async def get(self, name: str, target: Path) -> None:
+        await _in_thread(shutil.copyfile, str(self.directory / name), str(target))
+
+    async def list(self, prefix: str = "") -> List[str]:
+        def names():
+            if not self.directory.exists():
+                return []
+            found = (path.relative_to(self.directory).as_posix() for path in self.directory.rglob("*")
+                     if path.is_file())
+            return sorted(name for name in found if name.startswith(prefix))
+
+        return await _in_thread(names)
+
+    async def delete(self, name: str) -> None:
+        path = self.directory / name
+        with suppress(FileNotFoundError):
+            path.unlink()
+        # Along with the directories it leaves empty
+        with suppress(OSError):
+            while path.parent != self.directory:
+                path = path.parent
+                path.rmdir()
+
+
+class S3Storage(BackupStorage):
+    """A bucket in S3 or anything else that speaks its API, `location` is `s3://bucket/prefix`.
+       boto3 has to be installed, it gets the credentials from the usual places like the AWS_* environment variables."""
+
+    def __init__(self, location: str):
+        if boto3 is None:
+            raise RuntimeError("boto3 has to be installed to keep the backups in S3, `pip install boto3`")
+
+        self.bucket, _, prefix = location[len("s3://"):].partition("/")
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self._client = boto3.client("s3")
+
+    async def put(self, name: str, source: Path) -> None:
+        # In parts for the big ones
+        await _in_thread(self._client.upload_file, str(source), self.bucket, self.prefix + name)
+        source.unlink()
+
+    async def get(self, name: str, target: Path) -> None:
+        await _in_thread(self._client.download_file, self.bucket, self.prefix + name, str(target))
+
+    async def list(self, prefix: str = "") -> List[str]:
+        def names():
+            paginator = self._client.get_paginator("list_objects_v2")
+            pages = paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + prefix)
+            return sorted(item["Key"][len(self.prefix):] for page in pages for item in page.get("Contents", []))
+
+        return await _in_thread(names)
+
+    async def delete(self, name: str) -> None:
+        await _in_thread(self._client.delete_object, Bucket=self.bucket, Key=self.prefix + name)
+
+
+def create_backup_storage(kind: str, location: str) -> BackupStorage:
+    if kind == "local":
+        return LocalStorage(location)
+    elif kind == "s3":
+        return S3Storage(location)
+
+    raise ValueError(f"Unknown backup storage: {kind}")
@@ -0,0 +1,126 @@
+import asyncio
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Set, Union
+
+
+class Subscription:
+    """The updates waiting to be sent to one connected device"""
+
+    def __init__(self, user_id: str, max_size: int):
+        self.user_id = user_id
+        self.max_size = max_size
+        self.closed = False
+        # How many updates this device never got because it was too slow
+        self.dropped = 0
+
+        self._events: Deque[Dict] = deque()
+        self._ready = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def push(self, event: Dict) -> bool:
+        """Returns False if it's full"""
+        if len(self._events) >= self.max_size:
+            return False
+
+        self._events.append(event)
+        self._ready.set()
+        return True
+
+    def drop_oldest(self) -> None:
+        if self._events:
+            self._events.popleft()
+            self.dropped += 1
+
+    def close(self) -> None:
+        """The device won't get anything else, whoever is waiting in `get` gets None"""
+        self.closed = True
+        self._events.clear()
+        self._ready.set()
+
+    async def get(self) -> Optional[Dict]:
+        """Wait for the next update, None once the subscription is closed"""
+        while not self._events:
+            if self.closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+
+        return self._events.popleft()
+
+
+class Broker:
+    """Sends the updates of a user to every device they are subscribed with, each one has its own bounded queue.
+       When the queue of a device that doesn't keep up is full, depending on `policy` either its oldest update
+       is dropped to make room or it gets disconnected so it can subscribe again and fetch what it missed."""
+
+    DROP_OLDEST = "drop oldest"
+    DISCONNECT = "disconnect"
+
+    def __init__(self, max_queue: int = 100, policy: str = DROP_OLDEST):
+        self.max_queue = max_queue
+        self.policy = policy
+
+        # user id -> their subscriptions
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+
+        self.published = 0
+        self.dropped = 0
+        self.disconnected = 0
+
+    def configure(self, max_queue: int, policy: str) -> None:
+        if policy not in (self.DROP_OLDEST, self.DISCONNECT):
+            raise ValueError(f"Unknown policy for slow subscribers: {policy}")
+
+        self.max_queue = max_queue
+        self.policy = policy
+
+    def subscribe(self, user_id: Any) -> Subscription:
+        subscription = Subscription(str(user_id), self.max_queue)
+        self._subscriptions.setdefault(subscription.user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscription.close()
+        subscriptions = self._subscriptions.get(subscription.user_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.user_id]
+
+    def publish(self, user_id: Any, event: Dict) -> int:
+        """Queue the update for every device of the user, returns how many got it"""
+        self.published += 1
+        delivered = 0
+        for subscription in list(self._subscriptions.get(str(user_id), ())):
+            if not subscription.push(event):
+                if self.policy == self.DISCONNECT:
+                    self.unsubscribe(subscription)
+                    self.disconnected += 1
+                    continue
+
+                subscription.drop_oldest()
+                subscription.push(event)
+                self.dropped += 1
+
+            delivered += 1
+
+        return delivered
+
+    def subscribers(self, user_id: Any) -> int:
+        return len(self._subscriptions.get(str(user_id), ()))
+
+    def stats(self) -> Dict[str, Union[int, str]]:
+        depths = [len(subscription) for subscriptions in self._subscriptions.values() for subscription in subscriptions]
+        return {
+            "users": len(self._subscriptions),
+            "subscribers": len(depths),
+            "queued": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "max_queue": self.max_queue,
+            "policy": self.policy,
+            "published": self.published,
+            "dropped": self.dropped,
+            "disconnected": self.disconnected,
+        }
@@ -0,0 +1,124 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Set, Tuple
+
+
+class TTLCache:
+    """A bounded least recently used cache whose items also expire after `ttl` seconds.
+       Every item can have an owner (like a user id) so all the items of an owner can be dropped at once.
+       With `max_bytes` the items that are given a size can't add up to more than that, 0 is no limit."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60, max_bytes: int = 0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        # key -> (expires at, owner, value, size), the least recently used item is first
+        self._items: Dict[Hashable, Tuple[float, Optional[str], Any, int]] = OrderedDict()
+        # owner -> keys of the items it owns
+        self._owners: Dict[str, Set[Hashable]] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: Hashable) -> bool:
+        item = self._items.get(key)
+        return item is not None and item[0] > time.monotonic()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+
+        expires, _, value, _ = item
+        if expires <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return default
+
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, owner: Optional[Any] = None, ttl: Optional[float] = None,
+            size: int = 0) -> None:
+        """Add an item, `ttl` can only make it expire sooner than the default ttl of the cache.
+           One that is bigger than `max_bytes` by itself isn't kept at all."""
+        if self.maxsize <= 0 or (self.max_bytes and size > self.max_bytes):
+            return
+
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+
+        if key in self._items:
+            self._remove(key)
+
+        owner = None if owner is None else str(owner)
+        self._items[key] = (time.monotonic() + ttl, owner, value, size)
+        self.bytes += size
+        if owner is not None:
+            self._owners.setdefault(owner, set()).add(key)
+
+        while len(self._items) > self.maxsize or (self.max_bytes and self.bytes > self.max_bytes):
+            oldest = next(iter(self._items))
+            self._remove(oldest)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove an item and return it if it hasn't expired yet"""
+        item = self._items.get(key)
+        if item is None:
+            return default
+
+        self._remove(key)
+        expires, _, value, _ = item
+        return value if expires > time.monotonic() else default
+
+    def invalidate(self, owner: Any) -> int:
+        """Remove all the items that belong to `owner`, returns how many were removed"""
+        keys = self._owners.pop(str(owner), set())
+        for key in keys:
+            item = self._items.pop(key, None)
+            if item is not None:
+                self.bytes -= item[3]
+
+        return len(keys)
+
+    def sweep(self) -> int:
+        """Remove all the expired items, returns how many were removed"""
+        now = time.monotonic()
+        expired = [key for key, (expires, _, _, _) in self._items.items() if expires <= now]
+        for key in expired:
+            self._remove(key)
+
+        return len(expired)
+
+    def clear(self) -> None:
+        self._items.clear()
+        self._owners.clear()
+        self.bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._items),
+            "max_size": self.maxsize,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _remove(self, key: Hashable) -> None:
+        _, owner, _, size = self._items.pop(key)
+        self.bytes -= size
+        if owner is not None:
+            keys = self._owners.get(owner)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._owners[owner]
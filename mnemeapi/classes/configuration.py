@@ -1,4 +1,5 @@
-from typing import Optional
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlencode
 import configparser
 
 from mnemeapi.schemas import UserCreate
@@ -7,7 +8,7 @@ from mnemeapi.crud import create_user, get_user_by_username
 from . import Singleton
 from . import InstanceType
 
-class Configuration(metaclass=Singleton):
+class Configuration(metaclass=Singleton):  # pylint: disable=too-many-public-methods
     """A configuration singleton to hold things like the secret, if the server is public or not etc"""
 
     def __init__(self, file: str):
@@ -20,14 +21,213 @@ class Configuration(metaclass=Singleton):
         self._port: int = 8000
         self._db_url: str = "sqlite://./api/mneme.db"
         self._delete_after: int = 7
+        self._auth_cache_size: int = 1024
+        self._auth_cache_ttl: int = 60
+        self._response_cache_size: int = 1000
+        self._response_cache_ttl: int = 300
+        self._response_cache_memory: int = 100
+        self._serializer: str = "pydantic"
+        self._compression: List[str] = ["gzip"]
+        self._compression_min_size: int = 1000
+        self._compression_level: int = 6
+        self._password_workers: int = 2
+        self._password_queue: int = 64
+        self._password_processes: bool = False
+        self._max_import: int = 10000
+        self._backup_mode: str = "full"
+        self._backup_interval: float = 24
+        self._full_backup_interval: float = 168
+        self._backup_storage: str = "local"
+        self._backup_location: str = "./mnemeapi/backups"
+        self._backup_compression: str = "gzip"
+        self._backup_compression_level: int = 6
+        self._keep_daily_backups: int = 14
+        self._keep_weekly_backups: int = 4
+        self._keep_monthly_backups: int = 6
+        self._db_pool_min: int = 1
+        self._db_pool_max: int = 5
+        self._sqlite_pragmas: Dict[str, str] = {}
+        self._read_connections: int = 4
+        self._subscriber_queue: int = 100
+        self._slow_subscribers: str = "drop oldest"
+        self._event_bus: str = "memory"
+        self._event_poll_interval: float = 0.5
+        self._event_retention: int = 86400
+        self._replay_events: int = 100
+        self._heartbeat_interval: float = 15
+        self._subscribe_keys: str = "memory"
+        self._subscribe_key_ttl: int = 60
+        self._subscribe_key_limit: int = 10000
+        self._query_budget: int = 0
 
     @property
     def delete_after(self):
         return self._delete_after
 
+    @property
+    def auth_cache_size(self):
+        return self._auth_cache_size
+
+    @property
+    def auth_cache_ttl(self):
+        return self._auth_cache_ttl
+
+    @property
+    def response_cache_size(self):
+        return self._response_cache_size
+
+    @property
+    def response_cache_ttl(self):
+        return self._response_cache_ttl
+
+    @property
+    def response_cache_memory(self):
+        """In MB"""
+        return self._response_cache_memory
+
+    @property
+    def fast_serializer(self):
+        return self._serializer == "fast"
+
+    @property
+    def compression(self):
+        """The encodings responses can be compressed with, in order of preference"""
+        return self._compression
+
+    @property
+    def compression_min_size(self):
+        return self._compression_min_size
+
+    @property
+    def compression_level(self):
+        return self._compression_level
+
+    @property
+    def password_workers(self):
+        return self._password_workers
+
+    @property
+    def password_queue(self):
+        return self._password_queue
+
+    @property
+    def password_processes(self):
+        return self._password_processes
+
+    @property
+    def subscriber_queue(self):
+        return self._subscriber_queue
+
+    @property
+    def slow_subscribers(self):
+        return self._slow_subscribers
+
+    @property
+    def event_bus(self):
+        return self._event_bus
+
+    @property
+    def event_poll_interval(self):
+        return self._event_poll_interval
+
+    @property
+    def event_retention(self):
+        return self._event_retention
+
+    @property
+    def replay_events(self):
+        return self._replay_events
+
+    @property
+    def heartbeat_interval(self):
+        return self._heartbeat_interval
+
+    @property
+    def subscribe_keys(self):
+        return self._subscribe_keys
+
+    @property
+    def subscribe_key_ttl(self):
+        return self._subscribe_key_ttl
+
+    @property
+    def subscribe_key_limit(self):
+        return self._subscribe_key_limit
+
+    @property
+    def query_budget(self):
+        return self._query_budget
+
+    @property
+    def max_import(self):
+        return self._max_import
+
+    @property
+    def incremental_backups(self):
+        return self._backup_mode == "incremental"
+
+    @property
+    def backup_interval(self):
+        """In hours"""
+        return self._backup_interval
+
+    @property
+    def full_backup_interval(self):
+        """In hours, only for incremental backups"""
+        return self._full_backup_interval
+
+    @property
+    def backup_storage(self):
+        return self._backup_storage
+
+    @property
+    def backup_location(self):
+        return self._backup_location
+
+    @property
+    def backup_compression(self):
+        return self._backup_compression
+
+    @property
+    def backup_compression_level(self):
+        return self._backup_compression_level
+
+    @property
+    def keep_daily_backups(self):
+        return self._keep_daily_backups
+
+    @property
+    def keep_weekly_backups(self):
+        return self._keep_weekly_backups
+
+    @property
+    def keep_monthly_backups(self):
+        return self._keep_monthly_backups
+
     @property
     def db_url(self):
-        return self._db_url
+        """The url tortoise connects to, for PostgreSQL with the size of the connection pool added"""
+        url = self._db_url
+        if url.startswith("postgresql://"):
+            url = "postgres://" + url[len("postgresql://"):]
+        if url.startswith("postgres://"):
+            url += ("&" if "?" in url else "?") + f"minsize={self._db_pool_min}&maxsize={self._db_pool_max}"
+        elif url.startswith("sqlite://"):
+            # Pragmas that are already in the url win
+            in_url = parse_qs(url.partition("?")[2])
+            pragmas = {pragma: value for pragma, value in self._sqlite_pragmas.items() if pragma not in in_url}
+            if pragmas:
+                url += ("&" if "?" in url else "?") + urlencode(pragmas)
+
+        return url
+
+    @property
+    def sqlite_pragmas(self):
+        return self._sqlite_pragmas
+
+    @property
+    def read_connections(self):
+        return self._read_connections
 
     @property
     def secret(self):
@@ -45,7 +245,7 @@ class Configuration(metaclass=Singleton):
     def port(self):
         return self._port
 
-    def load(self):
+    def load(self):  # pylint: disable=too-many-statements
         """Read and loads the configuration from the file.
             If it is run for a second time while the app is running only the secret
             and if the instance is private, public or commercial will change."""
@@ -69,7 +269,54 @@ class Configuration(metaclass=Singleton):
             self._secret = secret
 
         self._db_url = app.get("db url")
+        self._db_pool_min = max(app.getint("db pool min", fallback=1), 1)
+        self._db_pool_max = max(app.getint("db pool max", fallback=5), self._db_pool_min)
+        self._sqlite_pragmas = {
+            "journal_mode": app.get("sqlite journal mode", "WAL"),
+            "synchronous": app.get("sqlite synchronous", "NORMAL"),
+            "mmap_size": str(app.getint("sqlite mmap size", fallback=268435456)),
+            "cache_size": str(app.getint("sqlite cache size", fallback=-16000)),
+            "busy_timeout": str(app.getint("sqlite busy timeout", fallback=5000)),
+        }
+        self._read_connections = max(app.getint("read connections", fallback=4), 0)
+        self._subscriber_queue = max(app.getint("subscriber queue", fallback=100), 1)
+        self._slow_subscribers = app.get("slow subscribers", "drop oldest")
+        self._event_bus = app.get("event bus", "memory")
+        self._event_poll_interval = max(app.getfloat("event poll interval", fallback=0.5), 0.05)
+        self._event_retention = max(app.getint("event retention", fallback=86400), 10)
+        self._replay_events = max(app.getint("replay events", fallback=100), 1)
+        self._heartbeat_interval = max(app.getfloat("heartbeat interval", fallback=15), 1)
+        self._subscribe_keys = app.get("subscribe keys", "memory")
+        self._subscribe_key_ttl = max(app.getint("subscribe key ttl", fallback=60), 1)
+        self._subscribe_key_limit = max(app.getint("subscribe key limit", fallback=10000), 1)
+        self._query_budget = max(app.getint("query budget", fallback=0), 0)
         self._delete_after = app.getint("delete after", fallback=7)
+        self._auth_cache_size = app.getint("auth cache size", fallback=1024)
+        self._auth_cache_ttl = app.getint("auth cache ttl", fallback=60)
+        self._response_cache_size = app.getint("response cache size", fallback=1000)
+        self._response_cache_ttl = app.getint("response cache ttl", fallback=300)
+        self._response_cache_memory = app.getint("response cache memory", fallback=100)
+        self._serializer = app.get("serializer", "pydantic")
+        self._compression = [
+            encoding.strip().lower() for encoding in app.get("compression", "gzip").split(",")
+            if encoding.strip().lower() not in ("", "none")
+        ]
+        self._compression_min_size = max(app.getint("compression min size", fallback=1000), 0)
+        self._compression_level = app.getint("compression level", fallback=6)
+        self._password_workers = max(app.getint("password workers", fallback=2), 1)
+        self._password_queue = max(app.getint("password queue", fallback=64), 0)
+        self._password_processes = app.get("password pool", "thread") == "process"
+        self._max_import = app.getint("max import", fallback=10000)
+        self._backup_mode = app.get("backup mode", "full")
+        self._backup_interval = max(app.getfloat("backup interval", fallback=24), 0.01)
+        self._full_backup_interval = max(app.getfloat("full backup interval", fallback=168), self._backup_interval)
+        self._backup_storage = app.get("backup storage", "local")
+        self._backup_location = app.get("backup location", "./mnemeapi/backups")
+        self._backup_compression = app.get("backup compression", "gzip").strip().lower()
+        self._backup_compression_level = app.getint("backup compression level", fallback=6)
+        self._keep_daily_backups = max(app.getint("keep daily backups", fallback=14), 0)
+        self._keep_weekly_backups = max(app.getint("keep weekly backups", fallback=4), 0)
+        self._keep_monthly_backups = max(app.getint("keep monthly backups", fallback=6), 0)
 
     async def create_user(self) -> bool:
         """Create the admin user from the config file if he doesn't exists.
@@ -0,0 +1,216 @@
+import zlib
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Sequence
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None  # pylint: disable=invalid-name
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # pylint: disable=invalid-name
+
+# Bigger bodies are compressed in a thread so they don't hold up the other requests
+THREAD_SIZE = 1024 * 1024
+# Anything else (like images or exports that are zipped already) is sent as it is
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson", "application/jsonl", "application/xml")
+
+
+class Compressor(ABC):
+    """Compresses a body in one go, or a chunk at a time for a streaming response"""
+
+    @abstractmethod
+    def chunk(self, data: bytes) -> bytes:
+        """Everything compressed so far, so the client can read the chunk as soon as it gets it"""
+
+    @abstractmethod
+    def finish(self, data: bytes = b"") -> bytes:
+        """The rest of the compressed body, nothing can be added after it"""
+
+
+class GzipCompressor(Compressor):
+    def __init__(self, level: int):
+        self._zlib = zlib.compressobj(min(max(level, 1), 9), zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._zlib.compress(data) + self._zlib.flush()
+
+
+class BrotliCompressor(Compressor):
+    def __init__(self, level: int):
+        self._brotli = brotli.Compressor(quality=min(max(level, 0), 11))
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._brotli.process(data) + self._brotli.flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._brotli.process(data) + self._brotli.finish()
+
+
+class ZstdCompressor(Compressor):
+    def __init__(self, level: int):
+        self._zstd = zstandard.ZstdCompressor(level=min(max(level, 1), 22)).compressobj()
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._zstd.compress(data) + self._zstd.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._zstd.compress(data) + self._zstd.flush()
+
+
+# Content-Encoding -> its compressor, only the ones that are installed
+COMPRESSORS = {"gzip": GzipCompressor}
+if brotli is not None:
+    COMPRESSORS["br"] = BrotliCompressor
+if zstandard is not None:
+    COMPRESSORS["zstd"] = ZstdCompressor
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """Accept-Encoding to encoding -> its q value"""
+    accepted = {}
+    for part in header.split(","):
+        name, *params = [value.strip() for value in part.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if name:
+            accepted[name.lower()] = quality
+
+    return accepted
+
+
+def choose_encoding(header: str, encodings: Sequence[str]) -> Optional[str]:
+    """The first of `encodings` the client takes, None to send it as it is"""
+    accepted = accepted_encodings(header)
+    for encoding in encodings:
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def compressible(headers: Headers, status: int) -> bool:
+    """Event streams never are, every event has to get to the client the moment it's sent"""
+    content_type = headers.get("content-type", "")
+    return status not in (204, 304) and "content-encoding" not in headers \
+        and content_type.startswith(COMPRESSIBLE_TYPES) and not content_type.startswith("text/event-stream")
+
+
+class CompressionMiddleware:
+    """Compresses the responses of the clients that accept one of `encodings` (in order of preference), if they are
+       at least `minimum_size` bytes. Streaming responses are compressed a chunk at a time as they are sent."""
+
+    def __init__(self, app, encodings: Sequence[str], minimum_size: int = 1000, level: int = 6):
+        self.app = app
+        self.encodings = [encoding for encoding in encodings if encoding in COMPRESSORS]
+        self.minimum_size = minimum_size
+        self.level = level
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = None
+        if scope["method"] != "HEAD":
+            encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+
+        await self.app(scope, receive, CompressingSend(send, encoding, self.minimum_size, self.level))
+
+
+class CompressingSend:
+    """The `send` of one response, holds on to its start until it knows if the body gets compressed.
+       With no `encoding` nothing is, the responses that could have been still get `Vary: Accept-Encoding`."""
+
+    def __init__(self, send, encoding: Optional[str], minimum_size: int, level: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.level = level
+
+        self.start: Optional[Dict] = None
+        self.compressor: Optional[Compressor] = None
+        self.passthrough = False
+
+    async def __call__(self, message: Dict) -> None:
+        if self.passthrough:
+            await self.send(message)
+        elif message["type"] == "http.response.start":
+            self._on_start(message)
+            if self.passthrough:
+                await self.send(message)
+        elif message["type"] == "http.response.body":
+            await self._on_body(message)
+        else:
+            await self.send(message)
+
+    def _on_start(self, message: Dict) -> None:
+        headers = MutableHeaders(raw=message["headers"])
+        if not compressible(headers, message["status"]):
+            self.passthrough = True
+            return
+
+        # Compressed or not, it depends on Accept-Encoding, so caches can't give it to a client that sent another one
+        headers.add_vary_header("Accept-Encoding")
+        length = headers.get("content-length")
+        if self.encoding is None or (length is not None and int(length) < self.minimum_size):
+            self.passthrough = True
+        else:
+            self.start = message
+
+    async def _on_body(self, message: Dict) -> None:
+        body, more_body = message.get("body", b""), message.get("more_body", False)
+
+        if self.compressor is None:
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self.send(self.start)
+                await self.send(message)
+                return
+
+            self.compressor = COMPRESSORS[self.encoding](self.level)
+            if not more_body:
+                body = await self._compress(body)
+            await self._send_start(None if more_body else len(body))
+            if not more_body:
+                await self.send({"type": "http.response.body", "body": body})
+                return
+
+        if more_body:
+            body = self.compressor.chunk(body)
+        else:
+            body = self.compressor.finish(body)
+        await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+    async def _compress(self, body: bytes) -> bytes:
+        if len(body) > THREAD_SIZE:
+            return await run_in_threadpool(self.compressor.finish, body)
+        return self.compressor.finish(body)
+
+    async def _send_start(self, length: Optional[int]) -> None:
+        headers = MutableHeaders(raw=self.start["headers"])
+        headers["Content-Encoding"] = self.encoding
+        if length is None:
+            # Streamed, how long it is will only be known at the end
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(length)
+
+        etag = headers.get("etag")
+        if etag is not None and not etag.startswith("W/"):
+            # It's not byte for byte what the ETag was made for any more, If-None-Match still works with it
+            headers["ETag"] = f"W/{etag}"
+
+        await self.send(self.start)
@@ -1,26 +1,15 @@
-import time
-from pathlib import Path
-
-import aiosqlite
-from tortoise import Tortoise
-
+from .migrations import migrate, create_short_index
+from .search import create_search_index, rebuild_search_index, purge_search_index, search_entries
 from .keywords import update_keywords
-from .entries import create_entry, get_entry_by_id, delete_entry, update_entry, get_entries, undelete_entry, \
-    get_entry_by_short
-from .journals import get_jrnl_by_id, get_jrnl_by_name, get_journals_for, create_journal, delete_journal, \
-    update_journal, undelete_journal
-from .users import get_user_by_id, get_user_by_username, get_users, create_user, delete_user, update_user, \
-    update_user_password
-
-
-async def backup() -> None:
-    """Backup the database"""
-    backups_dir = Path("./mnemeapi/backups")
-    backups_dir.mkdir(exist_ok=True)
-
-    now = int(time.time())
-    client = Tortoise.get_connection("default")
-
-    async with aiosqlite.connect(f"./mnemeapi/backups/{now}.db") as dest:
-        async with client.acquire_connection() as conn:
-            await conn.backup(target=dest, pages=5)
+from .entries import create_entry, create_entries, get_taken_shorts, get_entry_by_id, delete_entry, update_entry, \
+    get_entries, find_entry_ids, get_entries_page, undelete_entry, get_entry_by_short
+from .projections import get_journal_dicts, get_entry_dicts
+from .backups import backup, backup_increment, create_changelog, drop_changelog
+from .export import iter_journals, iter_entries
+from .sync import Position, get_changes, next_position
+from .subscribe_keys import add_subscribe_key, redeem_subscribe_key, purge_subscribe_keys, count_subscribe_keys
+from .outbox import add_to_outbox, get_outbox_after, get_user_events, has_event, get_last_outbox_id, purge_outbox
+from .journals import get_jrnl_by_id, get_jrnl_by_name, get_journals_for, get_journal_summaries, create_journal, \
+    delete_journal, update_journal, undelete_journal, touch_journals, get_journal_versions
+from .users import get_principal, get_user_by_id, get_user_by_username, get_users, create_user, delete_user, \
+    update_user, update_user_password
@@ -0,0 +1,195 @@
+# pylint: disable=protected-access
+import os
+import json
+import time
+import shutil
+import asyncio
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import aiosqlite
+from tortoise.transactions import in_transaction
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+from ..models import User, Journal, Entry, Keyword
+
+from .dialect import is_postgres
+
+log = logging.getLogger("mnemeapi.backups")
+
+BACKUPS_DIR = Path("./mnemeapi/backups")
+# For incremental backups in sqlite, triggers note here every row of the TRACKED tables that is added, changed or
+# deleted. An increment is the rows noted since the last increment as they are at that moment, so a snapshot with the
+# increments after it replayed in order is the database as it was at the last one. See mnemeapi.restore.
+CHANGELOG_TABLE = "backup_changelog"
+# Parents before their children, so replaying them in this order (and deleting in the opposite) works
+TRACKED = (User, Journal, Entry, Keyword)
+# The increments of the snapshot `{taken}.db` are in `{taken}.increments/`, named after the last change they have
+INCREMENTS_SUFFIX = ".increments"
+# How many rows are looked up with a single query
+CHUNK_SIZE = 500
+# Without WAL the copy locks the database, so it's done this many pages at a time and the API writes in between.
+# Anything written makes the copy start over, with WAL it's done in one go instead since writers don't wait for it.
+BACKUP_PAGES = 1024
+BACKUP_SLEEP = 0.05
+
+
+async def create_changelog() -> bool:
+    """Start noting the rows that change for incremental backups.
+       Returns False for PostgreSQL, that can archive its WAL for the same thing."""
+    client = User._meta.db
+    if is_postgres(client):
+        log.warning("Incremental backups only work with sqlite, full backups are taken instead. "
+                    "PostgreSQL can archive its WAL for that, see `archive_command`.")
+        return False
+
+    statements = [
+        f"CREATE TABLE IF NOT EXISTS {CHANGELOG_TABLE} "
+        f"(seq INTEGER PRIMARY KEY AUTOINCREMENT, tbl TEXT NOT NULL, row_id NOT NULL)"
+    ]
+    for model in TRACKED:
+        table, key = model._meta.db_table, model._meta.db_pk_column
+        for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            statements.append(
+                f'CREATE TRIGGER IF NOT EXISTS {CHANGELOG_TABLE}_{table}_{event.lower()} AFTER {event} ON "{table}" '
+                f"BEGIN INSERT INTO {CHANGELOG_TABLE} (tbl, row_id) VALUES ('{table}', {row}.\"{key}\"); END"
+            )
+    await client.execute_script(";\n".join(statements))
+    return True
+
+
+async def drop_changelog() -> None:
+    """Stop noting the rows that change, when backups aren't incremental anymore"""
+    client = User._meta.db
+    if is_postgres(client):
+        return
+
+    statements = [
+        f"DROP TRIGGER IF EXISTS {CHANGELOG_TABLE}_{model._meta.db_table}_{event}"
+        for model in TRACKED
+        for event in ("insert", "update", "delete")
+    ]
+    statements.append(f"DROP TABLE IF EXISTS {CHANGELOG_TABLE}")
+    await client.execute_script(";\n".join(statements))
+
+
+async def backup(backups_dir: Path = BACKUPS_DIR) -> Path:
+    """Backup the whole database, returns where it went.
+       Unless sqlite is in WAL mode it's copied BACKUP_PAGES at a time, so writers only wait for a step."""
+    backups_dir.mkdir(exist_ok=True)
+
+    now = int(time.time())
+    client = User._meta.db
+    if is_postgres(client):
+        return await _backup_postgres(client, backups_dir, now)
+
+    target = backups_dir / f"{now}.db"
+    async with aiosqlite.connect(str(target)) as dest:
+        if client.filename == ":memory:":
+            # The only connection there is, sleeping between steps would hold up every query
+            async with client.acquire_connection() as conn:
+                await conn.backup(target=dest)
+        else:
+            async with aiosqlite.connect(client.filename) as source:
+                async with source.execute("PRAGMA journal_mode") as cursor:
+                    (mode,) = await cursor.fetchone()
+                if mode.lower() == "wal":
+                    await source.backup(target=dest)
+                else:
+                    # `sleep` is only for when a step finds the database locked, this waits after every step
+                    await source.backup(target=dest, pages=BACKUP_PAGES, progress=_pause)
+    return target
+
+
+def _pause(_status: int, _remaining: int, _total: int) -> None:
+    """In the thread of the connection, not the event loop"""
+    time.sleep(BACKUP_SLEEP)
+
+
+async def backup_increment(snapshot: Path) -> Optional[Path]:
+    """Save the rows that changed since the last increment in the increments of `snapshot`.
+       Returns where it went, or None if nothing changed."""
+    client = User._meta.db
+    async with in_transaction(User._meta.default_connection) as conn:
+        # Everything from the same moment, so the rows are exactly how they were after the last change noted
+        _, rows = await conn.execute_query(f"SELECT MIN(seq) AS first, MAX(seq) AS last FROM {CHANGELOG_TABLE}")
+        first, last = rows[0]["first"], rows[0]["last"]
+        if last is None:
+            return None
+
+        _, rows = await conn.execute_query(
+            f"SELECT DISTINCT tbl, row_id FROM {CHANGELOG_TABLE} WHERE seq <= ?", [last]
+        )
+        changed: Dict[str, Set] = {}
+        for row in rows:
+            changed.setdefault(row["tbl"], set()).add(row["row_id"])
+
+        header = {"snapshot": snapshot.name, "first": first, "last": last, "taken": int(time.time())}
+        lines = [header] + await _changed_rows(conn, changed)
+
+    directory = snapshot.with_suffix(INCREMENTS_SUFFIX)
+    directory.mkdir(exist_ok=True)
+    target = directory / f"{last:012d}.jsonl"
+    await asyncio.get_event_loop().run_in_executor(None, _write_lines, target, lines)
+
+    await client.execute_query(f"DELETE FROM {CHANGELOG_TABLE} WHERE seq <= ?", [last])
+    return target
+
+
+async def _changed_rows(conn: BaseDBAsyncClient, changed: Dict[str, Set]) -> List[Dict]:
+    """The rows that changed of every table as they are now, then the ones that don't exist anymore"""
+    lines: List[Dict] = []
+    deleted: List[Dict] = []
+    for model in TRACKED:
+        table, key = model._meta.db_table, model._meta.db_pk_column
+        row_ids = list(changed.get(table, ()))
+        found = set()
+        for i in range(0, len(row_ids), CHUNK_SIZE):
+            chunk = row_ids[i:i + CHUNK_SIZE]
+            _, rows = await conn.execute_query(
+                f'SELECT * FROM "{table}" WHERE "{key}" IN ({", ".join("?" for _ in chunk)})', chunk
+            )
+            for row in rows:
+                lines.append({"table": table, "row": dict(row)})
+                found.add(row[key])
+
+        # Children go before their parents
+        deleted[:0] = [{"table": table, "deleted": {key: row_id}} for row_id in row_ids if row_id not in found]
+
+    return lines + deleted
+
+
+def _write_lines(target: Path, lines: List[Dict]) -> None:
+    """As a whole or not at all, a half written increment would break the chain"""
+    temporary = target.with_suffix(".tmp")
+    with temporary.open("w", encoding="utf-8") as file:
+        for line in lines:
+            file.write(json.dumps(line) + "\n")
+    os.replace(str(temporary), str(target))
+
+
+async def _backup_postgres(client: BaseDBAsyncClient, backups_dir: Path, now: int) -> Path:
+    """With pg_dump if it's installed, otherwise every table is copied to a csv file in a directory"""
+    if shutil.which("pg_dump"):
+        target = backups_dir / f"{now}.dump"
+        process = await asyncio.create_subprocess_exec(
+            "pg_dump", "--format=custom", f"--file={target}",
+            f"--host={client.host}", f"--port={client.port}", f"--username={client.user}", client.database,
+            # Not in the arguments where anyone could see it
+            env={**os.environ, "PGPASSWORD": client.password or ""},
+            stdin=asyncio.subprocess.DEVNULL
+        )
+        if await process.wait() != 0:
+            raise RuntimeError(f"pg_dump failed with exit code {process.returncode}")
+        return target
+
+    target = backups_dir / str(now)
+    target.mkdir()
+    async with client.acquire_connection() as conn:
+        # All the tables from the same snapshot
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            for model in TRACKED:
+                table = model._meta.db_table
+                await conn.copy_from_table(table, output=str(target / f"{table}.csv"), format="csv", header=True)
+    return target
@@ -0,0 +1,15 @@
+from itertools import count
+from typing import Iterator
+
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+
+def is_postgres(client: BaseDBAsyncClient) -> bool:
+    return client.capabilities.dialect == "postgres"
+
+
+def placeholders(client: BaseDBAsyncClient) -> Iterator[str]:
+    """The placeholders of the parameters of a raw query in order, `?` for sqlite and `$1`, `$2`... for postgres"""
+    if is_postgres(client):
+        return (f"${i}" for i in count(1))
+    return ("?" for _ in count(1))
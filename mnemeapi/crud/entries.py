@@ -1,12 +1,28 @@
-from typing import List, Optional
+from typing import Iterator, List, Optional, Set, Tuple
 from datetime import datetime, date
 
 from fastapi import HTTPException
+from tortoise.exceptions import IntegrityError
+from tortoise.functions import Count
 from tortoise.query_utils import Q
+from tortoise.transactions import in_transaction
 
 from .. import schemas
 from ..models.models import Entry, Keyword
 from . import update_keywords
+from .search import index_entries, unindex_entries
+from .journals import touch_journals
+
+# How many values go in a single `IN (...)`, well below the limit of variables in an sqlite query
+CHUNK_SIZE = 500
+
+# The unique index on the shorts of the entries that aren't deleted doesn't let another one in, see create_short_index
+DUPLICATE_SHORT = "This entry already exists in this journal"
+
+
+def _chunks(items: List, size: int = CHUNK_SIZE) -> Iterator[List]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
 
 
 async def create_entry(entry: schemas.EntryCreate, jrnl_id: int) -> Entry:
@@ -16,14 +32,84 @@ async def create_entry(entry: schemas.EntryCreate, jrnl_id: int) -> Entry:
         raise HTTPException(status_code=400, detail="Wrong date format.")
 
     new_entry = Entry(journal_id=jrnl_id, short=entry.short, long=entry.long, date=date_)
-    await new_entry.save()
-    for kw in entry.keywords:
-        await Keyword(entry_id=new_entry.id, word=kw.word.lower()).save()
+    try:
+        async with in_transaction(Entry._meta.default_connection):  # pylint: disable=protected-access
+            await new_entry.save()
+            for kw in entry.keywords:
+                await Keyword(entry_id=new_entry.id, word=kw.word.lower()).save()
+
+            await index_entries([new_entry])
+            await touch_journals([jrnl_id])
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail=DUPLICATE_SHORT)
 
     await new_entry.fetch_related("keywords")
     return new_entry
 
 
+async def create_entries(entries: List[schemas.EntryCreate], jrnl_id: int) -> List[int]:
+    """Create a lot of entries and their keywords at once, either all of them get created or none.
+       The shorts need to be checked beforehand, see get_taken_shorts. Returns the ids of the new entries."""
+    new_entries = []
+    for number, entry in enumerate(entries, start=1):
+        try:
+            date_ = datetime.fromisoformat(entry.date)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Wrong date format in entry {number}.")
+        new_entries.append(Entry(journal_id=jrnl_id, short=entry.short, long=entry.long, date=date_))
+
+    async with in_transaction(Entry._meta.default_connection):  # pylint: disable=protected-access
+        try:
+            await Entry.bulk_create(new_entries)
+        except IntegrityError:
+            # Someone else added one of them since they were checked
+            raise HTTPException(status_code=400, detail="Some of these entries already exist in this journal")
+
+        # bulk_create doesn't give back the ids, but the shorts are unique in the journal
+        ids = {}
+        for shorts in _chunks([entry.short for entry in new_entries]):
+            ids.update(await Entry.filter(journal_id=jrnl_id, deleted_on=None, short__in=shorts)
+                       .values_list("short", "id"))
+        for new_entry in new_entries:
+            new_entry.id = ids[new_entry.short]
+
+        keywords = [
+            Keyword(entry_id=new_entry.id, word=kw.word.lower())
+            for new_entry, entry in zip(new_entries, entries)
+            for kw in entry.keywords
+        ]
+        if keywords:
+            await Keyword.bulk_create(keywords)
+
+        await index_entries(new_entries)
+        await touch_journals([jrnl_id])
+
+    return [new_entry.id for new_entry in new_entries]
+
+
+async def get_taken_shorts(shorts: List[str], jrnl_id: int) -> Set[str]:
+    """Which of the shorts already belong to an entry of the journal"""
+    taken: Set[str] = set()
+    for chunk in _chunks(list(set(shorts))):
+        taken.update(await Entry.filter(journal_id=jrnl_id, deleted_on=None, short__in=chunk)
+                     .values_list("short", flat=True))
+
+    return taken
+
+
+async def get_entries_page(jrnl_id: int, after: Optional[Tuple[datetime, int]], limit: int,
+                           deleted: bool = False) -> List[Entry]:
+    """The entries of a journal with their keywords, oldest first, starting right after the (date, id) of the last
+       entry of the previous page so it doesn't get slower page after page like OFFSET does"""
+    query = Entry.filter(journal_id=jrnl_id)
+    if not deleted:
+        query = query.filter(deleted_on=None)
+    if after is not None:
+        query = query.filter(Q(date__gt=after[0]) | Q(date=after[0], id__gt=after[1]))
+
+    return await query.order_by("date", "id").limit(limit).prefetch_related("keywords")
+
+
 async def get_entry_by_id(entry_id: int, deleted: bool = False) -> Optional[Entry]:
     if deleted:
         # Don't care if an entry is marked for deletion
@@ -52,11 +138,14 @@ async def get_entry_by_short(entry_short: str, jrnl_id: int, deleted: bool = Fal
 
 async def delete_entry(entry: Entry, now: Optional[bool] = False) -> None:
     if now:
+        await unindex_entries([entry.id])
         await entry.delete()
     else:
         entry.deleted_on = date.today()
         await entry.save()
 
+    await touch_journals([entry.journal_id])
+
 
 async def undelete_entry(entry: Entry, new_short: Optional[str] = None) -> Entry:
     entry.deleted_on = None
@@ -64,7 +153,12 @@ async def undelete_entry(entry: Entry, new_short: Optional[str] = None) -> Entry
         # In case there is a new entry with that short, we need to change this.
         entry.short = new_short
 
-    await entry.save()
+    try:
+        await entry.save()
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail=DUPLICATE_SHORT)
+    await index_entries([entry])
+    await touch_journals([entry.journal_id])
     await entry.fetch_related("keywords")
     return entry
 
@@ -76,13 +170,20 @@ async def update_entry(updated_entry: schemas.EntryUpdate, entry_id: int) -> Ent
         raise HTTPException(status_code=400, detail="Wrong date format.")
 
     entry = await get_entry_by_id(entry_id)
+    # It can be moved to another journal, then both of them changed
+    jrnl_ids = [entry.journal_id, updated_entry.journal_id]
     entry.journal_id = updated_entry.journal_id
     entry.short = updated_entry.short
     entry.long = updated_entry.long
     entry.date = date_
-    await entry.save()
+    try:
+        await entry.save()
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail=DUPLICATE_SHORT)
 
     await update_keywords(updated_entry.keywords, entry_id)
+    await index_entries([entry])
+    await touch_journals(jrnl_ids)
 
     await entry.fetch_related("keywords")
     return entry
@@ -91,29 +192,36 @@ async def update_entry(updated_entry: schemas.EntryUpdate, entry_id: int) -> Ent
 async def get_entries(user_id: int, params, keywords: List[str],
                       date_min: datetime, date_max: datetime,
                       jrnl_id: Optional[int], deleted: bool = False) -> List[Entry]:
-    if deleted:
-        query = Entry.filter(journal__user_id=user_id)
-    else:
-        query = Entry.filter(journal__user_id=user_id, deleted_on=None)
+    entry_ids = await find_entry_ids(user_id, params, keywords, date_min, date_max, jrnl_id, deleted)
+    if not entry_ids:
+        return []
+
+    return await Entry.filter(id__in=entry_ids).order_by("id").prefetch_related("keywords")
+
+
+async def find_entry_ids(user_id: int, params, keywords: List[str],
+                         date_min: datetime, date_max: datetime,
+                         jrnl_id: Optional[int], deleted: bool = False) -> List[int]:
+    """The ids of the entries get_entries finds, in order"""
+    # Keywords are always saved in lower case
+    words = list({kw.lower() for kw in keywords})
+
+    # Start from the keywords so it only goes through the ones that match, using the index on keyword.word
+    query = Keyword.filter(word__in=words, entry__journal__user_id=user_id)
+    if not deleted:
+        query = query.filter(entry__deleted_on=None)
 
     if jrnl_id:
-        query = query.filter(journal_id=jrnl_id)
+        query = query.filter(entry__journal_id=jrnl_id)
     if date_min:
-        query = query.filter(Q(date__gt=date_min))
+        query = query.filter(Q(entry__date__gt=date_min))
     if date_max:
-        query = query.filter(Q(date__lt=date_max))
+        query = query.filter(Q(entry__date__lt=date_max))
 
-    if params.method.lower() == "or":
-        query = query.prefetch_related("keywords")
-        query = query.filter(Q(keywords__word__in=keywords))
-        entries_to_return = await query.all().offset(params.skip).limit(params.limit)
-    else:
-        entries = await query.all().offset(params.skip).limit(params.limit)
-        await Entry.fetch_for_list(entries, "keywords")
-        entries_to_return = list()
-        for entry in entries:
-            words = [w.word.lower() for w in entry.keywords]
-            if all(kw.lower() in words for kw in keywords):
-                entries_to_return.append(entry)
-
-    return entries_to_return
+    query = query.annotate(matched_keywords=Count("word", distinct=True)).group_by("entry_id")
+    if params.method.lower() == "and":
+        # Only keep the entries that matched every single keyword
+        query = query.filter(matched_keywords=len(words))
+
+    return await query.order_by("entry_id").offset(params.skip).limit(params.limit)\
+        .values_list("entry_id", flat=True)
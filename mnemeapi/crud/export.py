@@ -0,0 +1,48 @@
+from typing import AsyncIterator, Dict, List
+
+from tortoise.query_utils import Q
+
+from ..models.models import Journal, Entry, Keyword
+
+# How many rows are read at a time, the export never holds more than this in memory
+BATCH_SIZE = 500
+
+
+async def iter_journals(user_id: str, batch_size: int = BATCH_SIZE) -> AsyncIterator[Dict]:
+    """All the journals of the user (not their entries) by id, read a batch at a time"""
+    last_id = 0
+    while True:
+        batch = await Journal.filter(user_id=user_id, deleted_on=None, id__gt=last_id)\
+            .order_by("id").limit(batch_size).values("id", "name")
+        for jrnl in batch:
+            yield jrnl
+
+        if len(batch) < batch_size:
+            break
+        last_id = batch[-1]["id"]
+
+
+async def iter_entries(jrnl_id: int, batch_size: int = BATCH_SIZE) -> AsyncIterator[List[Dict]]:
+    """Batches of the entries of a journal with their keywords, oldest first.
+       Each batch starts right after the (date, id) of the last one so it doesn't get slower like OFFSET does."""
+    last_date, last_id = None, None
+    while True:
+        query = Entry.filter(journal_id=jrnl_id, deleted_on=None)
+        if last_date is not None:
+            query = query.filter(Q(date__gt=last_date) | Q(date=last_date, id__gt=last_id))
+        batch = await query.order_by("date", "id").limit(batch_size).values("id", "short", "long", "date")
+        if not batch:
+            break
+
+        keywords: Dict[int, List[str]] = {entry["id"]: [] for entry in batch}
+        rows = await Keyword.filter(entry_id__in=list(keywords)).order_by("id").values_list("entry_id", "word")
+        for entry_id, word in rows:
+            keywords[entry_id].append(word)
+        for entry in batch:
+            entry["keywords"] = keywords[entry["id"]]
+
+        yield batch
+
+        if len(batch) < batch_size:
+            break
+        last_date, last_id = batch[-1]["date"], batch[-1]["id"]
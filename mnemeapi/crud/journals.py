@@ -1,31 +1,51 @@
-from datetime import date
-from typing import Optional
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from tortoise.query_utils import Prefetch
+from fastapi import HTTPException
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import F
+from tortoise.functions import Count, Max
+from tortoise.query_utils import Prefetch, Q
+from tortoise.transactions import in_transaction
 
-from . import delete_entry, undelete_entry
 from .. import schemas
-from ..models import Journal, User, Entry
+from ..models import Journal, Entry
 
 
-async def get_journals_for(user: User, skip: int = 0, limit: int = 100, deleted: bool = False):
+async def get_journals_for(user: schemas.Principal, skip: int = 0, limit: int = 100, deleted: bool = False):
+    """The journals with their entries and keywords, in three queries no matter how many there are"""
+    query = Journal.filter(user_id=user.id)
     if deleted:
-        jrnls = await Journal.filter(user_id=user.id).offset(skip).limit(limit).all()
+        entries = Entry.all().prefetch_related("keywords")
     else:
-        jrnls = await Journal.all()\
-            .prefetch_related(Prefetch("entries", queryset=Entry.filter(deleted_on=None)))\
-            .filter(user_id=user.id, deleted_on=None).offset(skip).limit(limit).all()
+        query = query.filter(deleted_on=None)
+        entries = Entry.filter(deleted_on=None).prefetch_related("keywords")
+
+    return await query.order_by("id").offset(skip).limit(limit)\
+        .prefetch_related(Prefetch("entries", queryset=entries))
+
+
+async def get_journal_summaries(user_id: str, skip: int = 0, limit: int = 100, deleted: bool = False) -> List[Dict]:
+    """The journals without their entries but with how many there are and the date of the last one"""
+    query = Journal.filter(user_id=user_id)
+    entries = None
+    if not deleted:
+        query = query.filter(deleted_on=None)
+        entries = Q(entries__deleted_on=None)
 
-    await Journal.fetch_for_list(jrnls, "entries")
-    for jrnl in jrnls:
-        await Entry.fetch_for_list(list(jrnl.entries), "keywords")
-        if not deleted:
-            await jrnl.filter(deleted_on=None)
+    return await query.order_by("id").offset(skip).limit(limit)\
+        .annotate(entry_count=Count("entries__id", _filter=entries), last_entry=Max("entries__date", _filter=entries))\
+        .values("id", "name", "deleted_on", "updated_at", "version", "entry_count", "last_entry")
 
-    return jrnls
 
+async def get_jrnl_by_name(user_id: str, jrnl_name: str, deleted: bool = False,
+                           entries: bool = True) -> Optional[Journal]:
+    """`entries` is False when only the journal itself is needed, not all its entries and their keywords"""
+    if not entries:
+        if deleted:
+            return await Journal.get_or_none(name_lower=jrnl_name, user_id=user_id)
+        return await Journal.get_or_none(name_lower=jrnl_name, user_id=user_id, deleted_on=None)
 
-async def get_jrnl_by_name(user_id: str, jrnl_name: str, deleted: bool = False) -> Optional[Journal]:
     if deleted:
         jrnl = await Journal.get_or_none(name_lower=jrnl_name, user_id=user_id)
         if jrnl is not None:
@@ -41,17 +61,10 @@ async def get_jrnl_by_name(user_id: str, jrnl_name: str, deleted: bool = False)
 
 
 async def get_jrnl_by_id(user_id: str, jrnl_id: int, deleted: bool = False) -> Optional[Journal]:
+    """Only the journal itself, none of its entries"""
     if deleted:
-        jrnl = await Journal.get_or_none(user_id=user_id, id=jrnl_id)
-    else:
-        jrnl = await Journal.get_or_none(user_id=user_id, id=jrnl_id, deleted_on=None)
-
-    if jrnl is not None:
-        await jrnl.fetch_related("entries__keywords")
-        if not deleted:
-            await jrnl.entries.filter(deleted_on=None)
-
-    return jrnl
+        return await Journal.get_or_none(user_id=user_id, id=jrnl_id)
+    return await Journal.get_or_none(user_id=user_id, id=jrnl_id, deleted_on=None)
 
 
 async def create_journal(user_id: str, jrnl: schemas.JournalCreate) -> Journal:
@@ -64,29 +77,56 @@ async def create_journal(user_id: str, jrnl: schemas.JournalCreate) -> Journal:
     return new_jrnl
 
 
-async def delete_journal(db_journal: Journal, now: Optional[bool] = False):
-    if now:
-        await db_journal.delete()
-    else:
-        db_journal.deleted_on = date.today()
-        for entry in db_journal.entries:
-            await delete_entry(entry, now=now)
+async def delete_journal(db_journal: Journal, now: Optional[bool] = False) -> int:
+    """Returns how many entries were deleted with it, they aren't loaded"""
+    async with in_transaction(Journal._meta.default_connection):  # pylint: disable=protected-access
+        if now:
+            count = await Entry.filter(journal_id=db_journal.id).count()
+            await db_journal.delete()
+            return count
 
+        db_journal.deleted_on = date.today()
+        await db_journal.save()
+        # Only the ones that weren't deleted already, so they are the ones that come back with it
+        return await Entry.filter(journal_id=db_journal.id, deleted_on=None)\
+            .update(deleted_on=db_journal.deleted_on, updated_at=datetime.now(), version=F("version") + 1)
+
+
+async def undelete_journal(db_journal: Journal, new_name: Optional[str] = None) -> Tuple[Journal, int]:
+    """Bring back the journal and the entries deleted with it, returns it with its entries and how many came back"""
+    async with in_transaction(Journal._meta.default_connection):  # pylint: disable=protected-access
+        deleted_on = db_journal.deleted_on
+        db_journal.deleted_on = None
+        if new_name is not None:
+            # In case there is a new journal with that name we need to update it
+            db_journal.name = new_name
+            db_journal.name_lower = new_name.lower()
         await db_journal.save()
 
+        count = 0
+        if deleted_on is not None:
+            try:
+                count = await Entry.filter(journal_id=db_journal.id, deleted_on=deleted_on)\
+                    .update(deleted_on=None, updated_at=datetime.now(), version=F("version") + 1)
+            except IntegrityError:
+                # The unique index on the shorts, the journal stays deleted
+                raise HTTPException(status_code=400, detail="Some of its entries have the same short, "
+                                                            "they have to be revived one at a time")
 
-async def undelete_journal(db_journal: Journal, new_name: Optional[str] = None) -> Journal:
-    db_journal.deleted_on = None
-    if new_name is not None:
-        # In case there is a new journal with that name we need to update it
-        await update_journal(db_journal, new_name)
+    entries = Entry.filter(deleted_on=None).prefetch_related("keywords")
+    return await Journal.get(id=db_journal.id).prefetch_related(Prefetch("entries", queryset=entries)), count
 
-    await db_journal.fetch_related("entries__keywords")
-    await db_journal.save()
-    for entry in db_journal.entries:
-        await undelete_entry(entry)
 
-    return db_journal
+async def touch_journals(jrnl_ids: Iterable[int]) -> None:
+    """Some of the entries of these journals changed, so they get new ETags"""
+    jrnl_ids = list(set(jrnl_ids))
+    if jrnl_ids:
+        await Journal.filter(id__in=jrnl_ids).update(entries_version=F("entries_version") + 1)
+
+
+async def get_journal_versions(user_id: str) -> List[Tuple[int, int, int]]:
+    """(id, version, entries_version) of all the journals of the user, everything it takes to know if they changed"""
+    return await Journal.filter(user_id=user_id).order_by("id").values_list("id", "version", "entries_version")
 
 
 async def update_journal(db_journal: Journal, new_name: str) -> Journal:
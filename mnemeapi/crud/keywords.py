@@ -1,9 +1,32 @@
+from collections import Counter
 from typing import List
 
+from tortoise.transactions import in_transaction
+
 from ..models.models import Keyword
 from ..schemas import KeywordCreate
 
 
 async def update_keywords(new_keywords: List[KeywordCreate], entry_id: int) -> None:
-    await Keyword.filter(entry_id=entry_id).delete()
-    _ = [await Keyword(word=kw.word.lower(), entry_id=entry_id).save() for kw in new_keywords]
+    """Only remove the keywords that are gone and add the new ones, all at once.
+       The ones that stay keep their ids so the clients don't see them change."""
+    missing = Counter(kw.word.lower() for kw in new_keywords)
+    async with in_transaction(Keyword._meta.default_connection):  # pylint: disable=protected-access
+        stale = []
+        for kw_id, word in await Keyword.filter(entry_id=entry_id).order_by("id").values_list("id", "word"):
+            if missing[word] > 0:
+                missing[word] -= 1
+            else:
+                stale.append(kw_id)
+
+        if stale:
+            await Keyword.filter(entry_id=entry_id, id__in=stale).delete()
+        # In the order they were sent
+        added = []
+        for kw in new_keywords:
+            word = kw.word.lower()
+            if missing[word] > 0:
+                missing[word] -= 1
+                added.append(Keyword(entry_id=entry_id, word=word))
+        if added:
+            await Keyword.bulk_create(added)
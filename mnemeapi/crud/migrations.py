@@ -0,0 +1,139 @@
+# pylint: disable=protected-access
+import logging
+from datetime import datetime
+from typing import List, Type
+
+from tortoise.models import Model
+from tortoise.fields import DatetimeField
+from tortoise.exceptions import IntegrityError
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+from ..models import User, Journal, Entry, Keyword, Outbox, SubscribeKey
+from .dialect import is_postgres
+from .journals import touch_journals
+from .search import SEARCH_TABLE, index_entries
+
+log = logging.getLogger("mnemeapi.migrations")
+
+# Two entries of a journal can't have the same short, unless one of them is deleted.
+# Tortoise can't declare partial indexes in the models, so it's created here for the tables that exist already
+# and after generate_schemas for a new database.
+SHORT_INDEX = "uidx_entry_journal_short"
+
+
+async def migrate() -> None:
+    """Bring a database created by an older version up to date with the models.
+       Tortoise.generate_schemas only creates the tables that don't exist at all so this needs to run before it."""
+    for model in (User, Journal, Entry, Keyword, Outbox, SubscribeKey):
+        client = model._meta.db
+        if not await _table_exists(client, model._meta.db_table):
+            # It will be created from scratch by generate_schemas
+            continue
+
+        await _add_columns(client, model)
+        await _create_indexes(client, model)
+        if model is Entry:
+            await create_short_index()
+
+
+async def _table_exists(client: BaseDBAsyncClient, table: str) -> bool:
+    if is_postgres(client):
+        query = "SELECT table_name FROM information_schema.tables WHERE table_schema=current_schema() AND table_name=$1"
+    else:
+        query = "SELECT name FROM sqlite_master WHERE type='table' AND name=?"
+
+    _, rows = await client.execute_query(query, [table])
+    return bool(rows)
+
+
+async def _columns_of(client: BaseDBAsyncClient, table: str) -> List[str]:
+    if is_postgres(client):
+        _, rows = await client.execute_query(
+            "SELECT column_name FROM information_schema.columns WHERE table_schema=current_schema() AND table_name=$1",
+            [table]
+        )
+        return [row["column_name"] for row in rows]
+
+    _, rows = await client.execute_query(f'PRAGMA table_info("{table}")')
+    return [row["name"] for row in rows]
+
+
+async def _add_columns(client: BaseDBAsyncClient, model: Type[Model]) -> None:
+    """Add the fields that are new in the model to its table, the rows that are already there get the default.
+       A date and time without a default is set to the epoch, like for `updated_at` they are older than anything.
+       A default that is a function can't be one for the column, those are left empty."""
+    dialect = client.capabilities.dialect
+    generator = client.schema_generator(client)
+    columns = await _columns_of(client, model._meta.db_table)
+    for name, field in model._meta.fields_map.items():
+        column = field.source_field or name
+        if not field.has_db_field or column in columns:
+            continue
+
+        default = field.default
+        if default is None and isinstance(field, DatetimeField):
+            default = datetime(1970, 1, 1)
+
+        sql = f'ALTER TABLE "{model._meta.db_table}" ADD COLUMN "{column}" {field.get_for_dialect(dialect, "SQL_TYPE")}'
+        if default is not None and not callable(default):
+            # Written the way generate_schemas writes it, only text and dates are quoted
+            sql += f" NOT NULL DEFAULT {generator._escape_default_value(field.to_db_value(default, model))}"
+        await client.execute_script(sql)
+
+
+def _indexes_of(model: Type[Model]) -> List[List[str]]:
+    """The columns of every index declared on the model, either with `index=True` or in `Meta.indexes`"""
+    indexes = [
+        [field.source_field or name]
+        for name, field in model._meta.fields_map.items()
+        if field.index and not field.pk
+    ]
+    for fields in model._meta.indexes:
+        indexes.append([model._meta.fields_map[field].source_field or field for field in fields])
+
+    return indexes
+
+
+async def _create_indexes(client: BaseDBAsyncClient, model: Type[Model]) -> None:
+    # Use the same generator (and so the same index names) as generate_schemas, so nothing gets created twice
+    generator = client.schema_generator(client)
+    for columns in _indexes_of(model):
+        await client.execute_script(generator._get_index_sql(model, columns, safe=True))
+
+
+async def create_short_index() -> bool:
+    """Create the unique index on the shorts of the entries that aren't deleted, if it doesn't exist.
+       Entries from before the index that have the same short as an older one in their journal are renamed first,
+       to `short (id)`. Returns False if some had to be."""
+    client = Entry._meta.db
+    sql = f"CREATE UNIQUE INDEX IF NOT EXISTS {SHORT_INDEX} ON entry (journal_id, short) WHERE deleted_on IS NULL"
+    try:
+        await client.execute_script(sql)
+        return True
+    except IntegrityError:
+        await _rename_duplicate_shorts(client)
+
+    # Nothing stops another one now, so it has to work this time
+    await client.execute_script(sql)
+    return False
+
+
+async def _rename_duplicate_shorts(client: BaseDBAsyncClient) -> None:
+    _, rows = await client.execute_query(
+        "SELECT id FROM entry WHERE deleted_on IS NULL AND EXISTS (SELECT 1 FROM entry AS older "
+        "WHERE older.journal_id = entry.journal_id AND older.short = entry.short "
+        "AND older.deleted_on IS NULL AND older.id < entry.id)"
+    )
+    entries = await Entry.filter(id__in=[row["id"] for row in rows]).order_by("id")
+    for entry in entries:
+        new_short = f"{entry.short} ({entry.id})"
+        log.warning("Entry %s of journal %s has the same short as an older one, %r, it's renamed to %r",
+                    entry.id, entry.journal_id, entry.short, new_short)
+        entry.short = new_short
+        # A new version, so the clients that sync get the new short
+        await entry.save(update_fields=["short"])
+
+    # On a new database the search index is filled once it's created
+    if is_postgres(client) or await _table_exists(client, SEARCH_TABLE):
+        await index_entries(entries)
+    await touch_journals(entry.journal_id for entry in entries)
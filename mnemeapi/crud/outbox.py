@@ -0,0 +1,50 @@
+# pylint: disable=protected-access
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from tortoise.query_utils import Q
+
+from ..models import Outbox
+from .dialect import placeholders
+
+
+async def add_to_outbox(user_id: str, origin: str, data: str, keep: int = 0) -> int:
+    """Returns the id of the new event, if `keep` only the last `keep` events of the user are kept"""
+    event = await Outbox.create(user_id=str(user_id), origin=origin, data=data)
+    if keep > 0:
+        client = Outbox._meta.db
+        marks = placeholders(client)
+        await client.execute_query(
+            f"DELETE FROM outbox WHERE user_id = {next(marks)} AND id <= "
+            f"(SELECT id FROM outbox WHERE user_id = {next(marks)} ORDER BY id DESC LIMIT 1 OFFSET {next(marks)})",
+            [str(user_id), str(user_id), keep]
+        )
+
+    return event.id
+
+
+async def get_outbox_after(last_id: int, also: Iterable[int] = (), limit: int = 500) -> List[Dict]:
+    """The events after `last_id` and the ones in `also` that are there by now, oldest first"""
+    also = list(also)
+    query = Outbox.filter(Q(id__gt=last_id) | Q(id__in=also)) if also else Outbox.filter(id__gt=last_id)
+    return await query.order_by("id").limit(limit).values("id", "user_id", "origin", "data")
+
+
+async def get_user_events(user_id: str, last_id: int, limit: int) -> List[Dict]:
+    """The events of the user after `last_id`, oldest first"""
+    return await Outbox.filter(user_id=str(user_id), id__gt=last_id).order_by("id").limit(limit).values("id", "data")
+
+
+async def has_event(user_id: str, event_id: int) -> bool:
+    return await Outbox.filter(user_id=str(user_id), id=event_id).exists()
+
+
+async def get_last_outbox_id(user_id: Optional[str] = None) -> int:
+    """The id of the last event, of the user if given"""
+    query = Outbox.all() if user_id is None else Outbox.filter(user_id=str(user_id))
+    last = await query.order_by("-id").limit(1).values_list("id", flat=True)
+    return last[0] if last else 0
+
+
+async def purge_outbox(before: datetime) -> int:
+    return await Outbox.filter(created__lt=before).delete()
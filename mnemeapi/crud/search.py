@@ -0,0 +1,180 @@
+# pylint: disable=protected-access
+import re
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+from ..models.models import Entry
+from .dialect import is_postgres, placeholders
+
+# In sqlite the full text index of the short and long of every entry, the rowid of each row is the id of the entry.
+# It's kept in sync by crud.entries, entries that are only marked as deleted stay in it.
+SEARCH_TABLE = "entry_search"
+# In PostgreSQL it's a GIN index on the text of the entries instead, that the database keeps up to date by itself.
+# Queries have to use the exact same expression to use it.
+SEARCH_INDEX = "idx_entry_search"
+SEARCH_VECTOR = "to_tsvector('simple', entry.short || ' ' || entry.long)"
+
+
+async def create_search_index() -> bool:
+    """Create the full text index if it doesn't exist and fill it with the existing entries.
+       Returns True if it had to be created."""
+    client = Entry._meta.db
+    if is_postgres(client):
+        _, rows = await client.execute_query("SELECT indexname FROM pg_indexes WHERE indexname=$1", [SEARCH_INDEX])
+        if not rows:
+            await client.execute_script(f"CREATE INDEX {SEARCH_INDEX} ON entry USING GIN ({SEARCH_VECTOR})")
+        return not rows
+
+    _, rows = await client.execute_query(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name=?", [SEARCH_TABLE]
+    )
+    if rows:
+        return False
+
+    await client.execute_script(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(short, long, tokenize='unicode61')"
+    )
+    await rebuild_search_index()
+    return True
+
+
+async def rebuild_search_index() -> None:
+    """Index all the entries from scratch"""
+    client = Entry._meta.db
+    if is_postgres(client):
+        await client.execute_script(f"REINDEX INDEX {SEARCH_INDEX}")
+        return
+
+    await client.execute_script(
+        f"DELETE FROM {SEARCH_TABLE};"
+        f"INSERT INTO {SEARCH_TABLE}(rowid, short, long) SELECT id, short, long FROM entry;"
+    )
+
+
+async def index_entries(entries: Iterable[Entry]) -> None:
+    """Add the entries to the index, or update them if they are already there"""
+    rows = [[entry.id, entry.short, entry.long] for entry in entries]
+    if not rows or is_postgres(Entry._meta.db):
+        return
+
+    await unindex_entries(row[0] for row in rows)
+    await Entry._meta.db.execute_many(f"INSERT INTO {SEARCH_TABLE}(rowid, short, long) VALUES (?, ?, ?)", rows)
+
+
+async def unindex_entries(entry_ids: Iterable[int]) -> None:
+    rows = [[entry_id] for entry_id in entry_ids]
+    if rows and not is_postgres(Entry._meta.db):
+        await Entry._meta.db.execute_many(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = ?", rows)
+
+
+async def purge_search_index() -> None:
+    """Remove the entries that don't exist anymore, like the ones deleted together with their journal or user"""
+    if not is_postgres(Entry._meta.db):
+        await Entry._meta.db.execute_query(f"DELETE FROM {SEARCH_TABLE} WHERE rowid NOT IN (SELECT id FROM entry)")
+
+
+def _match_expression(text: str) -> str:
+    """Turn what the user typed into an FTS5 query that matches entries with all the words.
+       Every word is quoted so it can't be a syntax error, a trailing * still makes it a prefix search."""
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*")
+        if word:
+            terms.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+
+    return " ".join(terms)
+
+
+def _tsquery(text: str) -> str:
+    """The same for PostgreSQL's to_tsquery, only the letters and numbers of each word are kept
+       just like FTS5 splits them, so the operators of tsquery can't get in."""
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*")
+        tokens = re.findall(r"\w+", word)
+        if tokens and prefix:
+            tokens[-1] += ":*"
+        terms.extend(tokens)
+
+    return " & ".join(terms)
+
+
+def _where(param: Iterator[str], postgres: bool, user_id: str, jrnl_id: Optional[int],
+           date_min: Optional[datetime], date_max: Optional[datetime], deleted: bool) -> Tuple[str, list]:
+    """The WHERE clause of the search after the full text match and its parameters"""
+    conditions = [f"journal.user_id = {next(param)}" + ("::uuid" if postgres else "")]
+    values: list = [str(user_id)]
+    if not deleted:
+        conditions.append("entry.deleted_on IS NULL")
+    if jrnl_id:
+        conditions.append(f"entry.journal_id = {next(param)}")
+        values.append(jrnl_id)
+    # Dates are compared the way tortoise saves them in sqlite
+    if date_min:
+        conditions.append(f"entry.date > {next(param)}")
+        values.append(date_min if postgres else date_min.isoformat(" "))
+    if date_max:
+        conditions.append(f"entry.date < {next(param)}")
+        values.append(date_max if postgres else date_max.isoformat(" "))
+
+    return " AND ".join(conditions), values
+
+
+def _search_query(client: BaseDBAsyncClient, expression: str, user_id: str, jrnl_id: Optional[int],
+                  date_min: Optional[datetime], date_max: Optional[datetime], deleted: bool) -> Tuple[str, list]:
+    """The search query and its parameters, without the values for LIMIT and OFFSET at the end"""
+    postgres = is_postgres(client)
+    param = placeholders(client)
+    match = next(param)
+    where, values = _where(param, postgres, user_id, jrnl_id, date_min, date_max, deleted)
+
+    if postgres:
+        # ts_rank is higher for better matches, it's negated so lower is better like with bm25
+        query = f"""
+            SELECT entry.id AS id, -ts_rank({SEARCH_VECTOR}, query) AS rank,
+                   ts_headline('simple', entry.short || ' ' || entry.long, query,
+                               'StartSel=<b>, StopSel=</b>, MaxWords=16, MinWords=5') AS snippet
+            FROM entry
+            JOIN journal ON journal.id = entry.journal_id
+            CROSS JOIN to_tsquery('simple', {match}) AS query
+            WHERE {SEARCH_VECTOR} @@ query AND {where}
+            ORDER BY rank, entry.id
+            LIMIT {next(param)} OFFSET {next(param)}
+        """
+    else:
+        query = f"""
+            SELECT entry.id AS id, bm25({SEARCH_TABLE}) AS rank,
+                   snippet({SEARCH_TABLE}, -1, '<b>', '</b>', '...', 16) AS snippet
+            FROM {SEARCH_TABLE}
+            JOIN entry ON entry.id = {SEARCH_TABLE}.rowid
+            JOIN journal ON journal.id = entry.journal_id
+            WHERE {SEARCH_TABLE} MATCH {match} AND {where}
+            ORDER BY rank
+            LIMIT {next(param)} OFFSET {next(param)}
+        """
+
+    return query, [expression, *values]
+
+
+async def search_entries(user_id: str, text: str, jrnl_id: Optional[int] = None,
+                         date_min: Optional[datetime] = None, date_max: Optional[datetime] = None,
+                         deleted: bool = False, skip: int = 0, limit: int = 100) -> List[Tuple[Entry, float, str]]:
+    """Find the entries of the user that contain all the words in `text`, best matches first.
+       Returns the entries with their rank (lower is better) and a snippet of the text around the match."""
+    client = Entry._meta.db
+    expression = _tsquery(text) if is_postgres(client) else _match_expression(text)
+    if not expression:
+        return []
+
+    query, values = _search_query(client, expression, user_id, jrnl_id, date_min, date_max, deleted)
+    _, rows = await client.execute_query(query, [*values, limit, skip])
+    if not rows:
+        return []
+
+    entries = await Entry.filter(id__in=[row["id"] for row in rows]).prefetch_related("keywords")
+    entries = {entry.id: entry for entry in entries}
+
+    return [(entries[row["id"]], row["rank"], row["snippet"]) for row in rows if row["id"] in entries]
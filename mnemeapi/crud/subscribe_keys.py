@@ -0,0 +1,44 @@
+# pylint: disable=protected-access
+from datetime import datetime
+from typing import Optional
+
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+from ..models import SubscribeKey
+from ..read_pool import ReadOnlyClient
+
+
+def _writer() -> BaseDBAsyncClient:
+    """GET /subscribe_auth and /subscribe/ run on the read only connections of the read pool,
+       the keys are always written and redeemed with the connection that can write"""
+    db = SubscribeKey._meta.db
+    return db.writer if isinstance(db, ReadOnlyClient) else db
+
+
+async def add_subscribe_key(key: str, user_id: str, expires: datetime) -> None:
+    await SubscribeKey.create(key=key, user_id=str(user_id), expires=expires, using_db=_writer())
+
+
+async def redeem_subscribe_key(key: str, now: datetime) -> Optional[str]:
+    """The user of the key if it hasn't expired, it can only be redeemed once even with many workers"""
+    db = _writer()
+    found = await SubscribeKey.filter(key=key).using_db(db).values("user_id", "expires")
+    # Only whoever actually deletes it gets to use it
+    if not found or not await SubscribeKey.filter(key=key).using_db(db).delete() or found[0]["expires"] <= now:
+        return None
+    return found[0]["user_id"]
+
+
+async def purge_subscribe_keys(now: datetime, keep: int) -> int:
+    """Remove the expired keys and then the oldest ones past the `keep` newest, returns how many were removed"""
+    db = _writer()
+    removed = await SubscribeKey.filter(expires__lte=now).using_db(db).delete()
+    oldest = await SubscribeKey.all().using_db(db).order_by("-expires").offset(keep).limit(1) \
+        .values_list("expires", flat=True)
+    if oldest:
+        removed += await SubscribeKey.filter(expires__lte=oldest[0]).using_db(db).delete()
+    return removed
+
+
+async def count_subscribe_keys() -> int:
+    return await SubscribeKey.all().using_db(_writer()).count()
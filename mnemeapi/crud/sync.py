@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from tortoise.query_utils import Q
+from tortoise.queryset import QuerySet
+
+from ..models.models import Journal, Entry, Versioned
+
+# Where a client is at, the (updated_at, id) of the last row it got
+Position = Tuple[datetime, int]
+# updated_at is set before the transaction commits, so with more than one writer a row can show up after rows with a
+# later updated_at were already synced. A client that caught up is kept this far behind, the rows in between come
+# again on its next sync.
+OVERLAP = timedelta(seconds=30)
+
+
+def _after(query: QuerySet, position: Optional[Position]) -> QuerySet:
+    if position is not None:
+        updated_at, last_id = position
+        query = query.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=last_id))
+    return query.order_by("updated_at", "id")
+
+
+def next_position(rows: List[Versioned], position: Optional[Position], limit: int) -> Optional[Position]:
+    """Where to carry on from after `rows`. In the middle of a sync it's right after the last one, so it moves on
+       even if a lot changed in the last moments."""
+    if rows:
+        position = (rows[-1].updated_at, rows[-1].id)
+    if position is None or len(rows) == limit:
+        return position
+    return min(position, (datetime.now() - OVERLAP, 0))
+
+
+async def get_changes(user_id: str, journals_after: Optional[Position], entries_after: Optional[Position],
+                      limit: int) -> Tuple[List[Journal], List[Entry]]:
+    """The journals (without their entries) and the entries with their keywords that changed after the given
+       positions, up to `limit` of each and the oldest change first. The deleted ones are there too."""
+    journals = await _after(Journal.filter(user_id=user_id), journals_after).limit(limit)
+
+    # Also the deleted journals, their entries may have been deleted with them
+    jrnl_ids = await Journal.filter(user_id=user_id).values_list("id", flat=True)
+    if not jrnl_ids:
+        return journals, []
+    entries = await _after(Entry.filter(journal_id__in=jrnl_ids), entries_after).limit(limit)\
+        .prefetch_related("keywords")
+
+    return journals, entries
@@ -1,11 +1,25 @@
-from typing import Optional, List
+from typing import Dict, Optional, List
 
 from .. import schemas
 from ..models.models import User
-from .. import pwd_context
+from .. import password_hasher
+
+
+# The columns of a User that make up a schemas.Principal
+PRINCIPAL_FIELDS = ("id", "username", "tier", "encrypted", "admin")
+
+
+async def get_principal(user_id: str) -> Optional[schemas.Principal]:
+    """Fetch only what is needed to authorize a request, without loading any of the user's journals"""
+    rows = await User.filter(id=user_id).limit(1).values(*PRINCIPAL_FIELDS)
+    if not rows:
+        return None
+
+    return schemas.Principal(**rows[0])
 
 
 async def get_user_by_id(user_id: str) -> Optional[User]:
+    """Fetch the user with all their journals, entries and keywords, for endpoints that return a schemas.User"""
     user = await User.get_or_none(id=user_id)
     if user is not None:
         await user.fetch_related("journals__entries__keywords")
@@ -14,24 +28,16 @@ async def get_user_by_id(user_id: str) -> Optional[User]:
 
 
 async def get_user_by_username(name: str) -> Optional[User]:
-    user = await User.get_or_none(username=name)
-    if user is not None:
-        await user.fetch_related("journals__entries__keywords")
+    return await User.get_or_none(username=name)
 
-    return user
-
-
-async def get_users(skip: int = 0, limit: int = 100) -> List[User]:
-    users = await User.all().offset(skip).limit(limit)
-    await User.fetch_for_list(users, "journals")
-    for user in users:
-        await user.fetch_related("journals__entries__keywords")
 
-    return users
+async def get_users(skip: int = 0, limit: int = 100) -> List[Dict]:
+    """Just what a schemas.PubUser has, in a single query"""
+    return await User.all().order_by("username").offset(skip).limit(limit).values(*PRINCIPAL_FIELDS)
 
 
 async def create_user(user: schemas.UserCreate) -> User:
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = await password_hasher.hash(user.password)
 
     username = user.username.lower()
     new_user = await User.create(
@@ -60,8 +66,6 @@ async def update_user(db_user: User, new_username: Optional[str], encrypted: Opt
     return db_user
 
 
-async def update_user_password(db_user: User, new_password: str):
-    hashed_password = pwd_context.hash(new_password)
-    db_user.hashed_password = hashed_password
-
-    await db_user.save()
+async def update_user_password(user_id: str, new_password: str):
+    hashed_password = await password_hasher.hash(new_password)
+    await User.filter(id=user_id).update(hashed_password=hashed_password)
@@ -0,0 +1,168 @@
+import json
+import time
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+
+from . import crud
+from .cache import TTLCache
+from .broker import Broker
+
+log = logging.getLogger("mnemeapi.event_bus")
+
+# The user id of the outbox rows that tell the other workers to drop what they have cached for a user, no user has it
+INVALIDATIONS = "invalidate"
+
+
+class EventBus:
+    """Takes the updates from add_to_queue to the broker of every worker, so the devices get them
+       no matter which worker they are connected to.
+       Every update is also kept in the outbox table, its id there is the event id. The last `replay_size`
+       updates of each user are kept for `retention` seconds for the devices that reconnect.
+       When a user changes, what every worker has of theirs in `caches` is dropped too."""
+
+    def __init__(self, broker: Broker, retention: float = 86400, replay_size: int = 100,
+                 caches: Sequence[TTLCache] = ()):
+        self.broker = broker
+        self.retention = retention
+        self.replay_size = replay_size
+        self.caches = caches
+        # Tells apart the updates of this worker from the rest
+        self.origin = uuid.uuid4().hex
+
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def publish(self, user_id: Any, update: Dict) -> int:
+        """Returns the id of the update"""
+        event_id = await crud.add_to_outbox(str(user_id), self.origin, json.dumps(update), keep=self.replay_size)
+        self.broker.publish(user_id, dict(update, id=event_id))
+        return event_id
+
+    async def invalidate(self, user_id: Any) -> None:
+        """The user changed (renamed, deleted, ...), forget what is cached for them"""
+        self._drop(user_id)
+
+    def _drop(self, user_id: Any) -> None:
+        for cache in self.caches:
+            cache.invalidate(user_id)
+
+    async def replay(self, user_id: Any, last_id: int) -> Optional[List[Dict]]:
+        """The updates of the user after `last_id`, None if some of them aren't kept anymore"""
+        if not await crud.has_event(user_id, last_id):
+            return None
+
+        events = await crud.get_user_events(user_id, last_id, self.replay_size)
+        return [dict(json.loads(event["data"]), id=event["id"]) for event in events]
+
+    async def purge(self) -> int:
+        # tortoise saves `created` in local time
+        return await crud.purge_outbox(datetime.now() - timedelta(seconds=self.retention))
+
+    async def tick(self) -> None:
+        await self.purge()
+
+    @property
+    def interval(self) -> float:
+        return self.retention / 2
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.tick()
+            except Exception:  # pylint: disable=broad-except
+                # Keep going, the database may be busy for a moment
+                log.exception("Couldn't check the outbox")
+
+            await asyncio.sleep(self.interval)
+
+
+class MemoryBus(EventBus):
+    """Only this worker, for when there's a single one"""
+
+
+class OutboxBus(EventBus):
+    """Every worker keeps checking the outbox table for the updates of the others.
+       It works with any number of workers as long as they share the database, sqlite or PostgreSQL.
+       The updates of a worker are delivered to its own devices right away, the others get them within
+       `poll_interval` seconds. The same goes for the changes to users and the caches.
+       PostgreSQL hands out the ids before the commit, so an update can show up after ones with higher ids.
+       The ids that were skipped are looked for again for `gap_timeout` seconds."""
+
+    def __init__(self, broker: Broker, poll_interval: float = 0.5, retention: float = 86400, replay_size: int = 100,
+                 caches: Sequence[TTLCache] = (), gap_timeout: float = 60):
+        super().__init__(broker, retention, replay_size, caches)
+        self.poll_interval = poll_interval
+        self.gap_timeout = gap_timeout
+
+        self._last_id = 0
+        # id -> when it was skipped, the ones that can still be committed
+        self._gaps: Dict[int, float] = {}
+        self._purged = time.monotonic()
+
+    async def start(self) -> None:
+        # Only what happens from now on
+        self._last_id = await crud.get_last_outbox_id()
+        await super().start()
+
+    async def invalidate(self, user_id: Any) -> None:
+        await super().invalidate(user_id)
+        # Not an update of the user, so none of their devices ever gets it
+        await crud.add_to_outbox(INVALIDATIONS, self.origin, str(user_id))
+
+    async def poll(self) -> int:
+        """Deliver the new updates of the other workers, returns how many there were"""
+        now = time.monotonic()
+        # Rolled back, or deleted before it was ever seen
+        self._gaps = {gap: skipped for gap, skipped in self._gaps.items() if now - skipped < self.gap_timeout}
+
+        delivered = 0
+        for event in await crud.get_outbox_after(self._last_id, self._gaps):
+            self._gaps.pop(event["id"], None)
+            if event["id"] > self._last_id:
+                self._gaps.update(dict.fromkeys(range(self._last_id + 1, event["id"]), now))
+                self._last_id = event["id"]
+            # Its own devices already have it
+            if event["origin"] == self.origin:
+                continue
+
+            if event["user_id"] == INVALIDATIONS:
+                self._drop(event["data"])
+            else:
+                self.broker.publish(event["user_id"], dict(json.loads(event["data"]), id=event["id"]))
+            delivered += 1
+
+        return delivered
+
+    async def tick(self) -> None:
+        await self.poll()
+        if time.monotonic() - self._purged > self.retention / 2:
+            self._purged = time.monotonic()
+            await self.purge()
+
+    @property
+    def interval(self) -> float:
+        return self.poll_interval
+
+
+def create_event_bus(kind: str, broker: Broker, poll_interval: float = 0.5, retention: float = 86400,
+                     replay_size: int = 100, caches: Sequence[TTLCache] = ()) -> EventBus:
+    if kind == "memory":
+        return MemoryBus(broker, retention, replay_size, caches)
+    elif kind == "outbox":
+        return OutboxBus(broker, poll_interval, retention, replay_size, caches)
+
+    raise ValueError(f"Unknown event bus: {kind}")
@@ -0,0 +1,124 @@
+import io
+import re
+import json
+import zipfile
+from typing import AsyncIterator, Dict, List
+
+from . import crud, schemas
+
+FORMATS = {
+    # format -> (media type, file extension)
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "markdown": ("text/markdown; charset=utf-8", "md"),
+    "zip": ("application/zip", "zip"),
+}
+
+
+def _date(entry: Dict) -> str:
+    return entry["date"].strftime("%Y-%m-%d %H:%M")
+
+
+def _markdown_journal(jrnl: Dict) -> str:
+    return f"# {jrnl['name']}\n\n"
+
+
+def _markdown_entries(entries: List[Dict]) -> str:
+    """The text of the entries is written as it is, for encrypted users it's their ciphertext"""
+    parts = []
+    for entry in entries:
+        parts.append(f"## {entry['short']}\n\n*{_date(entry)}*\n")
+        if entry["keywords"]:
+            parts.append(f"Keywords: {', '.join(entry['keywords'])}\n")
+        if entry["long"]:
+            parts.append(f"\n{entry['long']}\n")
+        parts.append("\n")
+
+    return "".join(parts)
+
+
+async def ndjson_export(user: schemas.Principal) -> AsyncIterator[bytes]:
+    """A line for every journal followed by a line for every one of its entries"""
+    async for jrnl in crud.iter_journals(user.id):
+        line = {"type": "journal", "id": jrnl["id"], "name": jrnl["name"]}
+        yield (json.dumps(line) + "\n").encode()
+
+        async for entries in crud.iter_entries(jrnl["id"]):
+            lines = [
+                json.dumps({
+                    "type": "entry",
+                    "id": entry["id"],
+                    "journal_id": jrnl["id"],
+                    "short": entry["short"],
+                    "long": entry["long"],
+                    "date": _date(entry),
+                    "keywords": entry["keywords"],
+                }) + "\n"
+                for entry in entries
+            ]
+            yield "".join(lines).encode()
+
+
+async def markdown_export(user: schemas.Principal) -> AsyncIterator[bytes]:
+    """All the journals in one document"""
+    async for jrnl in crud.iter_journals(user.id):
+        yield _markdown_journal(jrnl).encode()
+        async for entries in crud.iter_entries(jrnl["id"]):
+            yield _markdown_entries(entries).encode()
+
+
+class _Pipe(io.RawIOBase):
+    """Where the zip file gets written, the data is taken out as soon as it's there and it can't seek,
+       so zipfile writes the sizes after each file instead of going back for them."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _file_name(user: schemas.Principal, jrnl: Dict, used: set) -> str:
+    # The names of encrypted journals are ciphertext, so they're not used for the files
+    name = str(jrnl["id"]) if user.encrypted else re.sub(r"[^\w\- ]", "_", jrnl["name"]).strip() or str(jrnl["id"])
+    if name.lower() in used:
+        name = f"{name} ({jrnl['id']})"
+    used.add(name.lower())
+
+    return f"{name}.md"
+
+
+async def zip_export(user: schemas.Principal) -> AsyncIterator[bytes]:
+    """A zip file with a Markdown file for every journal"""
+    pipe = _Pipe()
+    used: set = set()
+    with zipfile.ZipFile(pipe, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        async for jrnl in crud.iter_journals(user.id):
+            with archive.open(_file_name(user, jrnl, used), "w") as file:
+                file.write(_markdown_journal(jrnl).encode())
+                async for entries in crud.iter_entries(jrnl["id"]):
+                    file.write(_markdown_entries(entries).encode())
+                    data = pipe.take()
+                    if data:
+                        yield data
+
+            yield pipe.take()
+
+    # The central directory at the end
+    yield pipe.take()
+
+
+EXPORTERS = {
+    "ndjson": ndjson_export,
+    "markdown": markdown_export,
+    "zip": zip_export,
+}
@@ -0,0 +1,100 @@
+import asyncio
+from functools import partial
+from typing import Dict, Optional, Union
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+# CryptContext can't be pickled, so the workers rebuild it from its config and keep it around
+_contexts: Dict[str, CryptContext] = {}
+
+
+def _get_context(context_config: str) -> CryptContext:
+    context = _contexts.get(context_config)
+    if context is None:
+        context = _contexts[context_config] = CryptContext.from_string(context_config)
+
+    return context
+
+
+def _hash(context_config: str, password: str) -> str:
+    return _get_context(context_config).hash(password)
+
+
+def _verify(context_config: str, password: str, hashed_password: str) -> bool:
+    return _get_context(context_config).verify(password, hashed_password)
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords in a pool of workers so bcrypt doesn't block the event loop.
+       At most `workers` passwords are processed at once and at most `max_waiting` more can wait for their turn,
+       anything after that is turned away with a 503 instead of piling up."""
+
+    def __init__(self, context: CryptContext, workers: int = 2, max_waiting: int = 64, processes: bool = False):
+        self._context_config = context.to_string()
+        self.workers = workers
+        self.max_waiting = max_waiting
+        self.processes = processes
+
+        self._executor: Optional[Executor] = None
+        # Submitted to the pool but not finished yet, this includes the ones that are waiting
+        self._pending = 0
+        self.rejected = 0
+
+    def configure(self, workers: int, max_waiting: int, processes: bool) -> None:
+        self.shutdown()
+        self.workers = workers
+        self.max_waiting = max_waiting
+        self.processes = processes
+
+    @property
+    def queue_depth(self) -> int:
+        """How many passwords are waiting for a free worker"""
+        return max(self._pending - self.workers, 0)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(partial(_hash, self._context_config, password))
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(partial(_verify, self._context_config, password, hashed_password))
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def stats(self) -> Dict[str, Union[int, str]]:
+        return {
+            "pool": "process" if self.processes else "thread",
+            "workers": self.workers,
+            "running": min(self._pending, self.workers),
+            "queue_depth": self.queue_depth,
+            "max_waiting": self.max_waiting,
+            "rejected": self.rejected,
+        }
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.processes:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="mneme-passwords")
+
+        return self._executor
+
+    async def _run(self, func):
+        if self._pending >= self.workers + self.max_waiting:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="The server is busy, please try again in a bit.",
+                headers={"Retry-After": "1"}
+            )
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self._get_executor(), func)
+        finally:
+            self._pending -= 1
@@ -1,26 +1,32 @@
-import secrets
 import asyncio
-from asyncio import Queue
-from datetime import timedelta
-from typing import List, Optional
+from collections import Counter
+from datetime import date, timedelta
+from typing import List, Optional, Union
 
 from tortoise import Tortoise
 from fastapi import Depends, HTTPException
-from fastapi import FastAPI, Query, Request
+from fastapi import FastAPI, Header, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
 from sse_starlette.sse import EventSourceResponse
 
 from . import ACCESS_TOKEN_EXPIRE_MINUTES
-from . import models, schemas, crud, config, queues
+from . import schemas, crud, config, broker, event_bus, sub_keys, principal_cache, response_cache, password_hasher, \
+    read_pool
 from .utils import get_current_user, auth_user, generate_auth_token, parse_date, clean_db, clean_backups, auto_backup, \
-    updates_generator, add_to_queue
+    store_backup, updates_generator, missed_updates, add_to_queue, read_entries, encode_cursor, decode_cursor, \
+    encode_page_cursor, decode_page_cursor, journals_etag, cached_json
 from .classes import InstanceType
+from .export import EXPORTERS, FORMATS
+from .read_pool import ReadOnlyMiddleware
+from .profiling import QueryCountMiddleware
+from .compression import CompressionMiddleware
+from .serialization import dumps, render
 
 app = FastAPI(
     title="Mneme",
     description="A self-hosted multi-platform journal keeping app"
 )
-sub_keys = dict()
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,6 +35,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ReadOnlyMiddleware, pool=read_pool)
+if config.query_budget:
+    app.add_middleware(QueryCountMiddleware, budget=config.query_budget)
+if config.compression:
+    app.add_middleware(CompressionMiddleware, encodings=config.compression, minimum_size=config.compression_min_size,
+                       level=config.compression_level)
 
 
 @app.on_event("startup")
@@ -37,17 +49,32 @@ async def startup():
         db_url=config.db_url,
         modules={"models": ["mnemeapi.models.models"]}
     )
+    await crud.migrate()
     await Tortoise.generate_schemas()
+    await crud.create_short_index()
+    await crud.create_search_index()
+    if config.incremental_backups:
+        incremental = await crud.create_changelog()
+    else:
+        incremental = False
+        await crud.drop_changelog()
     await config.create_user()
+    await read_pool.open(config.read_connections)
+    await event_bus.start()
+    await sub_keys.start()
 
     _ = asyncio.create_task(clean_db())
     _ = asyncio.create_task(clean_backups())
-    _ = asyncio.create_task(auto_backup())
+    _ = asyncio.create_task(auto_backup(incremental))
 
 
 @app.on_event("shutdown")
 async def shutdown():
+    await sub_keys.stop()
+    await event_bus.stop()
+    await read_pool.close()
     await Tortoise.close_connections()
+    password_hasher.shutdown()
 
 
 @app.post("/login", response_model=schemas.Token)
@@ -66,28 +93,34 @@ async def token(auth_data: schemas.AuthUser):
 
 
 @app.get("/subscribe/")
-async def subscribe(key: str, request: Request):
-    """Subscribe the user to receive updates from other clients"""
-    user_id = sub_keys.pop(key, None)
+async def subscribe(key: str, request: Request, last_event_id: Optional[int] = Query(None),
+                    last_event_header: Optional[int] = Header(None, alias="Last-Event-ID")):
+    """Subscribe the user to receive updates from other clients.
+    To get the updates missed since the last connection pass the id of the last one, either in the `Last-Event-ID`
+    header or in `last_event_id` since the key can only be used once."""
+    user_id = await sub_keys.redeem(key)
     if user_id is None:
         raise HTTPException(
             status_code=401,
             detail="You need to authorize in the /subscribe_auth endpoint first"
         )
 
-    if user_id not in queues:
-        queues[user_id] = Queue()
-
-    updates = updates_generator(user_id, request)
-    return EventSourceResponse(updates)
+    # Every device gets its own subscription, so they all get every update
+    # Before looking for the missed updates, so none get in between
+    subscription = broker.subscribe(user_id)
+    try:
+        missed = await missed_updates(user_id, last_event_id if last_event_id is not None else last_event_header)
+    except Exception:
+        broker.unsubscribe(subscription)
+        raise
+    updates = updates_generator(subscription, request, missed)
+    return EventSourceResponse(updates, ping=config.heartbeat_interval)
 
 
 @app.get("/subscribe_auth", response_model=schemas.Token)
-async def sub_auth(user: models.User = Depends(get_current_user)):
+async def sub_auth(user: schemas.Principal = Depends(get_current_user)):
     """Get a one time use key to be used in the /subscribe endpoint"""
-    key = secrets.token_urlsafe(16)
-    sub_keys[key] = user.id
-    return {"access_token": key}
+    return {"access_token": await sub_keys.issue(user.id)}
 
 
 @app.post("/users/pub", response_model=schemas.User, status_code=201, name="Create User")
@@ -104,7 +137,7 @@ async def create_user_pub(*, user: schemas.UserCreate):
 
 
 @app.post("/users", response_model=schemas.User, status_code=201, name="Create User")
-async def create_user(*, user: schemas.UserCreate, cur_user: models.User = Depends(get_current_user)):
+async def create_user(*, user: schemas.UserCreate, cur_user: schemas.Principal = Depends(get_current_user)):
     """This is the endpoint used if the instance is private so only an admin can create accounts."""
     if not cur_user.admin:
         raise HTTPException(status_code=403, detail="Only an admin can create new users.")
@@ -123,13 +156,14 @@ async def read_users(skip: int = 0, limit: int = 100):
 
 
 @app.delete("/users", status_code=204)
-async def delete_user(*, user: models.User = Depends(get_current_user)):
+async def delete_user(*, user: schemas.Principal = Depends(get_current_user)):
     """Delete the current user and all his data. This is action is irreversible."""
     await crud.delete_user(user.id)
+    await event_bus.invalidate(user.id)
 
 
 @app.put("/users", response_model=schemas.User)
-async def update_user(*, user: models.User = Depends(get_current_user),
+async def update_user(*, user: schemas.Principal = Depends(get_current_user),
                       new_username: str = None, encrypted: bool = False):
     if new_username is encrypted is None:
         raise HTTPException(status_code=400, detail="New username and encrypted can't be both empty")
@@ -140,32 +174,36 @@ async def update_user(*, user: models.User = Depends(get_current_user),
             raise HTTPException(status_code=400, detail="Username already registered")
 
         db_user = await crud.get_user_by_id(user.id)
-        return await crud.update_user(db_user, new_username.lower(), encrypted)
+        db_user = await crud.update_user(db_user, new_username.lower(), encrypted)
     else:
         db_user = await crud.get_user_by_id(user.id)
-        return await crud.update_user(db_user, None, encrypted)
+        db_user = await crud.update_user(db_user, None, encrypted)
+
+    await event_bus.invalidate(user.id)
+    return db_user
 
 
 @app.post("/users/update_password", status_code=204)
-async def update_password(*, user: models.User = Depends(get_current_user), user_password: schemas.UserPassword):
+async def update_password(*, user: schemas.Principal = Depends(get_current_user), user_password: schemas.UserPassword):
     if await auth_user(user.username, user_password.current_password):
         if user_password.current_password == user_password.new_password:
             raise HTTPException(status_code=400, detail="New password can't be the same as the old one.")
         else:
-            await crud.update_user_password(user, user_password.new_password)
+            await crud.update_user_password(user.id, user_password.new_password)
+            await event_bus.invalidate(user.id)
     else:
         raise HTTPException(status_code=400, detail="Wrong password.")
 
 
 @app.post('/journals', response_model=schemas.Journal, status_code=201)
-async def create_journal(jrnl: schemas.JournalCreate, user: models.User = Depends(get_current_user)):
+async def create_journal(jrnl: schemas.JournalCreate, user: schemas.Principal = Depends(get_current_user)):
     if config.instance is InstanceType.COMMERCIAL and user.tier == 0:
         # free tier
         if len(await crud.get_journals_for(user)) >= 2:
             detail = "Free users in commercial instances can have up to 2 journals."
             return HTTPException(status_code=403, detail=detail)
 
-    db_jrnl = await crud.get_jrnl_by_name(user.id, jrnl.name)
+    db_jrnl = await crud.get_jrnl_by_name(user.id, jrnl.name, entries=False)
     if db_jrnl:
         raise HTTPException(status_code=400, detail="This journal already exists for this user")
     else:
@@ -179,7 +217,7 @@ async def create_journal(jrnl: schemas.JournalCreate, user: models.User = Depend
 
 
 @app.get("/journals/entries", response_model=List[schemas.Entry], name="Find entries")
-async def find_entry(*, user: models.User = Depends(get_current_user),
+async def find_entry(*, user: schemas.Principal = Depends(get_current_user),
                      params: schemas.Params = Depends(None), keywords: List[str] = Query(...), deleted: bool = False):
     """Method parameter is either 'and', or 'or' and it translates to whether it should look for entries
        that have all the keywords, or at least one of them"""
@@ -193,7 +231,7 @@ async def find_entry(*, user: models.User = Depends(get_current_user),
         date_max = parse_date(params.date_max)
 
     if params.jrnl_name is not None:
-        db_jrnl = await crud.get_jrnl_by_name(user.id, params.jrnl_name, deleted=deleted)
+        db_jrnl = await crud.get_jrnl_by_name(user.id, params.jrnl_name, deleted=deleted, entries=False)
         if db_jrnl is None:
             raise HTTPException(status_code=404, detail="This journal doesn't exists for this user")
         else:
@@ -201,72 +239,146 @@ async def find_entry(*, user: models.User = Depends(get_current_user),
     else:
         jrnl_id = None
 
-    if params.method in ["or", "and"]:
+    if params.method in ["or", "and"] and config.fast_serializer:
+        entry_ids = await crud.find_entry_ids(user.id, params, keywords, date_min, date_max, jrnl_id, deleted=deleted)
+        return Response(dumps(await crud.get_entry_dicts(entry_ids)), media_type="application/json")
+    elif params.method in ["or", "and"]:
         # We pass date_min and date_max because now they are datetime objects, not strings
         return await crud.get_entries(user.id, params, keywords, date_min, date_max, jrnl_id, deleted=deleted)
     else:
         raise HTTPException(status_code=400, detail="Method parameter can only be 'and' or 'or'.")
 
 
+@app.get("/search", response_model=List[schemas.SearchResult], name="Search entries")
+async def search(*, user: schemas.Principal = Depends(get_current_user), text: str = Query(..., alias="q"),
+                 jrnl_name: Optional[str] = None,
+                 date_min: Optional[str] = None, date_max: Optional[str] = None, deleted: bool = False,
+                 skip: int = 0, limit: int = 100):
+    """Full text search in the short and long text of the entries, the best matches come first.
+       Entries need to have all the words in `q`, a word ending in * matches any word starting with it."""
+    if jrnl_name is not None:
+        db_jrnl = await crud.get_jrnl_by_name(user.id, jrnl_name.lower(), deleted=deleted, entries=False)
+        if db_jrnl is None:
+            raise HTTPException(status_code=404, detail="This journal doesn't exists for this user")
+        else:
+            jrnl_id = db_jrnl.id
+    else:
+        jrnl_id = None
+
+    results = await crud.search_entries(
+        user.id, text, jrnl_id,
+        date_min=parse_date(date_min) if date_min else None,
+        date_max=parse_date(date_max) if date_max else None,
+        deleted=deleted, skip=skip, limit=limit
+    )
+    return [{"entry": entry, "rank": rank, "snippet": snippet} for entry, rank, snippet in results]
+
+
+@app.post("/search/rebuild", status_code=204)
+async def rebuild_search(user: schemas.Principal = Depends(get_current_user)):
+    """Index all the entries for searching from scratch, in case the index got out of sync"""
+    if not user.admin:
+        raise HTTPException(status_code=401, detail="Only admin users can do that.")
+    else:
+        await crud.rebuild_search_index()
+
+
 @app.post("/journals/revive", response_model=schemas.Journal)
-async def revive_journal(jrnl_id: int, new_name: Optional[str] = None, user: models.User = Depends(get_current_user)):
+async def revive_journal(jrnl_id: int, new_name: Optional[str] = None,
+                         user: schemas.Principal = Depends(get_current_user)):
     """Bring back journals and their entries that haven't been completely deleted yet. """
     deleted_jrnl = await crud.get_jrnl_by_id(user.id, jrnl_id, deleted=True)
     if deleted_jrnl is None:
         raise HTTPException(status_code=404, detail="There is no journal with that name")
-    if await crud.get_jrnl_by_name(user.id, deleted_jrnl.name.lower(), deleted=False) and not new_name:
+    if not new_name and await crud.get_jrnl_by_name(user.id, deleted_jrnl.name.lower(), entries=False):
         # If there is a not a new name provided and a journal already exists with that name
         detail = "There is a new journal with that name, you will have to enter a new name."
         raise HTTPException(status_code=400, detail=detail)
-    elif new_name is not None and await crud.get_jrnl_by_name(user.id, new_name.lower(), deleted=False):
+    elif new_name is not None and await crud.get_jrnl_by_name(user.id, new_name.lower(), entries=False):
         # If there is a new name provided but a journal already exists with that name
         detail = "A journal with the new name already exists, please give another."
         raise HTTPException(status_code=400, detail=detail)
     else:
+        jrnl, count = await crud.undelete_journal(deleted_jrnl, new_name)
         data = {
-            "id": deleted_jrnl.id,
-            "name": new_name,
+            "id": jrnl.id,
+            "name": jrnl.name,
+            # How many entries came back with it
+            "entries": count,
         }
         await add_to_queue(user.id, event="create", changed_type="journal", data=data)
-        return await crud.undelete_journal(deleted_jrnl, new_name)
+        return jrnl
 
 
 @app.get("/journals/{jrnl_name}", response_model=schemas.Journal, name="Fetch Journal")
-async def read_journal(jrnl_name: str, user: models.User = Depends(get_current_user), deleted: bool = False):
-    db_jrnl = await crud.get_jrnl_by_name(user.id, jrnl_name.lower(), deleted=deleted)
+async def read_journal(jrnl_name: str, request: Request, user: schemas.Principal = Depends(get_current_user),
+                       deleted: bool = False):
+    """Send back the ETag in If-None-Match to get a 304 if nothing changed, then the entries aren't even loaded"""
+    db_jrnl = await crud.get_jrnl_by_name(user.id, jrnl_name.lower(), deleted=deleted, entries=False)
     if db_jrnl is None:
         raise HTTPException(status_code=404, detail="This journal doesn't exists for this user")
-    else:
-        return db_jrnl
+
+    async def load():
+        if config.fast_serializer:
+            jrnls = await crud.get_journal_dicts(user.id, deleted=deleted, jrnl_id=db_jrnl.id)
+        else:
+            jrnls = [await crud.get_jrnl_by_name(user.id, db_jrnl.name_lower, deleted=deleted)]
+        if not jrnls or jrnls[0] is None:
+            # Deleted in the meantime
+            raise HTTPException(status_code=404, detail="This journal doesn't exists for this user")
+
+        return dumps(jrnls[0]) if config.fast_serializer else render(schemas.Journal.from_orm(jrnls[0]))
+
+    etag = journals_etag(user.id, [(db_jrnl.id, db_jrnl.version, db_jrnl.entries_version)])
+    return await cached_json(request, user.id, etag, load)
 
 
-@app.get("/journals", response_model=List[schemas.Journal], name="Fetch Journals")
-async def read_journals(skip: int = 0, limit: int = 100,
-                        user: models.User = Depends(get_current_user), deleted: bool = False):
-    jrnls = await crud.get_journals_for(user, skip=skip, limit=limit, deleted=deleted)
-    return jrnls
+@app.get("/journals", response_model=List[Union[schemas.Journal, schemas.JournalSummary]], name="Fetch Journals")
+async def read_journals(request: Request, skip: int = 0, limit: int = 100, embed: str = "entries",
+                        user: schemas.Principal = Depends(get_current_user), deleted: bool = False):
+    """With `embed=none` the journals come without their entries, but with how many there are and the date of the
+    last one. Then the entries can be fetched a page at a time from /journals/{jrnl_name}/entries.
+    There is an ETag like for a single journal."""
+    embed = embed.lower()
+    if embed not in ("entries", "none"):
+        raise HTTPException(status_code=400, detail="Embed can only be 'entries' or 'none'.")
+
+    async def load():
+        if embed == "entries" and config.fast_serializer:
+            return dumps(await crud.get_journal_dicts(user.id, skip=skip, limit=limit, deleted=deleted))
+        elif embed == "entries":
+            jrnls = await crud.get_journals_for(user, skip=skip, limit=limit, deleted=deleted)
+            return render([schemas.Journal.from_orm(jrnl) for jrnl in jrnls])
+
+        # Not through the response model, it would take them for journals without entries
+        jrnls = await crud.get_journal_summaries(user.id, skip=skip, limit=limit, deleted=deleted)
+        return render([schemas.JournalSummary(**jrnl) for jrnl in jrnls])
+
+    etag = journals_etag(user.id, await crud.get_journal_versions(user.id))
+    return await cached_json(request, user.id, etag, load)
 
 
 @app.delete("/journals/{jrnl_name}", status_code=204)
-async def delete_journal(*, user: models.User = Depends(get_current_user), jrnl_name: str,
+async def delete_journal(*, user: schemas.Principal = Depends(get_current_user), jrnl_name: str,
                          now: bool = False, deleted: bool = False):
-    db_jrnl = await crud.get_jrnl_by_name(user.id, jrnl_name.lower(), deleted=deleted)
+    db_jrnl = await crud.get_jrnl_by_name(user.id, jrnl_name.lower(), deleted=deleted, entries=False)
     if db_jrnl is None:
         raise HTTPException(status_code=404, detail="This journal doesn't exists for this user")
 
+    count = await crud.delete_journal(db_jrnl, now)
     data = {
         "id": db_jrnl.id,
         "name": db_jrnl.name,
+        # How many entries were deleted with it
+        "entries": count,
     }
     await add_to_queue(user.id, event="delete", changed_type="journal", data=data)
 
-    await crud.delete_journal(db_jrnl, now)
-
 
 @app.put("/journals/{jrnl_name}", response_model=schemas.Journal)
-async def update_journal(*, user: models.User = Depends(get_current_user), jrnl_name: str, new_name: str):
+async def update_journal(*, user: schemas.Principal = Depends(get_current_user), jrnl_name: str, new_name: str):
     # Check if new_name exists as a journal for the user
-    db_jrnl = await crud.get_jrnl_by_name(user.id, new_name.lower())
+    db_jrnl = await crud.get_jrnl_by_name(user.id, new_name.lower(), entries=False)
     if db_jrnl is not None:
         raise HTTPException(status_code=400, detail="The new journal name already exists for the user")
 
@@ -285,14 +397,13 @@ async def update_journal(*, user: models.User = Depends(get_current_user), jrnl_
 
 
 @app.post("/journals/{jrnl_name}/entries", response_model=schemas.Entry, status_code=201)
-async def create_entry(*, jrnl_name: str, user: models.User = Depends(get_current_user), entry: schemas.EntryCreate):
-    db_jrnl = await crud.get_jrnl_by_name(user.id, jrnl_name.lower())
+async def create_entry(*, jrnl_name: str, user: schemas.Principal = Depends(get_current_user),
+                       entry: schemas.EntryCreate):
+    db_jrnl = await crud.get_jrnl_by_name(user.id, jrnl_name.lower(), entries=False)
     if db_jrnl is None:
         raise HTTPException(status_code=404, detail="This journal doesn't exists for this user")
 
-    if entry.short in [e.short for e in db_jrnl.entries]:
-        raise HTTPException(status_code=400, detail="This entry already exists in this journal")
-
+    # A 400 if there is another entry with the same short, from the unique index
     new_entry = await crud.create_entry(entry, db_jrnl.id)
 
     data = {
@@ -308,24 +419,81 @@ async def create_entry(*, jrnl_name: str, user: models.User = Depends(get_curren
     return new_entry
 
 
+@app.post("/journals/{jrnl_name}/entries/bulk", response_model=schemas.EntriesImported, status_code=201)
+async def import_entries(*, jrnl_name: str, request: Request, user: schemas.Principal = Depends(get_current_user)):
+    """Create many entries at once, either all of them or none.
+       The body is a JSON array of entries, or one entry per line with the application/x-ndjson Content-Type."""
+    db_jrnl = await crud.get_jrnl_by_name(user.id, jrnl_name.lower(), entries=False)
+    if db_jrnl is None:
+        raise HTTPException(status_code=404, detail="This journal doesn't exists for this user")
+
+    entries = await read_entries(request, config.max_import)
+    if not entries:
+        raise HTTPException(status_code=400, detail="There are no entries to import")
+
+    shorts = Counter(entry.short for entry in entries)
+    repeated = [short for short, count in shorts.items() if count > 1]
+    if repeated:
+        raise HTTPException(status_code=400, detail=f"These entries are there more than once: {', '.join(repeated)}")
+
+    taken = await crud.get_taken_shorts(list(shorts), db_jrnl.id)
+    if taken:
+        raise HTTPException(status_code=400,
+                            detail=f"These entries already exist in this journal: {', '.join(sorted(taken))}")
+
+    ids = await crud.create_entries(entries, db_jrnl.id)
+
+    # A single update for all of them, the devices can fetch the journal again
+    data = {
+        "journal_id": db_jrnl.id,
+        "count": len(ids),
+        "ids": ids
+    }
+    await add_to_queue(user.id, event="create", changed_type="entries", data=data)
+
+    return data
+
+
+@app.get("/journals/{jrnl_name}/entries", response_model=schemas.EntryPage, name="Fetch entries of journal")
+async def read_journal_entries(*, user: schemas.Principal = Depends(get_current_user), jrnl_name: str,
+                               cursor: Optional[str] = None, limit: int = Query(100, ge=1, le=1000),
+                               deleted: bool = False):
+    """The entries of a journal oldest first, a page at a time. Pass the `cursor` of a page to get the next one."""
+    db_jrnl = await crud.get_jrnl_by_name(user.id, jrnl_name.lower(), deleted=deleted, entries=False)
+    if db_jrnl is None:
+        raise HTTPException(status_code=404, detail="This journal doesn't exists for this user")
+
+    after = None if cursor is None else decode_page_cursor(cursor)
+    entries = await crud.get_entries_page(db_jrnl.id, after, limit, deleted=deleted)
+    next_cursor = None
+    if len(entries) == limit:
+        next_cursor = encode_page_cursor((entries[-1].date, entries[-1].id))
+
+    return {"entries": entries, "cursor": next_cursor}
+
+
 @app.get("/journals/{jrnl_name}/{entry_id}", response_model=schemas.Entry)
-async def read_entry(*, user: models.User = Depends(get_current_user), jrnl_name: str,
-                     entry_id: int, deleted: bool = False):
-    db_jrnl = await crud.get_jrnl_by_name(user.id, jrnl_name, deleted=deleted)
+async def read_entry(*, user: schemas.Principal = Depends(get_current_user), jrnl_name: str,
+                     entry_id: int, deleted: bool = False, request: Request):
+    """With an ETag from the versions of its journal, so a 304 doesn't need to look for the entry"""
+    db_jrnl = await crud.get_jrnl_by_name(user.id, jrnl_name, deleted=deleted, entries=False)
     if db_jrnl is None:
         raise HTTPException(status_code=404, detail="This journal doesn't exists for this user")
 
-    entry_db = await crud.get_entry_by_id(entry_id, deleted=deleted)
-    if entry_db is None or entry_db.journal_id != db_jrnl.id:
-        raise HTTPException(status_code=404, detail="There is no entry with that id in that journal")
-    else:
-        return entry_db
+    async def load():
+        entry_db = await crud.get_entry_by_id(entry_id, deleted=deleted)
+        if entry_db is None or entry_db.journal_id != db_jrnl.id:
+            raise HTTPException(status_code=404, detail="There is no entry with that id in that journal")
+        return render(schemas.Entry.from_orm(entry_db))
+
+    etag = journals_etag(user.id, [(db_jrnl.id, db_jrnl.version, db_jrnl.entries_version)])
+    return await cached_json(request, user.id, etag, load)
 
 
 @app.delete("/journals/{jrnl_name}/{entry_id}", status_code=204)
-async def delete_entry(*, user: models.User = Depends(get_current_user),
+async def delete_entry(*, user: schemas.Principal = Depends(get_current_user),
                        jrnl_name: str, entry_id: int, now: bool = False, deleted: bool = False):
-    db_jrnl = await crud.get_jrnl_by_name(user.id, jrnl_name, deleted=deleted)
+    db_jrnl = await crud.get_jrnl_by_name(user.id, jrnl_name, deleted=deleted, entries=False)
     if db_jrnl is None:
         raise HTTPException(status_code=404, detail="This journal doesn't exists for this user")
 
@@ -344,7 +512,8 @@ async def delete_entry(*, user: models.User = Depends(get_current_user),
 
 
 @app.post("/journals/entries/revive", response_model=schemas.Entry)
-async def revive_entry(entry_id: int, new_short: Optional[str] = None, user: models.User = Depends(get_current_user)):
+async def revive_entry(entry_id: int, new_short: Optional[str] = None,
+                       user: schemas.Principal = Depends(get_current_user)):
     """Bring back journals and their entries that haven't been completely deleted yet. """
     db_entry = await crud.get_entry_by_id(entry_id, deleted=True)
     if db_entry is None:
@@ -356,9 +525,11 @@ async def revive_entry(entry_id: int, new_short: Optional[str] = None, user: mod
     if await crud.get_entry_by_short(short.lower(), db_entry.journal_id):
         raise HTTPException(status_code=400, detail="There already exists and entry with that short in the journal.")
 
-    db_jrnl = await crud.get_jrnl_by_id(user.id, await db_entry.journal_id, deleted=True)
+    db_jrnl = await crud.get_jrnl_by_id(user.id, db_entry.journal_id, deleted=True)
+    if db_jrnl is None:
+        raise HTTPException(status_code=404, detail="No entry found with that id.")
     if db_jrnl.deleted_on is not None:
-        if await crud.get_jrnl_by_name(user.id, db_jrnl.name_lower, deleted=False):
+        if await crud.get_jrnl_by_name(user.id, db_jrnl.name_lower, entries=False):
             raise HTTPException(status_code=400, detail="A new journal with its name exists.")
         await crud.undelete_journal(db_jrnl)
 
@@ -376,10 +547,10 @@ async def revive_entry(entry_id: int, new_short: Optional[str] = None, user: mod
 
 
 @app.put("/journals/{jrnl_name}/{entry_id}", response_model=schemas.Entry)
-async def update_entry(*, user: models.User = Depends(get_current_user), jrnl_name: str,
+async def update_entry(*, user: schemas.Principal = Depends(get_current_user), jrnl_name: str,
                        entry_id: int, updated_entry: schemas.EntryUpdate):
     # Check jrnl_name belongs to current user
-    db_jrnl = await crud.get_jrnl_by_name(user.id, jrnl_name)
+    db_jrnl = await crud.get_jrnl_by_name(user.id, jrnl_name, entries=False)
     if db_jrnl is None:
         raise HTTPException(status_code=404, detail="This journal doesn't exists for this user")
 
@@ -408,10 +579,68 @@ async def update_entry(*, user: models.User = Depends(get_current_user), jrnl_na
     return new_entry
 
 
+@app.get("/export")
+async def export(fmt: str = Query("ndjson", alias="format"), user: schemas.Principal = Depends(get_current_user)):
+    """Download all the journals of the user, `format` is one of "ndjson", "markdown" or "zip" (a Markdown file for
+       every journal). It's streamed as it's read from the database, the text of encrypted users is left as it is."""
+    fmt = fmt.lower()
+    if fmt not in EXPORTERS:
+        raise HTTPException(status_code=400, detail=f"Format can only be one of {', '.join(EXPORTERS)}.")
+
+    media_type, extension = FORMATS[fmt]
+    return StreamingResponse(
+        EXPORTERS[fmt](user),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="mneme.{extension}"'}
+    )
+
+
+@app.get("/sync", response_model=schemas.Changes)
+async def sync(cursor: Optional[str] = None, limit: int = Query(500, ge=1, le=1000),
+               user: schemas.Principal = Depends(get_current_user)):
+    """The journals and entries that changed since the `cursor` of the last call, deleted ones included.
+    Without a cursor it's everything, so the first sync is the same as any other. Keep asking with the new cursor
+    while there are `more`. Journals and entries deleted with `now` aren't reported.
+    The ones that changed in the last 30 seconds can come again in the next sync, keep the highest `version`."""
+    journals_after = entries_after = None
+    if cursor is not None:
+        synced, journals_after, entries_after = decode_cursor(cursor)
+        # Deleted journals and entries are only kept for a while, past that it can't know what's gone
+        if synced.date() < date.today() - timedelta(days=config.delete_after):
+            return {"journals": [], "entries": [], "cursor": None, "more": False, "reset": True}
+
+    journals, entries = await crud.get_changes(user.id, journals_after, entries_after, limit)
+    journals_after = crud.next_position(journals, journals_after, limit)
+    entries_after = crud.next_position(entries, entries_after, limit)
+
+    return {
+        "journals": journals,
+        "entries": entries,
+        "cursor": encode_cursor(journals_after, entries_after),
+        "more": len(journals) == limit or len(entries) == limit,
+    }
+
+
 @app.post("/backup", status_code=204)
-async def backup(user: models.User = Depends(get_current_user)):
-    """Create backup of the database. This is automatically done every 24 hours as well"""
+async def backup(user: schemas.Principal = Depends(get_current_user)):
+    """Create a full backup of the database. This is automatically done every `backup interval` hours as well"""
+    if not user.admin:
+        raise HTTPException(status_code=401, detail="Only admin users can do that.")
+    else:
+        await store_backup(await crud.backup())
+
+
+@app.get("/stats")
+async def stats(user: schemas.Principal = Depends(get_current_user)):
+    """Runtime counters of the caches and pools of the server"""
     if not user.admin:
         raise HTTPException(status_code=401, detail="Only admin users can do that.")
     else:
-        await crud.backup()
+        return {
+            "auth_cache": principal_cache.stats(),
+            "response_cache": response_cache.stats(),
+            "password_pool": password_hasher.stats(),
+            "read_pool": read_pool.stats(),
+            "events": broker.stats(),
+            "subscribe_keys": await sub_keys.stats(),
+        }
@@ -1 +1 @@
-from .models import User, Journal, Entry, Keyword
+from .models import User, Journal, Entry, Keyword, Outbox, SubscribeKey
@@ -1,6 +1,9 @@
+from typing import Iterable, Optional
+
 from tortoise.fields import UUIDField, TextField, IntField, BooleanField, ReverseRelation, ForeignKeyRelation, \
     ForeignKeyField, CASCADE, DatetimeField, CharField, DateField
 from tortoise.models import Model
+from tortoise.backends.base.client import BaseDBAsyncClient
 
 
 class User(Model):
@@ -18,7 +21,25 @@ class User(Model):
     journals: ReverseRelation["Journal"]
 
 
-class Journal(Model):
+class Versioned(Model):
+    """For the clients that only sync what changed, see crud.get_changes"""
+    updated_at = DatetimeField(auto_now=True)
+    # Goes up by one every time it's saved
+    version = IntField(default=1)
+
+    class Meta:
+        abstract = True
+
+    async def save(self, using_db: Optional[BaseDBAsyncClient] = None, update_fields: Optional[Iterable[str]] = None,
+                   force_create: bool = False, force_update: bool = False) -> None:
+        if self._saved_in_db:
+            self.version += 1
+        if update_fields is not None:
+            update_fields = [*update_fields, "updated_at", "version"]
+        await super().save(using_db, update_fields, force_create, force_update)
+
+
+class Journal(Versioned):
     id = IntField(pk=True, index=True)
 
     user: ForeignKeyRelation[User] = ForeignKeyField("models.User", related_name="journals", on_delete=CASCADE)
@@ -29,10 +50,17 @@ class Journal(Model):
     # YYYY-MM-DD or None
     deleted_on = DateField(null=True)
 
+    # Goes up every time one of its entries changes, with `version` it's what the ETags are made from
+    entries_version = IntField(default=1)
+
     entries: ReverseRelation["Entry"]
 
+    class Meta:
+        # Journals are looked up by name for the user and the ones that changed
+        indexes = (("user_id", "name_lower"), ("user_id", "updated_at"))
+
 
-class Entry(Model):
+class Entry(Versioned):
     id = IntField(pk=True, index=True)
 
     journal: ForeignKeyRelation[Journal] = ForeignKeyField("models.Journal", related_name="entries", on_delete=CASCADE)
@@ -41,14 +69,46 @@ class Entry(Model):
     long = TextField(null=False)
 
     # YYYY-MM-DD HH:MM format in UTC timezone
-    date = DatetimeField(null=False)
+    date = DatetimeField(null=False, index=True)
     # YYYY-MM-DD or None
     deleted_on = DateField(null=True)
 
     keywords: ReverseRelation["Keyword"]
 
+    class Meta:
+        # The (not) deleted entries of a journal, entries by their short and the ones that changed
+        indexes = (("journal_id", "deleted_on"), ("journal_id", "short"), ("journal_id", "updated_at"))
 
-class Keyword(Model):
+
+class Keyword(Versioned):
     id = IntField(pk=True)
     entry: ForeignKeyRelation[Entry] = ForeignKeyField("models.Entry", related_name="keywords", on_delete=CASCADE)
     word = TextField(null=False)
+
+    class Meta:
+        # Searching entries by keyword and fetching the keywords of the entries returned
+        indexes = (("word", "entry_id"), ("entry_id",))
+
+
+class Outbox(Model):
+    """The last updates of every user, their id is the event id devices get. It's what a device that reconnects
+       missed and how the updates get to the other workers, see event_bus"""
+    id = IntField(pk=True)
+
+    user_id = CharField(max_length=36)
+    # The worker that sent it, it has already delivered it to its own subscribers
+    origin = CharField(max_length=32)
+    data = TextField(null=False)
+
+    created = DatetimeField(auto_now_add=True, index=True)
+
+    class Meta:
+        # The updates of a user after the last one a device got
+        indexes = (("user_id", "id"),)
+
+
+class SubscribeKey(Model):
+    """One time keys for /subscribe/ when they are shared between workers, see subscribe_keys.DatabaseKeyStore"""
+    key = CharField(max_length=64, pk=True)
+    user_id = CharField(max_length=36)
+    expires = DatetimeField(index=True)
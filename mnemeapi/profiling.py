@@ -0,0 +1,100 @@
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Tuple
+
+log = logging.getLogger("mnemeapi.profiling")
+
+# Tortoise logs every query it runs here at the debug level
+DB_LOGGER = "db_client"
+
+
+class QueryCounter:
+    """The SQL queries run while it's active, in order"""
+
+    def __init__(self):
+        self.queries: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.queries)
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+
+# The counters of the code that is running right now, the blocks can be nested
+_counters: ContextVar[Tuple[QueryCounter, ...]] = ContextVar("query_counters", default=())
+
+
+class _QueryHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        # How many blocks are counting and the level of the logger before the first one started
+        self.active = 0
+        self.previous_level = logging.NOTSET
+
+    def emit(self, record: logging.LogRecord) -> None:
+        counters = _counters.get()
+        if not counters or not isinstance(record.msg, str):
+            return
+        # Connections being opened and closed aren't queries
+        if record.msg.startswith(("Created connection", "Closed connection")):
+            return
+
+        query = str(record.args[0]) if record.args else record.msg
+        for counter in counters:
+            counter.queries.append(query)
+
+
+_handler = _QueryHandler()
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryCounter]:
+    """Count the queries run inside the block, only by this task and the ones it starts. For tests like:
+
+        with count_queries() as queries:
+            client.get("/journals")
+        assert len(queries) <= 3
+    """
+    logger = logging.getLogger(DB_LOGGER)
+    if _handler.active == 0:
+        _handler.previous_level = logger.level
+        logger.setLevel(logging.DEBUG)
+        logger.addHandler(_handler)
+    _handler.active += 1
+
+    counter = QueryCounter()
+    token = _counters.set(_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _counters.reset(token)
+        _handler.active -= 1
+        if _handler.active == 0:
+            logger.removeHandler(_handler)
+            logger.setLevel(_handler.previous_level)
+
+
+class QueryCountMiddleware:
+    """Logs how many queries every request ran and warns about the ones that ran more than `budget`.
+       Only meant for development, every query gets logged to find them."""
+
+    def __init__(self, app, budget: int):
+        self.app = app
+        self.budget = budget
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        with count_queries() as queries:
+            await self.app(scope, receive, send)
+
+        elapsed = (time.perf_counter() - start) * 1000
+        level = logging.WARNING if len(queries) > self.budget else logging.DEBUG
+        log.log(level, "%s %s ran %d queries in %.1fms", scope["method"], scope["path"], len(queries), elapsed)
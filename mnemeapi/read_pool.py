@@ -0,0 +1,133 @@
+# pylint: disable=protected-access
+import sqlite3
+import asyncio
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import aiosqlite
+from tortoise import Tortoise
+from tortoise.backends.sqlite.client import SqliteClient
+from tortoise.transactions import current_transaction_map
+
+
+class _PooledConnection:
+    """Hands out the first free connection of the pool and gives it back after the query"""
+
+    def __init__(self, free: "asyncio.Queue[aiosqlite.Connection]"):
+        self._free = free
+        self._connection: Optional[aiosqlite.Connection] = None
+
+    async def __aenter__(self) -> aiosqlite.Connection:
+        self._connection = await self._free.get()
+        return self._connection
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._free.put_nowait(self._connection)
+        self._connection = None
+
+
+class ReadOnlyClient(SqliteClient):
+    """A tortoise client with a few read only connections to the same database file instead of one.
+       Each one runs in its own thread, so reads can happen at the same time with WAL."""
+
+    def __init__(self, writer: SqliteClient, size: int):
+        super().__init__(writer.filename, connection_name=writer.connection_name, **writer.pragmas)
+        # For the few things GET requests have to write
+        self.writer = writer
+        # The journal mode belongs to the file and is already set by the writer
+        self.pragmas.pop("journal_mode", None)
+        self.pragmas.pop("journal_size_limit", None)
+        # Anything that tries to write fails instead of going behind the writer's back
+        self.pragmas["query_only"] = "ON"
+        self.size = size
+
+        self._connections: List[aiosqlite.Connection] = []
+        self._free: "asyncio.Queue[aiosqlite.Connection]" = asyncio.Queue()
+
+    async def create_connection(self, with_db: bool) -> None:
+        while len(self._connections) < self.size:
+            connection = aiosqlite.connect(self.filename, isolation_level=None)
+            connection.start()
+            await connection._connect()
+            connection._conn.row_factory = sqlite3.Row
+            for pragma, val in self.pragmas.items():
+                cursor = await connection.execute(f"PRAGMA {pragma}={val}")
+                await cursor.close()
+
+            self._connections.append(connection)
+            self._free.put_nowait(connection)
+
+    async def close(self) -> None:
+        for connection in self._connections:
+            await connection.close()
+        self._connections.clear()
+        self._free = asyncio.Queue()
+
+    @property
+    def free(self) -> int:
+        return self._free.qsize()
+
+    def acquire_connection(self) -> _PooledConnection:
+        return _PooledConnection(self._free)
+
+
+class ReadPool:
+    """Sends the queries made while `reading()` to read only connections, so they don't wait in line
+       behind the writes on the single connection tortoise has for sqlite."""
+
+    def __init__(self):
+        self.client: Optional[ReadOnlyClient] = None
+        self.connection_name = "default"
+
+    async def open(self, size: int, connection_name: str = "default") -> bool:
+        """Returns False if there's no point in a pool, like for PostgreSQL or an in memory database"""
+        writer = Tortoise.get_connection(connection_name)
+        if size <= 0 or not isinstance(writer, SqliteClient) or writer.filename == ":memory:":
+            return False
+
+        await self.close()
+        client = ReadOnlyClient(writer, size)
+        await client.create_connection(with_db=True)
+        self.client = client
+        self.connection_name = connection_name
+        return True
+
+    async def close(self) -> None:
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+
+    @contextmanager
+    def reading(self):
+        """Inside the block the models use the read only connections"""
+        if self.client is None:
+            yield
+            return
+
+        token = current_transaction_map[self.connection_name].set(self.client)
+        try:
+            yield
+        finally:
+            current_transaction_map[self.connection_name].reset(token)
+
+    def stats(self) -> Dict[str, int]:
+        if self.client is None:
+            return {"size": 0, "free": 0}
+        return {"size": self.client.size, "free": self.client.free}
+
+
+class ReadOnlyMiddleware:
+    """Runs GET and HEAD requests inside `pool.reading()`.
+       It's a plain ASGI middleware so the endpoint runs in the same context and sees the connection."""
+
+    def __init__(self, app, pool: ReadPool):
+        self.app = app
+        self.pool = pool
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        with self.pool.reading():
+            await self.app(scope, receive, send)
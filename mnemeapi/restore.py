@@ -0,0 +1,129 @@
+"""Put an sqlite backup back together: get a full backup and its increments from the backup storage, check and
+decompress them and replay the increments on the full backup, in order. The backup is the unix time it was taken.
+
+    $ python -m mnemeapi.restore 1600000000 restored.db
+    $ python -m mnemeapi.restore 1600000000 restored.db --until 1600100000
+    $ python -m mnemeapi.restore 1600000000 --fetch ./backup
+
+With --until only the increments taken up to that unix time are replayed. With --fetch the files are only checked and
+decompressed into a directory, for PostgreSQL backups that are restored with pg_restore. Stop the API before replacing
+the database in `db url` with the restored one.
+"""
+import json
+import shutil
+import sqlite3
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from . import backup_storage
+from .archive import fetch
+from .crud.backups import CHANGELOG_TABLE, INCREMENTS_SUFFIX
+from .crud.search import SEARCH_TABLE
+
+
+def restore(snapshot: Path, target: Path, until: Optional[int] = None) -> int:
+    """Copy `snapshot` to `target` and replay its increments taken up to `until` (all of them if it's None).
+       Returns how many were replayed."""
+    if target.exists():
+        raise FileExistsError(f"{target} already exists")
+
+    shutil.copyfile(str(snapshot), str(target))
+    conn = sqlite3.connect(str(target))
+    try:
+        replayed = _replay(conn, snapshot, until)
+        # The restored database starts a chain of its own with its first backup
+        if _has_table(conn, CHANGELOG_TABLE):
+            conn.execute(f"DELETE FROM {CHANGELOG_TABLE}")
+        if _has_table(conn, SEARCH_TABLE):
+            conn.execute(f"DELETE FROM {SEARCH_TABLE}")
+            conn.execute(f"INSERT INTO {SEARCH_TABLE}(rowid, short, long) SELECT id, short, long FROM entry")
+        conn.commit()
+    except Exception:
+        conn.close()
+        target.unlink()
+        raise
+
+    conn.close()
+    return replayed
+
+
+def _replay(conn: sqlite3.Connection, snapshot: Path, until: Optional[int]) -> int:
+    increments = sorted(snapshot.with_suffix(INCREMENTS_SUFFIX).glob("*.jsonl"))
+    if not increments:
+        return 0
+    if not _has_table(conn, CHANGELOG_TABLE):
+        raise ValueError(f"{snapshot.name} wasn't taken with incremental backups, its increments can't be replayed")
+
+    # Every row is put back as it was when the increment was taken, not in the order they changed,
+    # so for a moment an entry can be there before its journal
+    conn.execute("PRAGMA foreign_keys = OFF")
+    position = conn.execute("SELECT seq FROM sqlite_sequence WHERE name=?", [CHANGELOG_TABLE]).fetchone()
+    position = position[0] if position is not None else 0
+
+    replayed = 0
+    for path in increments:
+        header, lines = _read(path)
+        if until is not None and header["taken"] > until:
+            break
+        if header["last"] <= position:
+            # Already in the snapshot
+            continue
+        if header["first"] > position + 1:
+            raise ValueError(f"An increment before {path.name} is missing, "
+                             f"changes {position + 1} to {header['first'] - 1} aren't in any")
+
+        with conn:
+            for line in lines:
+                if "row" in line:
+                    columns = ", ".join(f'"{column}"' for column in line["row"])
+                    conn.execute(
+                        f'INSERT OR REPLACE INTO "{line["table"]}" ({columns}) '
+                        f'VALUES ({", ".join("?" for _ in line["row"])})',
+                        list(line["row"].values())
+                    )
+                else:
+                    (key, row_id), = line["deleted"].items()
+                    conn.execute(f'DELETE FROM "{line["table"]}" WHERE "{key}" = ?', [row_id])
+
+        position = header["last"]
+        replayed += 1
+
+    return replayed
+
+
+def _read(path: Path) -> Tuple[Dict, List[Dict]]:
+    """The header of an increment and its rows"""
+    with path.open(encoding="utf-8") as file:
+        header, *lines = [json.loads(line) for line in file]
+    return header, lines
+
+
+def _has_table(conn: sqlite3.Connection, table: str) -> bool:
+    return conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", [table]).fetchone() is not None
+
+
+def restore_backup(key: str, target: Path, until: Optional[int] = None) -> int:
+    """restore() for a backup in the backup storage"""
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot = asyncio.get_event_loop().run_until_complete(fetch(backup_storage, key, Path(directory)))
+        return restore(snapshot, target, until)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("backup", help="The unix time of a full backup")
+    parser.add_argument("target", type=Path, nargs="?", help="Where the restored database goes, it can't exist already")
+    parser.add_argument("--until", type=int, help="Only replay the increments taken up to this unix time")
+    parser.add_argument("--fetch", type=Path, help="Only check and decompress the files of the backup into here")
+    args = parser.parse_args()
+    if args.fetch is not None:
+        args.fetch.mkdir(parents=True, exist_ok=True)
+        fetched = asyncio.get_event_loop().run_until_complete(fetch(backup_storage, args.backup, args.fetch))
+        print(f"The backup is in {fetched}")
+    elif args.target is None:
+        parser.error("Where should it be restored to?")
+    else:
+        print(f"Replayed {restore_backup(args.backup, args.target, args.until)} increments into {args.target}")
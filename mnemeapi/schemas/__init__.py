@@ -1,6 +1,8 @@
 from .keyword import KeywordCreate, Keyword
-from .entry import EntryCreate, EntryUpdate, Entry
-from .journal import JournalCreate, Journal
-from .user import UserCreate, User, UserPassword, PubUser, AuthUser
+from .entry import EntryCreate, EntryUpdate, Entry, EntryPage, EntriesImported
+from .search import SearchResult
+from .journal import JournalCreate, Journal, JournalChange, JournalSummary
+from .sync import Changes
+from .user import UserCreate, User, UserPassword, PubUser, AuthUser, Principal
 from .token import TokenData, Token
 from .params import Params
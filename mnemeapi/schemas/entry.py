@@ -27,6 +27,21 @@ class Entry(EntryBase):
     keywords: List[Keyword] = []
     date: dt.datetime
     deleted_on: Optional[dt.date] = None
+    updated_at: Optional[dt.datetime] = None
+    version: int = 1
 
     class Config:
         orm_mode = True
+
+
+class EntryPage(PydanticModel):
+    entries: List[Entry]
+    # To get the next page, None when it was the last one
+    cursor: Optional[str] = None
+
+
+class EntriesImported(PydanticModel):
+    journal_id: int
+    count: int
+    # In the same order as they were sent
+    ids: List[int]
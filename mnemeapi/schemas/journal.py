@@ -1,5 +1,5 @@
 from typing import List, Optional
-from datetime import date
+from datetime import date, datetime
 
 from tortoise.contrib.pydantic import PydanticModel
 
@@ -18,6 +18,26 @@ class Journal(JournalBase):
     id: int
     entries: List[Entry] = []
     deleted_on: Optional[date] = None
+    updated_at: Optional[datetime] = None
+    version: int = 1
 
     class Config:
         orm_mode = True
+
+
+class JournalChange(JournalBase):
+    """A journal without its entries"""
+    id: int
+    deleted_on: Optional[date] = None
+    updated_at: datetime
+    version: int
+
+    class Config:
+        orm_mode = True
+
+
+class JournalSummary(JournalChange):
+    """A journal without its entries but how many there are"""
+    entry_count: int
+    # The date of its last entry, None if it doesn't have any
+    last_entry: Optional[datetime] = None
@@ -0,0 +1,11 @@
+from tortoise.contrib.pydantic import PydanticModel
+
+from . import Entry
+
+
+class SearchResult(PydanticModel):
+    entry: Entry
+    # Lower is a better match
+    rank: float
+    # Part of the text around the match, with the matched words in <b></b>
+    snippet: str
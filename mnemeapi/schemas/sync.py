@@ -0,0 +1,17 @@
+from typing import List, Optional
+
+from tortoise.contrib.pydantic import PydanticModel
+
+from . import Entry, JournalChange
+
+
+class Changes(PydanticModel):
+    # The deleted ones have `deleted_on` set
+    journals: List[JournalChange]
+    entries: List[Entry]
+    # To get the next changes, None when there's a `reset`
+    cursor: Optional[str]
+    # There are more changes right away, ask again with the new cursor
+    more: bool
+    # The cursor is too old to know what was deleted, the client has to start over without one
+    reset: bool = False
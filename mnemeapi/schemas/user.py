@@ -1,4 +1,7 @@
 from typing import List
+from uuid import UUID
+
+from pydantic import BaseModel  # pylint: disable=no-name-in-module
 from tortoise.contrib.pydantic import PydanticModel
 
 from . import Journal
@@ -41,3 +44,12 @@ class UserPassword(PydanticModel):
 class PubUser(UserBase):
     """So the journals of a user aren't shown when he is not logged in"""
     id: int
+
+
+class Principal(BaseModel):
+    """The authenticated user, just what is needed to authorize a request and none of their journals"""
+    id: UUID
+    username: str
+    tier: int = 0
+    encrypted: bool = False
+    admin: bool = False
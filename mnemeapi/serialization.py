@@ -0,0 +1,32 @@
+import json
+from datetime import date, datetime
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    # It's optional, without it the standard json module is used
+    orjson = None  # pylint: disable=invalid-name
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} can't be turned into JSON")
+
+
+def dumps(content: Any) -> bytes:
+    """Plain dicts and lists, like the ones from crud.get_journal_dicts, to the same JSON the response models give"""
+    if orjson is not None:
+        return orjson.dumps(content)
+
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"),
+                      default=_default).encode("utf-8")
+
+
+def render(content: Any) -> bytes:
+    """Response models (or anything else) to JSON the way FastAPI does it"""
+    return JSONResponse(jsonable_encoder(content)).body
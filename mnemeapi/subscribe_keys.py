@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import secrets
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from . import crud
+from .cache import TTLCache
+
+log = logging.getLogger("mnemeapi.subscribe_keys")
+
+
+class KeyStore(ABC):
+    """The one time keys from /subscribe_auth, each one is for a single /subscribe/ within `ttl` seconds.
+       At most `maxsize` keys are kept, when there are more the oldest ones stop working."""
+
+    def __init__(self, ttl: float = 60, maxsize: int = 10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+
+        self.issued = 0
+        self.redeemed = 0
+        self.rejected = 0
+
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._task = asyncio.ensure_future(self._sweep_every(self.ttl))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def issue(self, user_id: Any) -> str:
+        key = secrets.token_urlsafe(16)
+        await self._add(key, str(user_id))
+        self.issued += 1
+        return key
+
+    async def redeem(self, key: str) -> Optional[str]:
+        """The id of the user the key is for, None if it doesn't exist, expired or was already used"""
+        user_id = await self._pop(key)
+        if user_id is None:
+            self.rejected += 1
+        else:
+            self.redeemed += 1
+        return user_id
+
+    @abstractmethod
+    async def sweep(self) -> int:
+        """Remove the expired keys, returns how many were removed"""
+
+    @abstractmethod
+    async def size(self) -> int:
+        """How many keys are kept"""
+
+    async def stats(self) -> Dict[str, int]:
+        return {
+            "size": await self.size(),
+            "max_size": self.maxsize,
+            "issued": self.issued,
+            "redeemed": self.redeemed,
+            "rejected": self.rejected,
+        }
+
+    @abstractmethod
+    async def _add(self, key: str, user_id: str) -> None:
+        """Keep the key for `ttl` seconds"""
+
+    @abstractmethod
+    async def _pop(self, key: str) -> Optional[str]:
+        """Remove the key, the id of its user if it was there and hadn't expired"""
+
+    async def _sweep_every(self, seconds: float) -> None:
+        while True:
+            await asyncio.sleep(seconds)
+            try:
+                await self.sweep()
+            except Exception:  # pylint: disable=broad-except
+                log.exception("Couldn't remove the expired subscribe keys")
+
+
+class MemoryKeyStore(KeyStore):
+    """Only for this worker, for when there's a single one"""
+
+    def __init__(self, ttl: float = 60, maxsize: int = 10000):
+        super().__init__(ttl, maxsize)
+        self._keys = TTLCache(maxsize, ttl)
+
+    async def sweep(self) -> int:
+        return self._keys.sweep()
+
+    async def size(self) -> int:
+        return len(self._keys)
+
+    async def _add(self, key: str, user_id: str) -> None:
+        self._keys.set(key, user_id)
+
+    async def _pop(self, key: str) -> Optional[str]:
+        return self._keys.pop(key)
+
+
+class DatabaseKeyStore(KeyStore):
+    """In the database so any worker can redeem the keys of any other"""
+
+    async def sweep(self) -> int:
+        # tortoise saves dates and times in local time
+        return await crud.purge_subscribe_keys(datetime.now(), self.maxsize)
+
+    async def size(self) -> int:
+        return await crud.count_subscribe_keys()
+
+    async def _add(self, key: str, user_id: str) -> None:
+        await crud.add_subscribe_key(key, user_id, datetime.now() + timedelta(seconds=self.ttl))
+
+    async def _pop(self, key: str) -> Optional[str]:
+        return await crud.redeem_subscribe_key(key, datetime.now())
+
+
+def create_key_store(kind: str, ttl: float = 60, maxsize: int = 10000) -> KeyStore:
+    if kind == "memory":
+        return MemoryKeyStore(ttl, maxsize)
+    elif kind == "database":
+        return DatabaseKeyStore(ttl, maxsize)
+
+    raise ValueError(f"Unknown subscribe key store: {kind}")
@@ -0,0 +1,60 @@
+import os
+import asyncio
+from typing import Dict, List, Optional
+
+import pytest
+from fastapi.testclient import TestClient
+from tortoise.contrib.test import finalizer, initializer
+
+from mnemeapi import app
+from mnemeapi.crud import create_user, create_search_index, create_short_index
+from mnemeapi.schemas import UserCreate
+
+loop = asyncio.get_event_loop()
+client = TestClient(app)
+# To run the tests against PostgreSQL set it to something like postgres://postgres@localhost:5432/test_{}
+# A new database is created in place of {} and dropped at the end
+DB_URL = os.environ.get("MNEME_TEST_DB", "sqlite://:memory:")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def init_db(request):
+    initializer(
+        ["mnemeapi.models.models"],
+        db_url=DB_URL
+    )
+    loop.run_until_complete(create_short_index())
+    loop.run_until_complete(create_search_index())
+    # Create the admin user since it's a private instance
+    admin = UserCreate(username="admin", admin=True, encrypted=False, password="12345")
+    loop.run_until_complete(create_user(admin))
+
+    request.addfinalizer(finalizer)
+
+
+def log_in(username: str, password: str):
+    r = client.post(
+        "/login",
+        json={"username": username, "password": password}
+    )
+
+    data = r.json()
+    return "Bearer " + data["access_token"]
+
+
+def post_entry(token: str, jrnl_name: str, short: str, long: str = "text", date: str = "2020-06-01 12:00",
+               keywords: Optional[List[str]] = None):
+    """The response to adding an entry, by default its only keyword is its short"""
+    return client.post(
+        f"/journals/{jrnl_name}/entries",
+        headers={"Authorization": token},
+        json={"short": short, "long": long, "date": date,
+              "keywords": [{"word": word} for word in (keywords if keywords is not None else [short])]}
+    )
+
+
+def create_entry(token: str, jrnl_name: str, short: str, **fields) -> Dict:
+    """Add an entry that has to be accepted, see post_entry for the `fields`"""
+    r = post_entry(token, jrnl_name, short, **fields)
+    assert r.status_code == 201
+    return r.json()
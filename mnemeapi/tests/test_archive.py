@@ -0,0 +1,132 @@
+import os
+import json
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from mnemeapi.archive import store, fetch, retained, apply_retention
+from mnemeapi.backup_storage import LocalStorage
+
+loop = asyncio.get_event_loop()
+
+
+def timestamp(*args) -> int:
+    return int(datetime(*args).timestamp())
+
+
+def make_backup(root, name, content: bytes):
+    path = root / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return path
+
+
+def test_store_and_fetch(tmp_path):
+    root, storage = tmp_path / "local", LocalStorage(str(tmp_path / "stored"))
+    content = os.urandom(1000) + b"compresses well " * 10000
+    backup = make_backup(root, "1600000000.db", content)
+    increment = make_backup(root, "1600000000.increments/000000000005.jsonl", b'{"snapshot": "1600000000.db"}\n')
+
+    manifest = loop.run_until_complete(store(storage, backup, "gzip", 6, root=root))
+    loop.run_until_complete(store(storage, increment, "gzip", 6, root=root))
+    assert not backup.exists() and not increment.exists()
+
+    file, = manifest["files"]
+    assert file["name"] == "1600000000.db.gz"
+    assert file["original_size"] == len(content) > file["size"]
+    assert loop.run_until_complete(storage.list()) == [
+        "1600000000.db.gz",
+        "1600000000.increments/000000000005.jsonl.gz",
+        "1600000000.increments/000000000005.manifest.json",
+        "1600000000.manifest.json",
+    ]
+
+    fetched = tmp_path / "fetched"
+    fetched.mkdir()
+    snapshot = loop.run_until_complete(fetch(storage, "1600000000", fetched))
+    assert snapshot.read_bytes() == content
+    assert (fetched / "1600000000.increments" / "000000000005.jsonl").exists()
+
+    # A single flipped byte is noticed
+    stored = tmp_path / "stored" / "1600000000.db.gz"
+    corrupted = bytearray(stored.read_bytes())
+    corrupted[len(corrupted) // 2] ^= 1
+    stored.write_bytes(bytes(corrupted))
+    with pytest.raises(ValueError):
+        loop.run_until_complete(fetch(storage, "1600000000", tmp_path))
+
+
+class FailingStorage(LocalStorage):
+    """Like a bucket that goes away in the middle of a backup"""
+
+    async def put(self, name, source):
+        if name.endswith(".manifest.json"):
+            raise OSError("The storage isn't there")
+        await super().put(name, source)
+
+
+def test_failed_store_keeps_the_backup(tmp_path):
+    root = tmp_path / "local"
+    backup = make_backup(root, "1600000000.db", b"the only copy")
+
+    with pytest.raises(OSError):
+        loop.run_until_complete(store(FailingStorage(str(tmp_path / "stored")), backup, root=root))
+    assert backup.read_bytes() == b"the only copy"
+    assert [path.name for path in root.iterdir()] == ["1600000000.db"]
+
+
+def test_directories_and_no_compression(tmp_path):
+    root, storage = tmp_path / "local", LocalStorage(str(tmp_path / "local"))
+    make_backup(root, "1600000000/user.csv", b"id,username\n")
+    make_backup(root, "1600000000/entry.csv", b"id,short\n")
+
+    manifest = loop.run_until_complete(store(storage, root / "1600000000", "none", 0, root=root))
+    assert [file["name"] for file in manifest["files"]] == ["1600000000/entry.csv", "1600000000/user.csv"]
+    assert json.loads((root / "1600000000.manifest.json").read_text()) == manifest
+    assert (root / "1600000000" / "user.csv").read_bytes() == b"id,username\n"
+
+
+def test_grandfather_father_son():
+    now = datetime(2020, 6, 30, 12)
+    daily = [int((now - timedelta(days=day)).timestamp()) for day in range(120)]
+    twice_today = int((now - timedelta(hours=6)).timestamp())
+
+    kept = retained(daily + [twice_today], daily=7, weekly=4, monthly=3)
+    # The newest of each of the last 7 days, 4 weeks (the Sundays) and 3 months (their last days)
+    assert len(kept) == 7 + 2 + 2
+    assert twice_today not in kept
+    assert daily[0] in kept and daily[6] in kept and daily[7] not in kept
+    assert timestamp(2020, 6, 21, 12) in kept and timestamp(2020, 6, 14, 12) in kept
+    assert timestamp(2020, 6, 7, 12) not in kept
+    assert timestamp(2020, 5, 31, 12) in kept and timestamp(2020, 4, 30, 12) in kept
+    assert timestamp(2020, 3, 31, 12) not in kept
+
+    assert retained(daily, 0, 0, 0) == {daily[0]}
+    assert retained([], 7, 4, 6) == set()
+
+
+def test_retention_removes_the_increments_too(tmp_path):
+    root, storage = tmp_path / "local", LocalStorage(str(tmp_path / "stored"))
+    old, new = timestamp(2020, 1, 1), timestamp(2020, 6, 1)
+    for backup in (old, new):
+        loop.run_until_complete(store(storage, make_backup(root, f"{backup}.db", b"db"), root=root))
+        increment = make_backup(root, f"{backup}.increments/000000000001.jsonl", b"{}\n")
+        loop.run_until_complete(store(storage, increment, root=root))
+
+    assert loop.run_until_complete(apply_retention(storage, 1, 0, 0)) == [old]
+    assert all(name.startswith(str(new)) for name in loop.run_until_complete(storage.list()))
+    assert not (tmp_path / "stored" / f"{old}.increments").exists()
+
+
+def test_retention_of_backups_without_a_manifest(tmp_path):
+    root, storage = tmp_path / "local", LocalStorage(str(tmp_path / "local"))
+    # From before they were compressed, just the database
+    old, older = timestamp(2020, 5, 1), timestamp(2020, 1, 1)
+    for backup in (old, older):
+        make_backup(root, f"{backup}.db", b"db")
+    new = timestamp(2020, 6, 1)
+    loop.run_until_complete(store(storage, make_backup(root, f"{new}.db", b"db"), root=root))
+
+    assert loop.run_until_complete(apply_retention(storage, 1, 0, 2)) == [older]
+    assert loop.run_until_complete(storage.list()) == [f"{old}.db", f"{new}.db.gz", f"{new}.manifest.json"]
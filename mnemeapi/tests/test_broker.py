@@ -0,0 +1,107 @@
+import asyncio
+
+from starlette.requests import Request
+
+from mnemeapi import broker as app_broker
+from mnemeapi.broker import Broker
+from mnemeapi.utils import add_to_queue, updates_generator
+
+loop = asyncio.get_event_loop()
+
+
+def test_fan_out():
+    async def run():
+        broker = Broker(max_queue=10)
+        phone, laptop = broker.subscribe("user"), broker.subscribe("user")
+        other = broker.subscribe("other user")
+
+        assert broker.publish("user", {"n": 1}) == 2
+        assert await phone.get() == {"n": 1}
+        assert await laptop.get() == {"n": 1}
+        assert len(other) == 0
+
+        # Nobody is left behind holding the updates
+        broker.unsubscribe(phone)
+        broker.unsubscribe(laptop)
+        assert broker.subscribers("user") == 0
+        assert broker.publish("user", {"n": 2}) == 0
+        assert broker.stats()["users"] == 1
+
+    loop.run_until_complete(run())
+
+
+def test_slow_subscriber_drop_oldest():
+    async def run():
+        broker = Broker(max_queue=3)
+        slow = broker.subscribe("user")
+        for n in range(5):
+            broker.publish("user", {"n": n})
+
+        assert [(await slow.get())["n"] for _ in range(3)] == [2, 3, 4]
+        assert slow.dropped == 2
+        stats = broker.stats()
+        assert stats["dropped"] == 2
+        assert stats["published"] == 5
+
+    loop.run_until_complete(run())
+
+
+def test_slow_subscriber_disconnect():
+    async def run():
+        broker = Broker(max_queue=2, policy=Broker.DISCONNECT)
+        slow, fast = broker.subscribe("user"), broker.subscribe("user")
+        for n in range(3):
+            broker.publish("user", {"n": n})
+            await fast.get()
+
+        assert slow.closed
+        assert await slow.get() is None
+        assert broker.subscribers("user") == 1
+        assert broker.stats()["disconnected"] == 1
+
+    loop.run_until_complete(run())
+
+
+def test_stats():
+    broker = Broker(max_queue=5)
+    broker.subscribe("a")
+    broker.subscribe("a")
+    broker.subscribe("b")
+    broker.publish("a", {})
+    broker.publish("a", {})
+
+    stats = broker.stats()
+    assert stats["users"] == 2
+    assert stats["subscribers"] == 3
+    assert stats["queued"] == 4
+    assert stats["max_queue_depth"] == 2
+
+
+def test_updates_generator_cleans_up_on_disconnect():
+    async def run():
+        disconnected = asyncio.Event()
+
+        async def receive():
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        request = Request({"type": "http"}, receive)
+        subscription = app_broker.subscribe("device owner")
+        updates = updates_generator(subscription, request)
+
+        await add_to_queue("device owner", event="create", changed_type="journal", data={"id": 1})
+        update = await updates.__anext__()
+        assert update["data"] == str({"type": "journal", "data": {"id": 1}})
+
+        # The device goes away while the generator waits for the next update
+        next_update = asyncio.ensure_future(updates.__anext__())
+        await asyncio.sleep(0)
+        disconnected.set()
+        try:
+            await asyncio.wait_for(next_update, 1)
+        except StopAsyncIteration:
+            pass
+
+        assert app_broker.subscribers("device owner") == 0
+
+    loop.run_until_complete(run())
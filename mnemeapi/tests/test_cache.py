@@ -0,0 +1,83 @@
+import time
+
+from mnemeapi.cache import TTLCache
+
+
+def test_lru_eviction():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+
+    # "b" is now the least recently used
+    cache.set("c", 3)
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_expiry():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("a", 1, ttl=0.01)
+    cache.set("b", 2)
+    # An item can't outlive the ttl of the cache
+    cache.set("c", 3, ttl=600)
+
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert cache.sweep() == 0
+    assert "c" in cache
+
+    # Already expired items are never stored
+    cache.set("d", 4, ttl=-5)
+    assert "d" not in cache
+
+
+def test_invalidate_owner():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("token1", "user1", owner="1")
+    cache.set("token2", "user1", owner="1")
+    cache.set("token3", "user2", owner="2")
+
+    assert cache.invalidate("1") == 2
+    assert cache.get("token1") is None
+    assert cache.get("token2") is None
+    assert cache.get("token3") == "user2"
+    assert cache.invalidate("1") == 0
+
+
+def test_counters():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("a")
+    cache.get("b")
+
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["size"] == 1
+
+
+def test_max_bytes():
+    cache = TTLCache(maxsize=10, ttl=60, max_bytes=100)
+    cache.set("a", b"a" * 40, owner="1", size=40)
+    cache.set("b", b"b" * 40, owner="2", size=40)
+    assert cache.get("a") is not None
+
+    # "b" is the least recently used, it makes room
+    cache.set("c", b"c" * 40, size=40)
+    assert "b" not in cache
+    assert cache.bytes == 80
+
+    # Too big to ever fit, nothing else is dropped for it
+    cache.set("d", b"d" * 101, size=101)
+    assert "d" not in cache
+    assert "a" in cache and "c" in cache
+
+    cache.invalidate("1")
+    assert cache.bytes == 40
+    cache.clear()
+    assert cache.bytes == 0
@@ -0,0 +1,93 @@
+import asyncio
+import zlib
+from typing import Dict, List
+
+from starlette.datastructures import Headers
+from starlette.responses import Response, StreamingResponse
+from sse_starlette.sse import EventSourceResponse
+
+from mnemeapi.compression import CompressionMiddleware, choose_encoding
+
+loop = asyncio.get_event_loop()
+BODY = b'{"long": "' + b"a lot of text that repeats itself " * 100 + b'"}'
+
+
+def call(response: Response, accept_encoding: str = "gzip, deflate") -> List[Dict]:
+    """The messages the middleware sends for the response"""
+    async def app(scope, receive, send):
+        await response(scope, receive, send)
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    async def receive():
+        return {"type": "http.request"}
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    middleware = CompressionMiddleware(app, encodings=["gzip"], minimum_size=500, level=6)
+    loop.run_until_complete(middleware(scope, receive, send))
+    return messages
+
+
+def test_choose_encoding():
+    assert choose_encoding("gzip, deflate, br", ["br", "gzip"]) == "br"
+    assert choose_encoding("br;q=0, gzip;q=0.5", ["br", "gzip"]) == "gzip"
+    assert choose_encoding("*", ["gzip"]) == "gzip"
+    assert choose_encoding("gzip;q=0", ["gzip"]) is None
+    assert choose_encoding("", ["gzip"]) is None
+
+
+def test_compresses_big_responses():
+    start, body = call(Response(BODY, media_type="application/json", headers={"ETag": '"abc"'}))
+    headers = Headers(raw=start["headers"])
+    assert headers["content-encoding"] == "gzip"
+    assert headers["vary"] == "Accept-Encoding"
+    assert int(headers["content-length"]) == len(body["body"]) < len(BODY)
+    # Not the same bytes the ETag was made for any more
+    assert headers["etag"] == 'W/"abc"'
+    assert zlib.decompress(body["body"], 16 + zlib.MAX_WBITS) == BODY
+
+
+def test_leaves_the_rest_alone():
+    small = b'{"short": "text"}'
+    for response, accept_encoding, vary in [
+            (Response(small, media_type="application/json"), "gzip", True),
+            (Response(BODY, media_type="application/json"), "identity", True),
+            (Response(BODY, media_type="image/png"), "gzip", False),
+    ]:
+        start, body = call(response, accept_encoding)
+        headers = Headers(raw=start["headers"])
+        assert "content-encoding" not in headers
+        # The ones that would have been compressed for another client
+        assert (headers.get("vary") == "Accept-Encoding") is vary
+        assert body["body"] == response.body
+
+
+def test_streaming_a_chunk_at_a_time():
+    chunks = [b"line %d " % n * 50 + b"\n" for n in range(5)]
+
+    async def lines():
+        for chunk in chunks:
+            yield chunk
+
+    start, *bodies = call(StreamingResponse(lines(), media_type="application/x-ndjson"))
+    headers = Headers(raw=start["headers"])
+    assert headers["content-encoding"] == "gzip"
+    assert "content-length" not in headers
+
+    # Every chunk can be read as soon as it arrives, nothing waits for the end of the stream
+    decompress = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for chunk, body in zip(chunks, bodies):
+        assert decompress.decompress(body["body"]) == chunk
+    assert not bodies[-1].get("more_body", False)
+
+
+def test_event_stream_isnt_compressed():
+    async def events():
+        yield {"event": "update", "data": "x" * 1000}
+
+    start, *bodies = call(EventSourceResponse(events(), ping=60))
+    assert "content-encoding" not in Headers(raw=start["headers"])
+    assert b"x" * 1000 in b"".join(body.get("body", b"") for body in bodies)
@@ -0,0 +1,187 @@
+import asyncio
+import multiprocessing
+from datetime import datetime, timedelta
+
+from tortoise import Tortoise
+
+from starlette.requests import Request
+
+from mnemeapi import crud, broker as app_broker, event_bus as app_bus
+from mnemeapi.broker import Broker
+from mnemeapi.cache import TTLCache
+from mnemeapi.models import Outbox
+from mnemeapi.event_bus import OutboxBus, MemoryBus, create_event_bus
+from mnemeapi.utils import missed_updates, updates_generator
+
+loop = asyncio.get_event_loop()
+
+
+def test_create_event_bus():
+    assert isinstance(create_event_bus("memory", Broker()), MemoryBus)
+    assert isinstance(create_event_bus("outbox", Broker()), OutboxBus)
+
+
+def test_outbox_between_buses():
+    async def run():
+        one, other = OutboxBus(Broker()), OutboxBus(Broker())
+        one._last_id = other._last_id = await crud.get_last_outbox_id()  # pylint: disable=protected-access
+        phone, laptop = one.broker.subscribe("user"), other.broker.subscribe("user")
+
+        event_id = await one.publish("user", {"event": "create", "data": "{'type': 'journal'}"})
+        # Its own device gets it right away, the other worker once it checks the outbox
+        assert len(phone) == 1
+        assert len(laptop) == 0
+        assert await other.poll() == 1
+        assert await laptop.get() == {"event": "create", "data": "{'type': 'journal'}", "id": event_id}
+
+        # Nobody gets their own updates twice, nor the same update again
+        assert await one.poll() == 0
+        assert await other.poll() == 0
+
+        assert await crud.purge_outbox(datetime.now() + timedelta(seconds=1)) >= 1
+        assert await crud.get_outbox_after(0) == []
+
+    loop.run_until_complete(run())
+
+
+def test_outbox_committed_late():
+    async def run():
+        bus = OutboxBus(Broker())
+        last = bus._last_id = await crud.get_last_outbox_id()  # pylint: disable=protected-access
+        laptop = bus.broker.subscribe("user")
+
+        # On PostgreSQL the first one can commit after the second one
+        await Outbox.create(id=last + 2, user_id="user", origin="other", data='{"event": "edit", "data": "2"}')
+        assert await bus.poll() == 1
+        await Outbox.create(id=last + 1, user_id="user", origin="other", data='{"event": "create", "data": "1"}')
+        assert await bus.poll() == 1
+        assert await bus.poll() == 0
+        assert [(await laptop.get())["id"] for _ in range(2)] == [last + 2, last + 1]
+
+        # Rolled back, it's not looked for forever
+        await Outbox.create(id=last + 4, user_id="user", origin="other", data='{"event": "edit", "data": "4"}')
+        bus.gap_timeout = 0
+        assert await bus.poll() == 1
+        assert await bus.poll() == 0
+        assert not bus._gaps  # pylint: disable=protected-access
+
+    loop.run_until_complete(run())
+
+
+def test_invalidate_other_workers():
+    async def run():
+        one, other = OutboxBus(Broker(), caches=[TTLCache()]), OutboxBus(Broker(), caches=[TTLCache()])
+        one._last_id = other._last_id = await crud.get_last_outbox_id()  # pylint: disable=protected-access
+        for bus in (one, other):
+            bus.caches[0].set("token", "renamed user", owner="renamed")
+            bus.caches[0].set("other token", "someone else", owner="someone else")
+        laptop = other.broker.subscribe("renamed")
+
+        await one.invalidate("renamed")
+        assert "token" not in one.caches[0]
+        assert "token" in other.caches[0]
+        assert await other.poll() == 1
+        assert "token" not in other.caches[0]
+        assert "other token" in other.caches[0]
+
+        # It's not an update, the devices of the user never see it
+        assert len(laptop) == 0
+        assert await crud.get_user_events("renamed", 0, 10) == []
+
+    loop.run_until_complete(run())
+
+
+def test_replay():
+    async def run():
+        bus = MemoryBus(Broker(), replay_size=3)
+        ids = [await bus.publish("replay user", {"event": "create", "data": str(n)}) for n in range(5)]
+
+        # Only the last 3 are kept
+        assert await bus.replay("replay user", ids[0]) is None
+        assert await bus.replay("replay user", ids[2]) == [
+            {"event": "create", "data": "3", "id": ids[3]},
+            {"event": "create", "data": "4", "id": ids[4]},
+        ]
+        assert await bus.replay("replay user", ids[4]) == []
+        # Not an update of this user
+        assert await bus.replay("someone else", ids[2]) is None
+
+    loop.run_until_complete(run())
+
+
+def test_reconnect_with_last_event_id():
+    async def run():
+        first = await app_bus.publish("phone owner", {"event": "create", "data": "1"})
+        second = await app_bus.publish("phone owner", {"event": "edit", "data": "2"})
+        assert await missed_updates("phone owner", None) == []
+        assert await missed_updates("phone owner", second) == []
+
+        # The phone reconnects with the first update and an update comes in while the missed ones are looked up
+        subscription = app_broker.subscribe("phone owner")
+        missed = await missed_updates("phone owner", first)
+        third = await app_bus.publish("phone owner", {"event": "delete", "data": "3"})
+        updates = updates_generator(subscription, Request({"type": "http"}, asyncio.Event().wait), missed)
+        assert [(await updates.__anext__())["id"] for _ in range(2)] == [second, third]
+        await updates.aclose()
+
+        # Nothing to replay from, everything has to be fetched again
+        reset, = await missed_updates("phone owner", 0)
+        assert reset["event"] == "reset"
+        assert reset["id"] == third
+
+    loop.run_until_complete(run())
+
+
+async def _worker(db_url: str, role: str, events: "multiprocessing.Queue", start: "multiprocessing.Event"):
+    await Tortoise.init(db_url=db_url, modules={"models": ["mnemeapi.models.models"]})
+    if role == "setup":
+        await Tortoise.generate_schemas()
+        await Tortoise.close_connections()
+        return
+
+    bus = OutboxBus(Broker(), poll_interval=0.05)
+    await bus.start()
+    try:
+        if role == "publisher":
+            await loop.run_in_executor(None, start.wait, 10)
+            await bus.publish("user", {"event": "create", "data": "{'type': 'journal', 'data': {'id': 1}}"})
+        else:
+            subscription = bus.broker.subscribe("user")
+            events.put("ready")
+            events.put(await asyncio.wait_for(subscription.get(), 10))
+    finally:
+        await bus.stop()
+        await Tortoise.close_connections()
+
+
+def run_worker(*args):
+    asyncio.get_event_loop().run_until_complete(_worker(*args))
+
+
+def test_outbox_across_processes(tmp_path):
+    db_url = f"sqlite://{tmp_path / 'mneme.db'}"
+    # Like `uvicorn --workers 3`, every worker has its own broker and only shares the database
+    context = multiprocessing.get_context("spawn")
+    events, start = context.Queue(), context.Event()
+    setup = context.Process(target=run_worker, args=(db_url, "setup", events, start))
+    setup.start()
+    setup.join(30)
+    assert setup.exitcode == 0
+
+    workers = [context.Process(target=run_worker, args=(db_url, role, events, start))
+               for role in ("subscriber", "subscriber", "publisher")]
+    for worker in workers:
+        worker.start()
+
+    try:
+        assert [events.get(timeout=30) for _ in range(2)] == ["ready", "ready"]
+        start.set()
+        received = [events.get(timeout=30) for _ in range(2)]
+        assert received[0] == received[1]
+        assert received[0]["data"] == "{'type': 'journal', 'data': {'id': 1}}"
+        assert received[0]["id"] > 0
+    finally:
+        for worker in workers:
+            worker.join(10)
+            if worker.is_alive():
+                worker.terminate()
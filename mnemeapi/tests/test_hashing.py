@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from mnemeapi.hashing import PasswordHasher
+
+loop = asyncio.get_event_loop()
+context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=4)
+
+
+@pytest.mark.parametrize("processes", [False, True])
+def test_hash_and_verify(processes):
+    hasher = PasswordHasher(context, workers=1, processes=processes)
+    hashed = loop.run_until_complete(hasher.hash("12345"))
+
+    assert context.verify("12345", hashed)
+    assert loop.run_until_complete(hasher.verify("12345", hashed)) is True
+    assert loop.run_until_complete(hasher.verify("54321", hashed)) is False
+    hasher.shutdown()
+
+
+def test_full_queue_is_rejected():
+    hasher = PasswordHasher(context, workers=1, max_waiting=1)
+
+    async def storm():
+        return await asyncio.gather(*[hasher.hash("12345") for _ in range(4)], return_exceptions=True)
+
+    results = loop.run_until_complete(storm())
+    rejected = [r for r in results if isinstance(r, HTTPException)]
+
+    # One is hashed right away, one waits for it and the rest are turned away
+    assert len(rejected) == 2
+    assert all(r.status_code == 503 for r in rejected)
+    assert hasher.stats()["rejected"] == 2
+    assert hasher.queue_depth == 0
+    hasher.shutdown()
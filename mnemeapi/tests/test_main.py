@@ -2,30 +2,12 @@ import random
 import asyncio
 
 from fastapi.testclient import TestClient
-import pytest
-from tortoise.contrib.test import finalizer, initializer
 
 from mnemeapi import app
-from mnemeapi.crud import create_user
-from mnemeapi.schemas import UserCreate
+from mnemeapi.crud import get_principal, get_user_by_username
+from mnemeapi.schemas import Principal
 
 loop = asyncio.get_event_loop()
-
-
-@pytest.fixture(scope="session", autouse=True)
-def init_db(request):
-    db_url = "sqlite://:memory:"
-    initializer(
-        ["mnemeapi.models.models"],
-        db_url=db_url
-    )
-    # Create the admin user since it's a private instance
-    admin = UserCreate(username="admin", admin=True, encrypted=False, password="12345")
-    loop.run_until_complete(create_user(admin))
-
-    request.addfinalizer(finalizer)
-
-
 client = TestClient(app)
 
 
@@ -73,6 +55,16 @@ def test_create_user():
     assert user_id in [user["id"] for user in data]
 
 
+def test_get_principal():
+    db_user = loop.run_until_complete(get_user_by_username("admin"))
+    principal = loop.run_until_complete(get_principal(str(db_user.id)))
+
+    assert isinstance(principal, Principal)
+    assert principal.id == db_user.id
+    assert principal.admin is True
+    assert not hasattr(principal, "journals")
+
+
 def test_create_jrnl():
     token = log_in("test1", "12345")
 
@@ -243,9 +235,24 @@ def test_find_entries():
 
     assert r.status_code == 200
     data = r.json()
-    assert len(data) == 3
-    assert data[0]["short"] in ["entry_1", "entry_3"]
-    assert data[1]["short"] in ["entry_1", "entry_3"]
+    # entry_3 has both keywords but it must only be returned once
+    assert len(data) == 2
+    assert {entry["short"] for entry in data} == {"entry_1", "entry_3"}
+
+    # Paging applies to the matching entries, not to all the entries of the user
+    r = client.get(
+        "/journals/entries?keywords=word_1&keywords=a+keyword&method=or&skip=1&limit=1",
+        headers={"Authorization": token}
+    )
+    assert r.status_code == 200
+    assert [entry["short"] for entry in r.json()] == ["entry_3"]
+
+    r = client.get(
+        "/journals/entries?keywords=word_1&keywords=A+keyword&method=and&limit=1",
+        headers={"Authorization": token}
+    )
+    assert r.status_code == 200
+    assert [entry["short"] for entry in r.json()] == ["entry_3"]
 
 
 def test_update_entry():
@@ -416,6 +423,13 @@ def test_delete_user():
     )
     assert r.status_code == 204
 
+    # The token of a deleted user must stop working right away
+    r = client.get(
+        "/subscribe_auth",
+        headers={"Authorization": token}
+    )
+    assert r.status_code == 401
+
     r = client.get(
         "/users"
     )
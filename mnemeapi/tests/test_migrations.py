@@ -0,0 +1,109 @@
+import asyncio
+from typing import List
+
+import pytest
+from tortoise.backends.sqlite.client import SqliteClient
+
+from mnemeapi import crud, schemas
+from mnemeapi.crud.migrations import _add_columns
+from mnemeapi.models import Entry, Keyword, User
+from mnemeapi.profiling import count_queries
+
+from .conftest import DB_URL
+
+# The query plans and the catalog are sqlite's
+pytestmark = pytest.mark.skipif(not DB_URL.startswith("sqlite"), reason="Only for sqlite")
+loop = asyncio.get_event_loop()
+
+
+def query_plan(sql: str) -> str:
+    client = Entry._meta.db
+    _, rows = loop.run_until_complete(client.execute_query(f"EXPLAIN QUERY PLAN {sql}"))
+    return "\n".join(row["detail"] for row in rows)
+
+
+def indexes_of(table: str) -> List[str]:
+    client = Entry._meta.db
+    _, rows = loop.run_until_complete(client.execute_query(
+        "SELECT name FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL", [table]
+    ))
+    return sorted(row["name"] for row in rows)
+
+
+def test_migrate_creates_missing_indexes():
+    client = Entry._meta.db
+    indexes = indexes_of("entry")
+    assert indexes
+
+    # A database from before the indexes were added
+    for index in indexes:
+        loop.run_until_complete(client.execute_script(f'DROP INDEX "{index}"'))
+    assert indexes_of("entry") == []
+
+    loop.run_until_complete(crud.migrate())
+    assert indexes_of("entry") == indexes
+
+    # Running it again doesn't change anything
+    loop.run_until_complete(crud.migrate())
+    assert indexes_of("entry") == indexes
+
+
+def test_find_entries_uses_indexes():
+    user = loop.run_until_complete(crud.get_user_by_username("admin"))
+    params = schemas.Params(method="and")
+
+    with count_queries() as queries:
+        loop.run_until_complete(crud.get_entries(user.id, params, ["word1", "word2"], None, None, None))
+
+    search = next(q for q in queries.queries if "HAVING" in q)
+    assert "INDEX idx_keyword_word" in query_plan(search)
+
+
+def test_get_journal_by_name_uses_index():
+    user = loop.run_until_complete(crud.get_user_by_username("admin"))
+
+    with count_queries() as queries:
+        loop.run_until_complete(crud.get_jrnl_by_name(user.id, "journal_1"))
+
+    plan = query_plan(queries.queries[0])
+    assert "INDEX idx_journal_user_id" in plan
+    assert "name_lower=?" in plan
+
+
+def test_migrate_adds_new_columns():
+    async def run():
+        # A database from before the tables had updated_at and version
+        client = SqliteClient(":memory:", connection_name="old")
+        await client.create_connection(with_db=True)
+        await client.execute_script("CREATE TABLE keyword (id INTEGER PRIMARY KEY, entry_id INT, word TEXT)")
+        await client.execute_insert("INSERT INTO keyword (entry_id, word) VALUES (?, ?)", [1, "old"])
+
+        await _add_columns(client, Keyword)
+        _, rows = await client.execute_query("SELECT * FROM keyword")
+        await client.close()
+        return dict(rows[0])
+
+    row = loop.run_until_complete(run())
+    assert row["word"] == "old"
+    assert row["version"] == 1
+    assert str(row["updated_at"]).startswith("1970-01-01")
+
+
+def test_new_column_defaults_have_their_type():
+    async def run():
+        # A user from before the tiers and encryption
+        client = SqliteClient(":memory:", connection_name="old")
+        await client.create_connection(with_db=True)
+        await client.execute_script('CREATE TABLE "user" (id CHAR(36) PRIMARY KEY, username TEXT, hashed_password TEXT)')
+        await client.execute_insert('INSERT INTO "user" VALUES (?, ?, ?)', ["1", "old", "-"])
+
+        await _add_columns(client, User)
+        _, rows = await client.execute_query('SELECT *, typeof(tier) AS tier_type, typeof(admin) AS admin_type '
+                                             'FROM "user"')
+        await client.close()
+        return dict(rows[0])
+
+    row = loop.run_until_complete(run())
+    assert (row["tier"], row["tier_type"]) == (0, "integer")
+    assert (row["admin"], row["admin_type"]) == (0, "integer")
+    assert row["encrypted"] == 0
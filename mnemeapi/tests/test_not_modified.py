@@ -0,0 +1,82 @@
+from mnemeapi import response_cache
+from mnemeapi.profiling import count_queries
+
+from .conftest import client, log_in, create_entry
+
+
+def test_journal_not_modified():
+    token = log_in("admin", "12345")
+    r = client.post("/journals", headers={"Authorization": token}, json={"name": "Polled"})
+    assert r.status_code == 201
+    create_entry(token, "polled", "first")
+
+    r = client.get("/journals/polled", headers={"Authorization": token})
+    assert r.status_code == 200
+    etag = r.headers["ETag"]
+    assert [entry["short"] for entry in r.json()["entries"]] == ["first"]
+
+    # Only the journal itself is looked at
+    with count_queries() as queries:
+        r = client.get("/journals/polled", headers={"Authorization": token, "If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.headers["ETag"] == etag
+    assert not [query for query in queries.queries if 'FROM "entry"' in query or 'FROM "keyword"' in query]
+    # Weak or in a list, it's the same
+    r = client.get("/journals/polled", headers={"Authorization": token, "If-None-Match": f'"other", W/{etag}'})
+    assert r.status_code == 304
+
+    # A new entry changes it
+    create_entry(token, "polled", "second")
+    r = client.get("/journals/polled", headers={"Authorization": token, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+    assert [entry["short"] for entry in r.json()["entries"]] == ["first", "second"]
+
+
+def test_entry_not_modified():
+    token = log_in("admin", "12345")
+    entry = create_entry(token, "polled", "third")
+    url = f"/journals/polled/{entry['id']}"
+
+    r = client.get(url, headers={"Authorization": token})
+    assert r.status_code == 200
+    etag = r.headers["ETag"]
+    assert client.get(url, headers={"Authorization": token, "If-None-Match": etag}).status_code == 304
+
+    r = client.put(url, headers={"Authorization": token}, json={
+        "short": "third", "long": "edited", "date": "2020-06-01 12:00", "keywords": [], "journal_id": entry["journal_id"]
+    })
+    assert r.status_code == 200
+    r = client.get(url, headers={"Authorization": token, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.json()["long"] == "edited"
+
+    r = client.get("/journals/polled/123456", headers={"Authorization": token})
+    assert r.status_code == 404
+
+
+def test_journals_cached():
+    token = log_in("admin", "12345")
+    r = client.get("/journals", headers={"Authorization": token})
+    assert r.status_code == 200
+    etag = r.headers["ETag"]
+
+    # The second time it comes from the cache, only the versions of the journals are read
+    hits = response_cache.hits
+    with count_queries() as queries:
+        cached = client.get("/journals", headers={"Authorization": token})
+    assert response_cache.hits == hits + 1
+    assert cached.content == r.content
+    assert not [query for query in queries.queries if 'FROM "entry"' in query]
+
+    # Anything that gets sent to the devices of the user clears their cache
+    assert len(response_cache) > 0
+    r = client.put("/journals/polled", headers={"Authorization": token}, params={"new_name": "Polled again"})
+    assert r.status_code == 200
+    assert len(response_cache) == 0
+
+    r = client.get("/journals", headers={"Authorization": token, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert "Polled again" in [jrnl["name"] for jrnl in r.json()]
+    r = client.get("/journals", headers={"Authorization": token, "If-None-Match": r.headers["ETag"]})
+    assert r.status_code == 304
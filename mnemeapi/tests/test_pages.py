@@ -0,0 +1,68 @@
+from .conftest import client, log_in, create_entry
+
+
+def test_journals_without_entries():
+    admin_token = log_in("admin", "12345")
+    r = client.post(
+        "/users",
+        json={"username": "pager", "password": "12345", "encrypted": False},
+        headers={"Authorization": admin_token},
+    )
+    assert r.status_code == 201
+
+    token = log_in("pager", "12345")
+    for name in ("Full", "Empty"):
+        r = client.post("/journals", headers={"Authorization": token}, json={"name": name})
+        assert r.status_code == 201
+    create_entry(token, "full", "first", date="2020-06-01 12:00")
+    create_entry(token, "full", "last", date="2020-06-03 12:00")
+    deleted = create_entry(token, "full", "deleted", date="2020-06-05 12:00")
+    r = client.delete(f"/journals/full/{deleted['id']}", headers={"Authorization": token})
+    assert r.status_code == 204
+
+    r = client.get("/journals", headers={"Authorization": token}, params={"embed": "none"})
+    assert r.status_code == 200
+    full, empty = r.json()
+    assert "entries" not in full
+    assert full["name"] == "Full"
+    assert full["entry_count"] == 2
+    assert full["last_entry"].startswith("2020-06-03")
+    assert empty["entry_count"] == 0
+    assert empty["last_entry"] is None
+
+    # By default they come with their entries and their keywords, still without the deleted ones
+    r = client.get("/journals", headers={"Authorization": token})
+    full, empty = r.json()
+    assert [(entry["short"], entry["keywords"][0]["word"]) for entry in full["entries"]] == \
+        [("first", "first"), ("last", "last")]
+    assert empty["entries"] == []
+
+    r = client.get("/journals", headers={"Authorization": token}, params={"embed": "everything"})
+    assert r.status_code == 400
+
+
+def test_entries_of_journal():
+    token = log_in("pager", "12345")
+    r = client.post("/journals", headers={"Authorization": token}, json={"name": "Paged"})
+    assert r.status_code == 201
+    # Some of them on the same date, so the pages can't just go by date
+    ids = [create_entry(token, "paged", f"entry {n}", date=f"2020-06-0{n // 2 + 1} 12:00")["id"]
+           for n in range(7)]
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 3} if cursor is None else {"limit": 3, "cursor": cursor}
+        r = client.get("/journals/paged/entries", headers={"Authorization": token}, params=params)
+        assert r.status_code == 200
+        page = r.json()
+        assert len(page["entries"]) <= 3
+        seen += [entry["id"] for entry in page["entries"]]
+        cursor = page["cursor"]
+        if cursor is None:
+            break
+    assert seen == ids
+
+    r = client.get("/journals/paged/entries", headers={"Authorization": token}, params={"cursor": "nope"})
+    assert r.status_code == 400
+    r = client.get("/journals/nope/entries", headers={"Authorization": token})
+    assert r.status_code == 404
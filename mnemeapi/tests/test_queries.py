@@ -0,0 +1,80 @@
+import pytest
+
+from mnemeapi import response_cache
+from mnemeapi.profiling import count_queries
+
+from .conftest import client, log_in
+
+# How many queries each endpoint can run at most, no matter how many journals and entries there are
+BUDGETS = [
+    ("/users", {}, 1),
+    # The versions of the journals for the ETag, then the journals (and their entries and keywords)
+    ("/journals", {}, 4),
+    ("/journals", {"embed": "none"}, 2),
+    ("/journals/one", {}, 4),
+    ("/journals/one/entries", {}, 3),
+    ("/journals/entries", {"keywords": "a", "method": "or"}, 3),
+    ("/sync", {}, 4),
+    ("/search", {"q": "text"}, 3),
+    ("/subscribe_auth", {}, 0),
+]
+
+
+@pytest.fixture(scope="module")
+def token():
+    admin_token = log_in("admin", "12345")
+    r = client.post(
+        "/users",
+        json={"username": "counter", "password": "12345", "encrypted": False},
+        headers={"Authorization": admin_token},
+    )
+    assert r.status_code == 201
+
+    token = log_in("counter", "12345")
+    for name in ("one", "two", "three"):
+        r = client.post("/journals", headers={"Authorization": token}, json={"name": name})
+        assert r.status_code == 201
+        for n in range(5):
+            r = client.post(
+                f"/journals/{name}/entries",
+                headers={"Authorization": token},
+                json={"short": f"entry {n}", "long": "text", "date": "2020-06-01 12:00",
+                      "keywords": [{"word": "a"}, {"word": "b"}]}
+            )
+            assert r.status_code == 201
+
+    return token
+
+
+@pytest.mark.parametrize("url, params, budget", BUDGETS)
+def test_query_budget(token, url, params, budget):
+    # Once so the user is in the auth cache, like it would be for a client that keeps making requests
+    client.get(url, headers={"Authorization": token}, params=params)
+    # What it costs to make the response, not to find it in the cache
+    response_cache.clear()
+
+    with count_queries() as queries:
+        r = client.get(url, headers={"Authorization": token}, params=params)
+    assert r.status_code == 200
+    assert len(queries) <= budget, "\n".join(queries.queries)
+
+
+def test_read_entry_query_budget(token):
+    entry_id = client.get("/journals/one/entries", headers={"Authorization": token}).json()["entries"][0]["id"]
+    response_cache.clear()
+
+    with count_queries() as queries:
+        r = client.get(f"/journals/one/{entry_id}", headers={"Authorization": token})
+    assert r.status_code == 200
+    # The journal, the entry and its keywords
+    assert len(queries) == 3
+
+
+def test_nested_counters():
+    with count_queries() as outer:
+        client.get("/users")
+        with count_queries() as inner:
+            client.get("/users")
+
+    assert len(inner) == 1
+    assert len(outer) == 2
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+from tortoise.backends.sqlite.client import SqliteClient
+from tortoise.exceptions import OperationalError
+
+from mnemeapi.models import Entry
+from mnemeapi.read_pool import ReadOnlyClient, ReadPool, ReadOnlyMiddleware
+
+loop = asyncio.get_event_loop()
+
+
+@pytest.fixture
+def writer(tmp_path):
+    client = SqliteClient(str(tmp_path / "mneme.db"), connection_name="models", synchronous="NORMAL")
+    loop.run_until_complete(client.create_connection(with_db=True))
+    loop.run_until_complete(client.execute_script("CREATE TABLE note (id INTEGER PRIMARY KEY, text TEXT)"))
+    yield client
+    loop.run_until_complete(client.close())
+
+
+def test_read_only_client(writer):
+    async def run():
+        reader = ReadOnlyClient(writer, size=3)
+        await reader.create_connection(with_db=True)
+        try:
+            assert reader.pragmas["synchronous"] == "NORMAL"
+            assert "journal_mode" not in reader.pragmas
+
+            await writer.execute_insert("INSERT INTO note (text) VALUES (?)", ["one"])
+            _, rows = await reader.execute_query("SELECT text FROM note")
+            assert [row["text"] for row in rows] == ["one"]
+
+            # All of them run and every connection goes back to the pool
+            results = await asyncio.gather(*[reader.execute_query("SELECT count(*) AS c FROM note") for _ in range(10)])
+            assert all(rows[0]["c"] == 1 for _, rows in results)
+            assert reader.free == 3
+
+            with pytest.raises(OperationalError):
+                await reader.execute_query("INSERT INTO note (text) VALUES ('two')")
+            assert reader.free == 3
+
+            # The writes that come later are seen right away
+            await writer.execute_insert("INSERT INTO note (text) VALUES (?)", ["two"])
+            _, rows = await reader.execute_query("SELECT text FROM note ORDER BY id")
+            assert [row["text"] for row in rows] == ["one", "two"]
+        finally:
+            await reader.close()
+
+    loop.run_until_complete(run())
+
+
+def test_middleware_only_routes_reads(writer):
+    pool = ReadPool()
+    pool.connection_name = Entry._meta.default_connection
+    pool.client = ReadOnlyClient(writer, size=1)
+    default = Entry._meta.db
+    used = {}
+
+    async def app(scope, receive, send):
+        used[scope["method"]] = Entry._meta.db
+
+    middleware = ReadOnlyMiddleware(app, pool)
+    for method in ("GET", "POST"):
+        loop.run_until_complete(middleware({"type": "http", "method": method}, None, None))
+
+    assert used["GET"] is pool.client
+    assert used["POST"] is default
+    assert Entry._meta.db is default
@@ -0,0 +1,189 @@
+import sqlite3
+import asyncio
+from types import SimpleNamespace
+from datetime import datetime
+
+import pytest
+from mnemeapi import crud, config
+from mnemeapi.archive import store, fetch
+from mnemeapi.backup_storage import LocalStorage
+from mnemeapi.crud.backups import TRACKED
+from mnemeapi.models import User, Journal, Entry, Keyword
+from mnemeapi.restore import restore
+from mnemeapi.utils import auto_backup
+
+from .conftest import DB_URL
+
+pytestmark = pytest.mark.skipif(not DB_URL.startswith("sqlite"), reason="Only for sqlite")
+loop = asyncio.get_event_loop()
+
+
+@pytest.fixture
+def changelog():
+    loop.run_until_complete(crud.create_changelog())
+    yield
+    loop.run_until_complete(crud.drop_changelog())
+
+
+async def live_rows():
+    client = User._meta.db
+    rows = {}
+    for model in TRACKED:
+        table, pk = model._meta.db_table, model._meta.db_pk_column
+        _, found = await client.execute_query(f'SELECT * FROM "{table}" ORDER BY "{pk}"')
+        rows[table] = [dict(row) for row in found]
+    return rows
+
+
+def restored_rows(path):
+    conn = sqlite3.connect(str(path))
+    conn.row_factory = sqlite3.Row
+    rows = {}
+    for model in TRACKED:
+        table, pk = model._meta.db_table, model._meta.db_pk_column
+        rows[table] = [dict(row) for row in conn.execute(f'SELECT * FROM "{table}" ORDER BY "{pk}"')]
+    conn.close()
+    return rows
+
+
+def test_restore_a_chain_of_increments(changelog, tmp_path):
+    async def changes():
+        user = await User.create(username="restorer", hashed_password="-")
+        jrnl = await Journal.create(user_id=user.id, name="Restored", name_lower="restored")
+        first = await Entry.create(journal_id=jrnl.id, short="first", long="text", date=datetime(2020, 6, 1, 12))
+        await Keyword.create(entry_id=first.id, word="kept")
+
+        snapshot = await crud.backup(tmp_path)
+        before = await live_rows()
+
+        second = await Entry.create(journal_id=jrnl.id, short="second", long="text", date=datetime(2020, 6, 2, 12))
+        await Keyword.create(entry_id=second.id, word="new")
+        first.long = "edited"
+        await first.save()
+        increment = await crud.backup_increment(snapshot)
+
+        # Gone together with its entries and keywords
+        other = await Journal.create(user_id=user.id, name="Other", name_lower="other")
+        await Entry.create(journal_id=other.id, short="gone", long="text", date=datetime(2020, 6, 3, 12))
+        await crud.backup_increment(snapshot)
+        await other.delete()
+        await second.delete()
+        await crud.backup_increment(snapshot)
+
+        assert await crud.backup_increment(snapshot) is None
+        return snapshot, increment, before
+
+    snapshot, increment, before = loop.run_until_complete(changes())
+    assert len(list(increment.parent.iterdir())) == 3
+
+    assert restore(snapshot, tmp_path / "restored.db") == 3
+    assert restored_rows(tmp_path / "restored.db") == loop.run_until_complete(live_rows())
+
+    assert restore(snapshot, tmp_path / "at_snapshot.db", until=0) == 0
+    assert restored_rows(tmp_path / "at_snapshot.db") == before
+
+    # Without it the changes in the next ones don't make sense anymore
+    increment.unlink()
+    with pytest.raises(ValueError):
+        restore(snapshot, tmp_path / "broken.db")
+    assert not (tmp_path / "broken.db").exists()
+
+
+def test_full_backups_in_between(changelog, tmp_path):
+    async def changes():
+        user = await User.get(username="restorer")
+        jrnl = await Journal.create(user_id=user.id, name="In between", name_lower="in between")
+        snapshot = await crud.backup(tmp_path)
+        await Entry.create(journal_id=jrnl.id, short="before", long="text", date=datetime(2020, 6, 1, 12))
+
+        # Like one from POST /backup, the increments of the first snapshot still have everything
+        await crud.backup(tmp_path / "other")
+        await Entry.create(journal_id=jrnl.id, short="after", long="text", date=datetime(2020, 6, 2, 12))
+        await crud.backup_increment(snapshot)
+        return snapshot
+
+    snapshot = loop.run_until_complete(changes())
+    assert restore(snapshot, tmp_path / "restored.db") == 1
+    assert restored_rows(tmp_path / "restored.db") == loop.run_until_complete(live_rows())
+
+
+def test_restore_from_the_storage(changelog, tmp_path):
+    storage = LocalStorage(str(tmp_path / "stored"))
+
+    async def changes():
+        user = await User.get(username="restorer")
+        jrnl = await Journal.create(user_id=user.id, name="Stored", name_lower="stored")
+        snapshot = await crud.backup(tmp_path)
+        await store(storage, snapshot, root=tmp_path)
+
+        await Entry.create(journal_id=jrnl.id, short="stored", long="text", date=datetime(2020, 6, 1, 12))
+        await store(storage, await crud.backup_increment(snapshot), root=tmp_path)
+
+        fetched = tmp_path / "fetched"
+        fetched.mkdir()
+        return await fetch(storage, snapshot.stem, fetched)
+
+    snapshot = loop.run_until_complete(changes())
+    assert restore(snapshot, tmp_path / "restored.db") == 1
+    assert restored_rows(tmp_path / "restored.db") == loop.run_until_complete(live_rows())
+
+
+def test_backup_lets_writers_in(monkeypatch, tmp_path):
+    path = tmp_path / "api.db"
+    conn = sqlite3.connect(str(path), timeout=1)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.execute("CREATE TABLE t (x TEXT)")
+    conn.executemany("INSERT INTO t VALUES (?)", [("x" * 1000,)] * 400)
+    conn.commit()
+
+    db = SimpleNamespace(filename=str(path), capabilities=SimpleNamespace(dialect="sqlite"))
+    monkeypatch.setattr(type(User._meta), "db", property(lambda meta: db))
+    monkeypatch.setattr("mnemeapi.crud.backups.BACKUP_PAGES", 1)
+    monkeypatch.setattr("mnemeapi.crud.backups.BACKUP_SLEEP", 0.01)
+
+    async def write_during_backup():
+        task = asyncio.ensure_future(crud.backup(tmp_path / "backups"))
+        await asyncio.sleep(0.2)
+        conn.execute("INSERT INTO t VALUES ('during')")
+        conn.commit()
+        return task.done(), await task
+
+    try:
+        done_before_the_write, target = loop.run_until_complete(write_during_backup())
+    finally:
+        conn.close()
+
+    assert not done_before_the_write
+    # The copy started over, so it has the write too
+    copy = sqlite3.connect(str(target))
+    assert copy.execute("SELECT COUNT(*) FROM t WHERE x = 'during'").fetchone() == (1,)
+    copy.close()
+
+
+def test_auto_backup_carries_on_after_a_failure(monkeypatch, tmp_path):
+    calls = []
+
+    async def backup():
+        calls.append("full")
+        if len(calls) == 1:
+            raise OSError("The disk is full")
+        if calls.count("full") == 3:
+            raise asyncio.CancelledError
+        return tmp_path / "snapshot.db"
+
+    async def backup_increment(snapshot):
+        calls.append("increment")
+        raise OSError("The disk is full")
+
+    async def store_backup(path):
+        pass
+
+    monkeypatch.setattr(crud, "backup", backup)
+    monkeypatch.setattr(crud, "backup_increment", backup_increment)
+    monkeypatch.setattr("mnemeapi.utils.store_backup", store_backup)
+    monkeypatch.setattr(config, "_backup_interval", 0)
+
+    with pytest.raises(asyncio.CancelledError):
+        loop.run_until_complete(auto_backup(incremental=True))
+    # A failed increment means the chain can't be trusted anymore, the next one is a full backup
+    assert calls == ["full", "full", "increment", "full"]
@@ -0,0 +1,50 @@
+import asyncio
+from datetime import date, timedelta
+
+from mnemeapi import broker, crud
+from mnemeapi.models import Entry
+from mnemeapi.profiling import count_queries
+
+from .conftest import client, log_in
+
+loop = asyncio.get_event_loop()
+
+
+def test_delete_and_revive_journal():
+    token = log_in("admin", "12345")
+    r = client.post("/journals", headers={"Authorization": token}, json={"name": "Revived"})
+    assert r.status_code == 201
+    jrnl_id = r.json()["id"]
+    r = client.post(
+        "/journals/revived/entries/bulk",
+        headers={"Authorization": token},
+        json=[{"short": f"entry {n}", "long": "", "date": "2020-06-01 12:00", "keywords": [{"word": "kw"}]}
+              for n in range(50)]
+    )
+    assert r.status_code == 201
+    ids = r.json()["ids"]
+    # Deleted some days before the journal, so it stays deleted when the journal comes back
+    r = client.delete(f"/journals/revived/{ids[0]}", headers={"Authorization": token})
+    assert r.status_code == 204
+    loop.run_until_complete(Entry.filter(id=ids[0]).update(deleted_on=date.today() - timedelta(days=3)))
+
+    admin = loop.run_until_complete(crud.get_user_by_username("admin"))
+    subscription = broker.subscribe(admin.id)
+    try:
+        # The entries aren't loaded, it doesn't matter how many there are
+        with count_queries() as queries:
+            r = client.delete("/journals/revived", headers={"Authorization": token})
+        assert r.status_code == 204
+        assert len(queries) <= 10, "\n".join(queries.queries)
+        event = loop.run_until_complete(subscription.get())
+        assert event["data"] == str({"type": "journal", "data": {"id": jrnl_id, "name": "Revived", "entries": 49}})
+        assert loop.run_until_complete(Entry.filter(journal_id=jrnl_id, deleted_on=None).count()) == 0
+
+        r = client.post("/journals/revive", headers={"Authorization": token}, params={"jrnl_id": jrnl_id})
+        assert r.status_code == 200
+        assert sorted(entry["id"] for entry in r.json()["entries"]) == ids[1:]
+        assert all(entry["keywords"][0]["word"] == "kw" for entry in r.json()["entries"])
+        event = loop.run_until_complete(subscription.get())
+        assert event["data"] == str({"type": "journal", "data": {"id": jrnl_id, "name": "Revived", "entries": 49}})
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,95 @@
+from mnemeapi.crud.search import _tsquery
+
+from .conftest import client, log_in, create_entry
+
+
+def search(token: str, **params):
+    r = client.get("/search", headers={"Authorization": token}, params=params)
+    assert r.status_code == 200
+    return r.json()
+
+
+def test_search():
+    admin_token = log_in("admin", "12345")
+    r = client.post(
+        "/users",
+        json={"username": "searcher", "password": "12345", "encrypted": False},
+        headers={"Authorization": admin_token},
+    )
+    assert r.status_code == 201
+
+    token = log_in("searcher", "12345")
+    for name in ("travel", "work"):
+        r = client.post("/journals", headers={"Authorization": token}, json={"name": name})
+        assert r.status_code == 201
+
+    mountains = create_entry(token, "travel", "Mountains",
+                             long="We hiked up the mountain and saw a lake, the lake was cold")
+    beach = create_entry(token, "travel", "Beach", long="A lazy day by the sea, nothing else")
+    meeting = create_entry(token, "work", "Meeting", long="Talked about the trip to the lake with the team")
+
+    results = search(token, q="lake")
+    assert [result["entry"]["id"] for result in results] == [mountains["id"], meeting["id"]]
+    assert "<b>lake</b>" in results[0]["snippet"]
+    assert results[0]["rank"] <= results[1]["rank"]
+
+    # All the words have to be there
+    assert [result["entry"]["id"] for result in search(token, q="lake team")] == [meeting["id"]]
+    # Prefix search
+    assert [result["entry"]["id"] for result in search(token, q="hik*")] == [mountains["id"]]
+    # Quotes and operators are just text
+    assert search(token, q='"lake OR (') == []
+
+    results = search(token, q="lake", jrnl_name="work")
+    assert [result["entry"]["id"] for result in results] == [meeting["id"]]
+    r = client.get("/search", headers={"Authorization": token}, params={"q": "lake", "jrnl_name": "nope"})
+    assert r.status_code == 404
+
+    assert search(token, q="lake", date_min="2020-07-01") == []
+    assert len(search(token, q="lake", date_max="2020-07-01")) == 2
+
+    # Other users can't find them
+    assert search(admin_token, q="lake") == []
+
+    # Updates are indexed
+    r = client.put(
+        f"/journals/travel/{beach['id']}",
+        headers={"Authorization": token},
+        json={"short": "Beach", "long": "Swam in the lake instead", "date": "2020-06-01 12:00", "keywords": [],
+              "journal_id": beach["journal_id"]}
+    )
+    assert r.status_code == 200
+    assert search(token, q="sea") == []
+    assert beach["id"] in [result["entry"]["id"] for result in search(token, q="lake")]
+
+    # Deleted entries are only found when asked for
+    r = client.delete(f"/journals/travel/{mountains['id']}", headers={"Authorization": token})
+    assert r.status_code == 204
+    assert mountains["id"] not in [result["entry"]["id"] for result in search(token, q="lake")]
+    assert mountains["id"] in [result["entry"]["id"] for result in search(token, q="lake", deleted=True)]
+
+    # Once they are gone for good they are out of the index too
+    r = client.delete(f"/journals/travel/{mountains['id']}", headers={"Authorization": token},
+                      params={"now": True, "deleted": True})
+    assert r.status_code == 204
+    assert search(token, q="hiked", deleted=True) == []
+
+
+def test_rebuild_search():
+    r = client.post("/search/rebuild", headers={"Authorization": log_in("searcher", "12345")})
+    assert r.status_code == 401
+
+    r = client.post("/search/rebuild", headers={"Authorization": log_in("admin", "12345")})
+    assert r.status_code == 204
+
+    token = log_in("searcher", "12345")
+    assert len(search(token, q="lake")) == 2
+
+
+def test_tsquery():
+    # What PostgreSQL gets instead of the FTS5 expression
+    assert _tsquery("lake team") == "lake & team"
+    assert _tsquery("hik*") == "hik:*"
+    assert _tsquery("\"lake OR (") == "lake & OR"
+    assert _tsquery("it's!* | !") == "it & s:*"
+    assert _tsquery("* ()") == ""
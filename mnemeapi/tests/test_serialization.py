@@ -0,0 +1,61 @@
+from datetime import date, datetime
+
+import pytest
+
+from mnemeapi import config, response_cache
+from mnemeapi.serialization import dumps, render
+
+from .conftest import client, log_in
+
+
+@pytest.fixture
+def fast():
+    config._serializer = "fast"
+    response_cache.clear()
+    yield
+    config._serializer = "pydantic"
+    response_cache.clear()
+
+
+def test_dumps_like_response_models():
+    content = [{"short": "ünïcode", "date": datetime(2020, 6, 1, 12, 30, 15, 123), "deleted_on": date(2020, 6, 2),
+                "keywords": [], "version": 1, "long": None}]
+    assert dumps(content) == render(content)
+
+    with pytest.raises(TypeError):
+        dumps([object()])
+
+
+def test_fast_serializer_gives_the_same(fast):
+    token = log_in("admin", "12345")
+    r = client.post("/journals", headers={"Authorization": token}, json={"name": "Serialized"})
+    assert r.status_code == 201
+    for n in range(3):
+        r = client.post(
+            "/journals/serialized/entries",
+            headers={"Authorization": token},
+            json={"short": f"entry {n}", "long": "text", "date": f"2020-06-0{n + 1} 12:00",
+                  "keywords": [{"word": "same"}, {"word": f"word{n}"}]}
+        )
+        assert r.status_code == 201
+    r = client.delete(f"/journals/serialized/{r.json()['id']}", headers={"Authorization": token})
+    assert r.status_code == 204
+
+    requests = [
+        ("/journals", {}),
+        ("/journals", {"deleted": True}),
+        ("/journals/serialized", {}),
+        ("/journals/entries", {"keywords": ["same", "word1"], "method": "or"}),
+        ("/journals/entries", {"keywords": ["same", "word1"], "method": "and", "deleted": True}),
+    ]
+    fast_responses = [client.get(url, headers={"Authorization": token}, params=params) for url, params in requests]
+
+    config._serializer = "pydantic"
+    response_cache.clear()
+    for (url, params), fast_response in zip(requests, fast_responses):
+        r = client.get(url, headers={"Authorization": token}, params=params)
+        assert r.status_code == fast_response.status_code == 200
+        assert r.json() == fast_response.json(), url
+        assert r.content == fast_response.content, url
+
+    assert [entry["short"] for entry in fast_responses[2].json()["entries"]] == ["entry 0", "entry 1"]
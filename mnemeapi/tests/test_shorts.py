@@ -0,0 +1,85 @@
+import asyncio
+from datetime import datetime
+
+from mnemeapi import crud
+from mnemeapi.crud.migrations import SHORT_INDEX
+from mnemeapi.models import Entry
+from mnemeapi.profiling import count_queries
+
+from .conftest import client, log_in, post_entry
+
+loop = asyncio.get_event_loop()
+
+
+def test_same_short_in_journal():
+    token = log_in("admin", "12345")
+    for name in ("Shorts", "Other shorts"):
+        r = client.post("/journals", headers={"Authorization": token}, json={"name": name})
+        assert r.status_code == 201
+
+    first = post_entry(token, "shorts", "same")
+    assert first.status_code == 201
+    r = post_entry(token, "shorts", "same")
+    assert r.status_code == 400
+    assert r.json()["detail"] == "This entry already exists in this journal"
+    # Nothing is left behind from the one that failed
+    assert loop.run_until_complete(Entry.filter(short="same").count()) == 1
+
+    # In another journal it's fine
+    assert post_entry(token, "other shorts", "same").status_code == 201
+
+    # An entry can't be renamed to it either
+    other = post_entry(token, "shorts", "other").json()
+    r = client.put(
+        f"/journals/shorts/{other['id']}",
+        headers={"Authorization": token},
+        json={"short": "same", "long": "", "date": "2020-06-01 12:00", "keywords": [],
+              "journal_id": other["journal_id"]}
+    )
+    assert r.status_code == 400
+
+    # Once it's deleted the short can be used again
+    r = client.delete(f"/journals/shorts/{first.json()['id']}", headers={"Authorization": token})
+    assert r.status_code == 204
+    assert post_entry(token, "shorts", "same").status_code == 201
+
+
+def test_create_entry_doesnt_load_journal():
+    token = log_in("admin", "12345")
+    r = client.post(
+        "/journals/shorts/entries/bulk",
+        headers={"Authorization": token},
+        json=[{"short": f"entry {n}", "long": "", "date": "2020-06-01 12:00", "keywords": [{"word": "kw"}]}
+              for n in range(100)]
+    )
+    assert r.status_code == 201
+
+    with count_queries() as queries:
+        assert post_entry(token, "shorts", "one more").status_code == 201
+    # Only the journal itself is read, not its entries, and then the keywords of the new one
+    assert not [query for query in queries.queries if 'FROM "entry"' in query]
+    assert len(queries) <= 9, "\n".join(queries.queries)
+
+
+def test_duplicates_from_before_the_index():
+    token = log_in("admin", "12345")
+    jrnl_id = post_entry(token, "shorts", "twice").json()["journal_id"]
+
+    async def upgrade():
+        # A database from before the index, where nothing stopped a second one
+        client = Entry._meta.db
+        await client.execute_script(f"DROP INDEX {SHORT_INDEX}")
+        second = await Entry.create(journal_id=jrnl_id, short="twice", long="", date=datetime(2020, 6, 1, 12))
+
+        # Like on startup
+        await crud.migrate()
+        return second.id, await Entry.filter(journal_id=jrnl_id, short__startswith="twice").order_by("id")\
+            .values_list("short", "version")
+
+    second_id, shorts = loop.run_until_complete(upgrade())
+    # The older one keeps its short
+    assert shorts == [("twice", 1), (f"twice ({second_id})", 2)]
+
+    # The index is back, so no more of them
+    assert post_entry(token, "shorts", "twice").status_code == 400
+    assert post_entry(token, "shorts", f"twice ({second_id})").status_code == 400
@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+from tortoise.backends.sqlite.client import SqliteClient
+
+from mnemeapi.models import SubscribeKey
+from mnemeapi.read_pool import ReadOnlyClient, ReadPool
+from mnemeapi.subscribe_keys import MemoryKeyStore, DatabaseKeyStore, create_key_store
+
+loop = asyncio.get_event_loop()
+
+
+@pytest.fixture(params=["memory", "database"])
+def store_kind(request):
+    return request.param
+
+
+def test_single_use(store_kind):
+    async def run():
+        store = create_key_store(store_kind, ttl=60, maxsize=10)
+        key = await store.issue("user")
+        assert await store.redeem("not a key") is None
+        assert await store.redeem(key) == "user"
+        # Only once
+        assert await store.redeem(key) is None
+
+        stats = await store.stats()
+        assert stats["issued"] == 1
+        assert stats["redeemed"] == 1
+        assert stats["rejected"] == 2
+
+    loop.run_until_complete(run())
+
+
+def test_expiry(store_kind):
+    async def run():
+        store = create_key_store(store_kind, ttl=0.05, maxsize=10)
+        expired = [await store.issue("user") for _ in range(3)]
+        await asyncio.sleep(0.1)
+        key = await store.issue("user")
+
+        assert await store.redeem(expired[0]) is None
+        # The ones nobody asked for are swept too
+        assert await store.sweep() == 2
+        assert await store.size() == 1
+        assert await store.redeem(key) == "user"
+
+    loop.run_until_complete(run())
+
+
+def test_memory_eviction_under_churn():
+    async def run():
+        store = MemoryKeyStore(ttl=60, maxsize=100)
+        keys = [await store.issue(f"user {n}") for n in range(1000)]
+
+        # It never holds more than its size, the oldest keys stop working
+        assert await store.size() == 100
+        assert await store.redeem(keys[0]) is None
+        assert await store.redeem(keys[-1]) == "user 999"
+
+    loop.run_until_complete(run())
+
+
+def test_database_limit_under_churn():
+    async def run():
+        store = DatabaseKeyStore(ttl=60, maxsize=20)
+        keys = [await store.issue(f"user {n}") for n in range(50)]
+
+        assert await store.sweep() == 30
+        assert await store.size() == 20
+        assert await store.redeem(keys[0]) is None
+        assert await store.redeem(keys[-1]) == "user 49"
+        # Leave nothing behind for the other tests
+        for key in keys:
+            await store.redeem(key)
+
+    loop.run_until_complete(run())
+
+
+@pytest.fixture
+def read_pool(tmp_path):
+    """Read only connections to a database file, like the ones GET requests use"""
+    name = SubscribeKey._meta.default_connection
+    writer = SqliteClient(str(tmp_path / "mneme.db"), connection_name=name)
+    loop.run_until_complete(writer.create_connection(with_db=True))
+    # The same table as in the test database
+    _, rows = loop.run_until_complete(SubscribeKey._meta.db.execute_query(
+        "SELECT sql FROM sqlite_master WHERE name=?", [SubscribeKey._meta.db_table]
+    ))
+    loop.run_until_complete(writer.execute_script(rows[0]["sql"]))
+
+    pool = ReadPool()
+    pool.connection_name = name
+    pool.client = ReadOnlyClient(writer, size=2)
+    loop.run_until_complete(pool.client.create_connection(with_db=True))
+    yield pool
+    loop.run_until_complete(pool.close())
+    loop.run_until_complete(writer.close())
+
+
+def test_database_keys_while_reading(read_pool):
+    async def run():
+        store = DatabaseKeyStore(ttl=60, maxsize=10)
+        # GET /subscribe_auth and GET /subscribe/
+        with read_pool.reading():
+            key = await store.issue("user")
+            assert await store.size() == 1
+            assert await store.redeem(key) == "user"
+            assert await store.sweep() == 0
+
+    loop.run_until_complete(run())
+
+
+def test_sweep_in_background():
+    async def run():
+        store = MemoryKeyStore(ttl=0.05)
+        await store.issue("user")
+        await store.start()
+        await asyncio.sleep(0.15)
+        await store.stop()
+        assert await store.size() == 0
+
+    loop.run_until_complete(run())
@@ -0,0 +1,137 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from mnemeapi.models import Entry
+from mnemeapi.utils import encode_cursor, decode_cursor
+
+from .conftest import client, log_in
+
+loop = asyncio.get_event_loop()
+
+
+def sync(token: str, **params):
+    r = client.get("/sync", headers={"Authorization": token}, params=params)
+    assert r.status_code == 200
+    return r.json()
+
+
+@pytest.fixture
+def no_overlap(monkeypatch):
+    """Nothing comes twice, as if everything was synced long after it changed"""
+    monkeypatch.setattr("mnemeapi.crud.sync.OVERLAP", timedelta(0))
+
+
+def test_sync(no_overlap):
+    admin_token = log_in("admin", "12345")
+    r = client.post(
+        "/users",
+        json={"username": "syncer", "password": "12345", "encrypted": False},
+        headers={"Authorization": admin_token},
+    )
+    assert r.status_code == 201
+    token = log_in("syncer", "12345")
+
+    # Nothing yet
+    changes = sync(token)
+    assert changes["journals"] == changes["entries"] == []
+    assert not changes["more"]
+    cursor = changes["cursor"]
+
+    r = client.post("/journals", headers={"Authorization": token}, json={"name": "Diary"})
+    assert r.status_code == 201
+    jrnl_id = r.json()["id"]
+    ids = []
+    for n in range(3):
+        r = client.post(
+            "/journals/diary/entries",
+            headers={"Authorization": token},
+            json={"short": f"day {n}", "long": "text", "date": "2020-06-01 12:00", "keywords": [{"word": "day"}]}
+        )
+        assert r.status_code == 201
+        ids.append(r.json()["id"])
+
+    # A page at a time
+    changes = sync(token, cursor=cursor, limit=2)
+    assert [jrnl["name"] for jrnl in changes["journals"]] == ["Diary"]
+    assert [entry["id"] for entry in changes["entries"]] == ids[:2]
+    assert changes["entries"][0]["keywords"][0]["word"] == "day"
+    assert changes["more"]
+    changes = sync(token, cursor=changes["cursor"], limit=2)
+    assert changes["journals"] == []
+    assert [entry["id"] for entry in changes["entries"]] == ids[2:]
+    assert not changes["more"]
+    cursor = changes["cursor"]
+    assert sync(token, cursor=cursor)["entries"] == []
+
+    # Only what changed since, deleted ones too
+    r = client.put(
+        f"/journals/diary/{ids[1]}",
+        headers={"Authorization": token},
+        json={"short": "day 1", "long": "edited", "date": "2020-06-01 12:00", "keywords": [], "journal_id": jrnl_id}
+    )
+    assert r.status_code == 200
+    r = client.delete(f"/journals/diary/{ids[0]}", headers={"Authorization": token})
+    assert r.status_code == 204
+
+    changes = sync(token, cursor=cursor)
+    assert changes["journals"] == []
+    edited, deleted = changes["entries"]
+    assert edited["id"] == ids[1]
+    assert edited["long"] == "edited"
+    assert edited["version"] == 2
+    assert deleted["id"] == ids[0]
+    assert deleted["deleted_on"] is not None
+
+    # Other users don't see them
+    assert all(entry["id"] not in ids for entry in sync(admin_token)["entries"])
+
+
+def test_sync_cursor():
+    r = client.get("/sync", headers={"Authorization": log_in("admin", "12345")}, params={"cursor": "nope"})
+    assert r.status_code == 400
+
+    position = (datetime(2020, 6, 1, 12, 0, 0, 123), 7)
+    _, journals_after, entries_after = decode_cursor(encode_cursor(position, None))
+    assert journals_after == position
+    assert entries_after is None
+
+
+def test_sync_reset(monkeypatch):
+    # Older than the deleted journals and entries are kept
+    long_ago = datetime.now() - timedelta(days=30)
+
+    class Then(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return long_ago
+
+    monkeypatch.setattr("mnemeapi.utils.datetime", Then)
+    cursor = encode_cursor(None, None)
+    monkeypatch.undo()
+
+    changes = sync(log_in("admin", "12345"), cursor=cursor)
+    assert changes["reset"]
+    assert changes["cursor"] is None
+
+
+def test_sync_row_committed_late():
+    token = log_in("syncer", "12345")
+    changes = sync(token)
+    while changes["more"]:
+        changes = sync(token, cursor=changes["cursor"])
+    last = max(entry["updated_at"] for entry in changes["entries"])
+
+    r = client.post(
+        "/journals/diary/entries",
+        headers={"Authorization": token},
+        json={"short": "late", "long": "text", "date": "2020-06-01 12:00", "keywords": []}
+    )
+    late_id = r.json()["id"]
+    # Stamped before the last one that was synced, but its transaction only committed now
+    loop.run_until_complete(Entry.filter(id=late_id).update(updated_at=datetime.fromisoformat(last)
+                                                             - timedelta(seconds=1)))
+
+    changes = sync(token, cursor=changes["cursor"])
+    assert late_id in [entry["id"] for entry in changes["entries"]]
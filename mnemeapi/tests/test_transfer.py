@@ -0,0 +1,185 @@
+import io
+import json
+import asyncio
+import zipfile
+
+from mnemeapi.crud import iter_entries
+from mnemeapi.models import Journal, Entry, Keyword
+
+from .conftest import client, log_in
+
+loop = asyncio.get_event_loop()
+
+
+def make_entries(count: int, start: int = 0):
+    return [
+        {
+            "short": f"Entry {i}",
+            "long": f"Imported entry number {i}",
+            "date": "2020-05-01 10:00",
+            "keywords": [{"word": "Imported"}, {"word": f"n{i}"}]
+        }
+        for i in range(start, start + count)
+    ]
+
+
+def test_import_entries():
+    admin_token = log_in("admin", "12345")
+    r = client.post(
+        "/users",
+        json={"username": "importer", "password": "12345", "encrypted": False},
+        headers={"Authorization": admin_token},
+    )
+    assert r.status_code == 201
+
+    token = log_in("importer", "12345")
+    r = client.post("/journals", headers={"Authorization": token}, json={"name": "Imported"})
+    assert r.status_code == 201
+    jrnl_id = r.json()["id"]
+
+    entries = make_entries(1200)
+    r = client.post("/journals/imported/entries/bulk", headers={"Authorization": token}, json=entries)
+    assert r.status_code == 201
+    data = r.json()
+    assert data["journal_id"] == jrnl_id
+    assert data["count"] == 1200
+    assert len(set(data["ids"])) == 1200
+
+    first = loop.run_until_complete(Entry.get(id=data["ids"][0]))
+    assert first.short == "Entry 0"
+    assert first.journal_id == jrnl_id
+    words = loop.run_until_complete(Keyword.filter(entry_id=first.id).values_list("word", flat=True))
+    assert sorted(words) == ["imported", "n0"]
+    assert loop.run_until_complete(Keyword.filter(entry__journal_id=jrnl_id).count()) == 2400
+
+    # They can be found like the rest
+    r = client.get("/search", headers={"Authorization": token}, params={"q": "number 1199"})
+    assert [result["entry"]["id"] for result in r.json()] == [data["ids"][-1]]
+
+    # NDJSON works too
+    body = "\n".join(json.dumps(entry) for entry in make_entries(3, start=1200)) + "\n"
+    r = client.post(
+        "/journals/imported/entries/bulk",
+        headers={"Authorization": token, "Content-Type": "application/x-ndjson"},
+        data=body,
+    )
+    assert r.status_code == 201
+    assert r.json()["count"] == 3
+
+
+def test_import_entries_all_or_nothing():
+    token = log_in("importer", "12345")
+    count = loop.run_until_complete(Entry.filter(journal__name_lower="imported").count())
+
+    # A short that already exists
+    r = client.post("/journals/imported/entries/bulk", headers={"Authorization": token},
+                    json=make_entries(5, start=1198))
+    assert r.status_code == 400
+    assert "Entry 1198, Entry 1199" in r.json()["detail"]
+
+    # The same short twice
+    r = client.post("/journals/imported/entries/bulk", headers={"Authorization": token},
+                    json=make_entries(2, start=5000) * 2)
+    assert r.status_code == 400
+
+    # Invalid entries
+    entries = make_entries(2, start=5000)
+    entries[1]["date"] = "yesterday"
+    r = client.post("/journals/imported/entries/bulk", headers={"Authorization": token}, json=entries)
+    assert r.status_code == 400
+    del entries[1]["short"]
+    r = client.post("/journals/imported/entries/bulk", headers={"Authorization": token}, json=entries)
+    assert r.status_code == 400
+    r = client.post("/journals/imported/entries/bulk", headers={"Authorization": token},
+                    json={"short": "Not an array"})
+    assert r.status_code == 400
+
+    r = client.post("/journals/nope/entries/bulk", headers={"Authorization": token}, json=make_entries(1))
+    assert r.status_code == 404
+
+    assert loop.run_until_complete(Entry.filter(journal__name_lower="imported").count()) == count
+
+
+def test_iter_entries():
+    jrnl = loop.run_until_complete(Journal.get(name_lower="imported"))
+
+    async def read_all():
+        return [batch async for batch in iter_entries(jrnl.id, batch_size=100)]
+
+    batches = loop.run_until_complete(read_all())
+    assert all(len(batch) == 100 for batch in batches[:-1])
+    # They all have the same date, so only the id tells them apart
+    ids = [entry["id"] for batch in batches for entry in batch]
+    assert ids == sorted(ids)
+    assert len(ids) == len(set(ids)) == 1203
+    assert batches[0][0]["keywords"] == ["imported", "n0"]
+
+
+def test_export():
+    token = log_in("importer", "12345")
+
+    r = client.get("/export", headers={"Authorization": token})
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert lines[0] == {"type": "journal", "id": lines[0]["id"], "name": "Imported"}
+    assert len(lines) == 1204
+    assert lines[1] == {
+        "type": "entry",
+        "id": lines[1]["id"],
+        "journal_id": lines[0]["id"],
+        "short": "Entry 0",
+        "long": "Imported entry number 0",
+        "date": "2020-05-01 10:00",
+        "keywords": ["imported", "n0"],
+    }
+
+    r = client.get("/export", headers={"Authorization": token}, params={"format": "markdown"})
+    assert r.status_code == 200
+    assert r.text.startswith("# Imported\n\n## Entry 0\n\n*2020-05-01 10:00*\nKeywords: imported, n0\n")
+    assert r.text.count("\n## ") == 1203
+
+    r = client.get("/export", headers={"Authorization": token}, params={"format": "zip"})
+    assert r.status_code == 200
+    assert 'filename="mneme.zip"' in r.headers["content-disposition"]
+    with zipfile.ZipFile(io.BytesIO(r.content)) as archive:
+        assert archive.namelist() == ["Imported.md"]
+        assert archive.read("Imported.md").decode().count("\n## ") == 1203
+
+    r = client.get("/export", headers={"Authorization": token}, params={"format": "pdf"})
+    assert r.status_code == 400
+
+
+def test_export_encrypted():
+    # The app sends the encrypted text, it has to come back exactly the same
+    token = log_in("admin", "12345")
+    r = client.post(
+        "/users",
+        json={"username": "secretive", "password": "12345", "encrypted": True},
+        headers={"Authorization": token},
+    )
+    assert r.status_code == 201
+
+    token = log_in("secretive", "12345")
+    r = client.post("/journals", headers={"Authorization": token}, json={"name": "U2FsdGVkX1+abc=="})
+    assert r.status_code == 201
+    r = client.post(
+        "/journals/u2fsdgvkx1+abc==/entries/bulk",
+        headers={"Authorization": token},
+        json=[{"short": "U2FsdGVkX1+short==", "long": "U2FsdGVkX1+*long*==", "date": "2020-05-01 10:00"}]
+    )
+    assert r.status_code == 201
+    jrnl_id = r.json()["journal_id"]
+
+    r = client.get("/export", headers={"Authorization": token})
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert lines[0]["name"] == "U2FsdGVkX1+abc=="
+    assert lines[1]["short"] == "U2FsdGVkX1+short=="
+    assert lines[1]["long"] == "U2FsdGVkX1+*long*=="
+
+    r = client.get("/export", headers={"Authorization": token}, params={"format": "zip"})
+    with zipfile.ZipFile(io.BytesIO(r.content)) as archive:
+        assert archive.namelist() == [f"{jrnl_id}.md"]
+        text = archive.read(f"{jrnl_id}.md").decode()
+    assert "# U2FsdGVkX1+abc==\n" in text
+    assert "U2FsdGVkX1+*long*==" in text
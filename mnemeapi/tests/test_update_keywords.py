@@ -0,0 +1,48 @@
+import asyncio
+
+from mnemeapi import crud, schemas
+from mnemeapi.models import Journal, Keyword, User
+from mnemeapi.profiling import count_queries
+
+loop = asyncio.get_event_loop()
+
+
+def keywords_of(entry_id: int):
+    return loop.run_until_complete(Keyword.filter(entry_id=entry_id).order_by("id").values_list("word", "id"))
+
+
+def test_update_keywords():
+    async def create():
+        user = await User.get(username="admin")
+        jrnl = await Journal.create(user_id=user.id, name="Keywords", name_lower="keywords")
+        entry = schemas.EntryCreate(short="keywords", long="", date="2020-06-01 12:00",
+                                    keywords=[{"word": word} for word in ("a", "b", "c")])
+        return (await crud.create_entry(entry, jrnl.id)).id
+
+    entry_id = loop.run_until_complete(create())
+    before = dict(keywords_of(entry_id))
+
+    new_keywords = [schemas.KeywordCreate(word=word) for word in ("B", "c", "d", "e")]
+    with count_queries() as queries:
+        loop.run_until_complete(crud.update_keywords(new_keywords, entry_id))
+    # What is there, what is gone and what is new
+    assert len(queries) == 3
+
+    after = keywords_of(entry_id)
+    assert [word for word, _ in after] == ["b", "c", "d", "e"]
+    # The ones that stayed kept their ids
+    assert after[0][1] == before["b"]
+    assert after[1][1] == before["c"]
+
+    # Nothing changed, nothing to do
+    with count_queries() as queries:
+        loop.run_until_complete(crud.update_keywords(new_keywords, entry_id))
+    assert len(queries) == 1
+    assert keywords_of(entry_id) == after
+
+    # A word can be there more than once, like before
+    loop.run_until_complete(crud.update_keywords([schemas.KeywordCreate(word="d")] * 2, entry_id))
+    assert [word for word, _ in keywords_of(entry_id)] == ["d", "d"]
+
+    loop.run_until_complete(crud.update_keywords([], entry_id))
+    assert keywords_of(entry_id) == []
@@ -1,19 +1,28 @@
-import os
+import json
+import base64
+import hashlib
 import time
 import asyncio
+import logging
 from pathlib import Path
 from datetime import datetime, timedelta, date
-from typing import Optional, Dict
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Optional, Dict, List, Sequence, Tuple
 
 import jwt
 from jwt.exceptions import PyJWTError
+from pydantic import ValidationError
 from fastapi import Depends, status, HTTPException, Request
+from starlette.responses import Response
 
-from . import crud, schemas, models, config, queues
-from . import pwd_context, ALGORITHM, oauth2_scheme
+from . import crud, schemas, models, config, broker, principal_cache, response_cache
+from . import password_hasher, event_bus, backup_storage, archive, ALGORITHM, oauth2_scheme
+from .broker import Subscription
 
 
+log = logging.getLogger("mnemeapi.backups")
+
 HOUR = 3600
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl")
 
 
 def generate_auth_token(user_id: str, expires_delta: timedelta = None):
@@ -28,7 +37,11 @@ def generate_auth_token(user_id: str, expires_delta: timedelta = None):
     return encoded_token
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> models.User:
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> schemas.Principal:
+    user = principal_cache.get(token)
+    if user is not None:
+        return user
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -37,17 +50,20 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> models.User:
     try:
         payload = jwt.decode(token, config.secret, algorithms=[ALGORITHM])
         user_id: str = payload.get("public_id")
-        if id is None:
+        if user_id is None:
             raise credentials_exception
         else:
             token_data = schemas.TokenData(user_id=user_id)
     except PyJWTError:
         raise credentials_exception
 
-    user = await crud.get_user_by_id(token_data.user_id)
+    user = await crud.get_principal(token_data.user_id)
     if user is None:
         raise credentials_exception
     else:
+        # Don't trust the token for longer than it's valid
+        expires_in = payload.get("exp", 0) - time.time()
+        principal_cache.set(token, user, owner=user.id, ttl=expires_in)
         return user
 
 
@@ -57,7 +73,7 @@ async def auth_user(username: str, password: str):
     if user is None:
         return False
 
-    if pwd_context.verify(password, user.hashed_password):
+    if await password_hasher.verify(password, user.hashed_password):
         return user
     else:
         return False
@@ -70,6 +86,140 @@ def parse_date(date_: str) -> datetime:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Wrong date format.")
 
 
+def _position(after: Optional[crud.Position]) -> Optional[List]:
+    return None if after is None else [after[0].isoformat(), after[1]]
+
+
+def _to_position(after: Optional[List]) -> Optional[crud.Position]:
+    return None if after is None else (datetime.fromisoformat(after[0]), int(after[1]))
+
+
+def _encode(cursor: Dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+
+def _decode(cursor: str) -> Dict:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="The cursor is not valid.")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="The cursor is not valid.")
+    return data
+
+
+def encode_cursor(journals_after: Optional[crud.Position], entries_after: Optional[crud.Position]) -> str:
+    """Where the client is at in GET /sync and when it got there, it's opaque for the client"""
+    return _encode({"synced": datetime.now().isoformat(), "journals": _position(journals_after),
+                    "entries": _position(entries_after)})
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, Optional[crud.Position], Optional[crud.Position]]:
+    data = _decode(cursor)
+    try:
+        return datetime.fromisoformat(data["synced"]), _to_position(data["journals"]), _to_position(data["entries"])
+    except (ValueError, TypeError, KeyError, IndexError):
+        raise HTTPException(status_code=400, detail="The cursor is not valid.")
+
+
+def encode_page_cursor(after: crud.Position) -> str:
+    """The (date, id) of the last entry of a page"""
+    return _encode({"after": _position(after)})
+
+
+def decode_page_cursor(cursor: str) -> crud.Position:
+    try:
+        return _to_position(_decode(cursor)["after"])
+    except (ValueError, TypeError, KeyError, IndexError):
+        raise HTTPException(status_code=400, detail="The cursor is not valid.")
+
+
+def journals_etag(user_id: str, versions: Iterable[Tuple[int, int, int]]) -> str:
+    """A strong ETag for a response made from these journals and their entries, see crud.get_journal_versions"""
+    digest = hashlib.sha1(repr((str(user_id), sorted(versions))).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+
+    # A GET compares them ignoring if they are weak
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+async def cached_json(request: Request, user_id: str, etag: str, load: Callable[[], Awaitable[bytes]]) -> Response:
+    """The response for the ETag, a 304 if the client has it already. Otherwise it comes from the response cache,
+       `load` is only awaited to make the JSON when it isn't there."""
+    headers = {"ETag": etag}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    key = (str(request.url), etag)
+    body = response_cache.get(key)
+    if body is None:
+        body = await load()
+        response_cache.set(key, body, owner=user_id, size=len(body))
+
+    return Response(body, media_type="application/json", headers=headers)
+
+
+async def _json_items(request: Request) -> AsyncIterator[Any]:
+    try:
+        body = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="The body is not valid JSON.")
+    if not isinstance(body, list):
+        raise HTTPException(status_code=400, detail="Expected an array of entries.")
+
+    for item in body:
+        yield item
+
+
+async def _ndjson_items(request: Request) -> AsyncIterator[Any]:
+    """Parse the lines as they arrive instead of waiting for the whole body"""
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _parse_line(line)
+
+    if buffer.strip():
+        yield _parse_line(buffer)
+
+
+def _parse_line(line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="A line of the body is not valid JSON.")
+
+
+async def read_entries(request: Request, max_entries: int) -> List[schemas.EntryCreate]:
+    """Read the entries to import from the body, either a JSON array
+       or one entry per line if the Content-Type is application/x-ndjson"""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    items = _ndjson_items(request) if content_type in NDJSON_TYPES else _json_items(request)
+
+    entries: List[schemas.EntryCreate] = []
+    async for item in items:
+        if len(entries) >= max_entries:
+            raise HTTPException(status_code=413, detail=f"Can't import more than {max_entries} entries at once.")
+        try:
+            entries.append(schemas.EntryCreate.parse_obj(item))
+        except ValidationError as e:
+            error = e.errors()[0]
+            field = ".".join(str(loc) for loc in error["loc"])
+            raise HTTPException(status_code=400,
+                                detail=f"Entry {len(entries) + 1} is not valid, {field}: {error['msg']}")
+
+    return entries
+
+
 async def clean_db() -> None:
     """Cleans the databases of entries and journals marked as "delete" older than (by default) one week"""
     delete_after_days: int = config.delete_after
@@ -77,75 +227,118 @@ async def clean_db() -> None:
         week_ago = date.today() - timedelta(days=delete_after_days)
 
         await models.Journal.filter(deleted_on__lt=week_ago).delete()
+        # The journals that are left lose some deleted entries
+        jrnl_ids = await models.Entry.filter(deleted_on__lt=week_ago).distinct().values_list("journal_id", flat=True)
         await models.Entry.filter(deleted_on__lt=week_ago).delete()
+        await crud.touch_journals(jrnl_ids)
+        await crud.purge_search_index()
 
         await asyncio.sleep(HOUR * 2)
 
 
 async def clean_backups() -> None:
-    """Clean backups older than two weeks old"""
-    backups_dir = Path("./mnemeapi/backups")
-    backups_dir.mkdir(exist_ok=True)
-
-    two_weeks = HOUR * 24 * 7 * 2
-
+    """Remove the backups that aren't kept anymore, see `keep daily backups` in the config"""
     while True:
-        now = int(time.time())
-        for item in backups_dir.iterdir():
-            if item.suffix != ".db":
-                continue
-
-            taken = item.stem
-            try:
-                taken = int(taken)
-            except ValueError:
-                continue
+        try:
+            await archive.apply_retention(backup_storage, config.keep_daily_backups, config.keep_weekly_backups,
+                                          config.keep_monthly_backups)
+        except Exception:  # pylint: disable=broad-except
+            log.exception("Couldn't remove the old backups")
+        await asyncio.sleep(HOUR * 5)
 
-            if now - two_weeks > taken:
-                os.remove(str(item.resolve()))
 
-        await asyncio.sleep(HOUR * 5)
+async def store_backup(path: Path) -> None:
+    """Compress a backup crud made into the backup storage"""
+    await archive.store(backup_storage, path, config.backup_compression, config.backup_compression_level)
 
 
-async def auto_backup() -> None:
-    """Create a backup of the database every 24 hours"""
-    backups_dir = Path("./mnemeapi/backups")
-    backups_dir.mkdir(exist_ok=True)
+async def auto_backup(incremental: bool = False) -> None:
+    """Create a backup of the database every `backup interval` hours. If they are `incremental` only the rows that
+       changed since the last one are saved, on top of a full backup every `full backup interval` hours."""
+    snapshot: Optional[Path] = None
+    taken = 0.0
 
     while True:
-        await crud.backup()
-        await asyncio.sleep(HOUR * 24)
+        try:
+            if incremental and snapshot is not None and time.time() - taken < config.full_backup_interval * HOUR:
+                increment = await crud.backup_increment(snapshot)
+                if increment is not None:
+                    await store_backup(increment)
+            else:
+                snapshot, taken = await crud.backup(), time.time()
+                await store_backup(snapshot)
+        except Exception:  # pylint: disable=broad-except
+            # The next one starts a new chain, whatever is missing from this one
+            log.exception("Couldn't back up the database")
+            snapshot = None
+        await asyncio.sleep(config.backup_interval * HOUR)
 
 
 async def add_to_queue(user_id: str, event: str, changed_type: str, data: Optional[Dict] = None):
     """
-    Add an item to the queue to update the user
+    Send an update to every device of the user that is subscribed
         `event` is "edit", "create" or "delete"
-        `changed_type` is either "journal" or "entry"
+        `changed_type` is "journal", "entry" or "entries" for many entries at once
         `data` is the content that got updated or created
     """
-    queue = queues.get(user_id)
-    if queue is None:
-        # The user hasn't subscribe with any device
-        return
-
+    # Even if the user hasn't subscribed with any device, it's kept for the ones that reconnect
     update = {
         "event": event,
-        "data": {
+        # Turned into text here the same way the event stream would, so it can go through any event bus as it is
+        "data": str({
             "type": changed_type,
             "data": data
-        }
+        })
     }
-    await queue.put(update)
+    await event_bus.publish(user_id, update)
+    # Whatever changed, none of their cached journals and entries can be trusted
+    response_cache.invalidate(user_id)
 
 
-async def updates_generator(user_id: str, request: Request):
-    # The user certainly has a queue because it gets created when they subscribe
-    queue = queues.get(user_id)
+async def _close_on_disconnect(subscription: Subscription, request: Request) -> None:
     while True:
-        if await request.is_disconnected():
-            break
-
-        # No need sleep in the loop because await queue.get() will simply wait until there is something to get
-        update = await queue.get()
-        yield update
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            subscription.close()
+            return
+
+
+async def missed_updates(user_id: str, last_id: Optional[int]) -> List[Dict]:
+    """The updates a device that reconnects missed since `last_id`,
+    or a `reset` update if they aren't kept anymore so it fetches everything again"""
+    if last_id is None:
+        return []
+
+    missed = await event_bus.replay(user_id, last_id)
+    if missed is not None:
+        return missed
+
+    reset = {"event": "reset", "data": str({"type": "all", "data": None})}
+    # So the device doesn't get another reset when it reconnects again
+    last = await crud.get_last_outbox_id(user_id)
+    if last:
+        reset["id"] = last
+    return [reset]
+
+
+async def updates_generator(subscription: Subscription, request: Request, missed: Sequence[Dict] = ()):
+    """The updates for a device, first the ones it `missed` while it was disconnected"""
+    # Wait for the disconnect on the side, so it's noticed even if there are no updates to send
+    watcher = asyncio.ensure_future(_close_on_disconnect(subscription, request))
+    # The subscription started before looking for the missed updates, so it may have some of them too
+    replayed = max((update.get("id", 0) for update in missed), default=0)
+    try:
+        for update in missed:
+            yield update
+
+        while True:
+            # It's None once the subscription is closed, either because the device disconnected
+            # or because it couldn't keep up
+            update = await subscription.get()
+            if update is None:
+                break
+            if update.get("id", 0) > replayed:
+                yield update
+    finally:
+        watcher.cancel()
+        broker.unsubscribe(subscription)